@@ -0,0 +1,159 @@
+import math
+
+# Política por sensor: (intervalo mínimo s, intervalo máximo s, umbral(es) de cambio)
+# El intervalo mínimo nunca es menor que el periodo base del bucle. Los límites son
+# potencias de dos del periodo base para que record['rates'] los guarde exactos.
+DEFAULT_POLICIES = {
+    'wind': (1.0, 64.0, 1.0),                    # km/h
+    'temperature': (2.0, 256.0, (0.5, 2.0)),     # °C y % de humedad; el DHT11 no admite < 1 s
+    'rain': (2.0, 64.0, 0.25),                   # fracción mojada
+    'light': (1.0, 128.0, 2.0),                  # %
+}
+# Orden de los campos de 4 bits en record['rates']
+SENSORS = ('wind', 'temperature', 'rain', 'light')
+
+
+def _power_of_two(interval, base_period):
+    # Múltiplo potencia de dos del periodo base más cercano por debajo (al menos el periodo base)
+    if interval <= base_period:
+        return base_period
+    return base_period * 2 ** math.floor(math.log2(interval / base_period) + 1e-9)
+
+
+class AdaptiveRate:
+    def __init__(self, min_interval, max_interval, threshold, alpha=0.2):
+        """
+        Intervalo de muestreo adaptativo para una señal: se dobla mientras la señal
+        se mantiene dentro del umbral respecto a su media móvil (EWMA) y vuelve al
+        mínimo en cuanto cambia
+        :param min_interval: Intervalo mínimo (frecuencia máxima) en segundos
+        :param max_interval: Intervalo máximo (frecuencia mínima) en segundos
+        :param threshold: Desviación que se considera cambio (número o tupla por componente)
+        :param alpha: Peso de la última muestra en la media móvil
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.thresholds = threshold if isinstance(threshold, tuple) else (threshold,)
+        self.alpha = alpha
+        self.interval = min_interval
+        self.next_due = None
+        self.mean = None
+
+    def due(self, now):
+        return self.next_due is None or now >= self.next_due
+
+    def trigger(self, now):
+        """
+        Fuerza una muestra inmediata a frecuencia máxima (p. ej. al detectar flancos)
+        """
+        self.interval = self.min_interval
+        self.next_due = now
+
+    def update(self, now, value):
+        """
+        Registra una muestra y decide cuándo tomar la siguiente
+        :param value: Valor (o tupla de valores) medido; None/NaN no adapta el intervalo
+        """
+        values = value if isinstance(value, tuple) else (value,)
+        if any(v is None or (isinstance(v, float) and math.isnan(v)) for v in values):
+            # Sin dato válido: seguir a frecuencia máxima
+            self.interval = self.min_interval
+        elif self.mean is None:
+            self.mean = list(values)
+        else:
+            changed = False
+            for i, (v, threshold) in enumerate(zip(values, self.thresholds)):
+                if abs(v - self.mean[i]) > threshold:
+                    changed = True
+                self.mean[i] += self.alpha * (v - self.mean[i])
+            if changed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+        self.next_due = now + self.interval
+
+
+class AdaptiveSampler:
+    def __init__(self, base_period=1.0, policies=None):
+        """
+        Frecuencia de muestreo adaptativa por sensor sobre el bucle de la estación
+        :param base_period: Periodo del planificador (el intervalo más corto posible)
+        :param policies: dict sensor -> (mínimo, máximo, umbral); ver DEFAULT_POLICIES.
+                         Los límites se ajustan a potencias de dos del periodo base, las
+                         únicas que encode() representa sin pérdida
+        """
+        self.base_period = base_period
+        self.rates = {
+            name: AdaptiveRate(_power_of_two(lo, base_period), _power_of_two(hi, base_period), threshold)
+            for name, (lo, hi, threshold) in (policies or DEFAULT_POLICIES).items()
+        }
+        self.samples = {name: 0 for name in self.rates}
+        self.ticks = 0
+
+    def due(self, name, now):
+        return self.rates[name].due(now)
+
+    def trigger(self, name, now):
+        self.rates[name].trigger(now)
+
+    def update(self, name, now, value):
+        self.samples[name] += 1
+        self.rates[name].update(now, value)
+
+    def intervals(self):
+        """
+        Intervalo efectivo actual de cada sensor en segundos
+        """
+        return {name: rate.interval for name, rate in self.rates.items()}
+
+    def encode(self):
+        """
+        Empaqueta los intervalos en 16 bits (4 por sensor, log2 del múltiplo del periodo base)
+        """
+        packed = 0
+        for i, name in enumerate(SENSORS):
+            if name in self.rates:
+                code = round(math.log2(self.rates[name].interval / self.base_period))
+                packed |= min(max(code, 0), 15) << (4 * i)
+        return packed
+
+    def stats(self):
+        """
+        Muestras tomadas por sensor frente a las que se habrían tomado a frecuencia fija
+        """
+        return {'ticks': self.ticks, 'samples': dict(self.samples)}
+
+
+def decode_rates(packed, base_period=1.0):
+    """
+    Inverso de AdaptiveSampler.encode: intervalo en segundos por sensor
+    """
+    packed = int(packed)
+    return {name: base_period * 2 ** ((packed >> (4 * i)) & 0xF) for i, name in enumerate(SENSORS)}
+
+
+def main():
+    """
+    Función principal para pruebas: un día en calma con una tormenta de una hora
+    """
+    import random
+    random.seed(0)
+    sampler = AdaptiveSampler(base_period=1.0)
+    for t in range(86400):
+        storm = 14 * 3600 <= t < 15 * 3600
+        sampler.ticks += 1
+        values = {
+            'wind': random.uniform(20, 60) if storm else 0.0,
+            'temperature': (20.0 - (3 if storm else 0), 50.0 + (30 if storm else 0)),
+            'rain': 1.0 if storm else 0.0,
+            'light': 50.0 + 40 * math.sin(t / 86400 * 2 * math.pi),
+        }
+        for name, value in values.items():
+            if sampler.due(name, t):
+                sampler.update(name, t, value)
+    for name, count in sampler.stats()['samples'].items():
+        print(f"{name:<12} {count:>6} muestras ({86400 / count:.0f}x menos que a 1 Hz)")
+
+
+if __name__ == "__main__":
+    main()
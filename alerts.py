@@ -0,0 +1,448 @@
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import urllib.request
+import urllib.error
+from collections import deque
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from history import to_epoch
+
+log = logging.getLogger(__name__)
+
+# Reglas por defecto: nombre -> definición
+#   field: campo de la lectura
+#   op: 'value' (último valor), 'min', 'max', 'mean' (en la ventana),
+#       'rise' (último - mínimo de la ventana), 'drop' (máximo de la ventana - último)
+#   window: segundos de la ventana; la regla no se evalúa hasta tener una ventana completa
+#   above / below: umbrales de la condición
+#   cooldown: segundos mínimos entre dos avisos de la misma regla
+DEFAULT_RULES = {
+    'viento_sostenido': {'field': 'wind_speed', 'op': 'min', 'window': 600, 'above': 50.0,
+                         'message': "Viento por encima de {above:g} km/h durante 10 min (mín {value:.1f})"},
+    'empieza_a_llover': {'field': 'is_raining', 'op': 'value', 'above': 0.5,
+                         'message': "Empieza a llover"},
+    'subida_humedad': {'field': 'humidity', 'op': 'rise', 'window': 1800, 'above': 20.0,
+                       'message': "La humedad ha subido {value:.0f} % en 30 min"},
+}
+OPS = ('value', 'min', 'max', 'mean', 'rise', 'drop')
+DEFAULT_COOLDOWN = 600.0
+
+
+class Latest:
+    """
+    Último valor recibido
+    """
+    __slots__ = ('value', 'since')
+
+    def __init__(self):
+        self.value = None
+        self.since = None
+
+    def push(self, ts, value):
+        if self.since is None:
+            self.since = ts
+        self.value = value
+
+
+class WindowExtreme:
+    __slots__ = ('window', 'maximum', 'items', 'since')
+
+    def __init__(self, window, maximum):
+        """
+        Mínimo o máximo en una ventana deslizante con una cola monótona:
+        cada valor entra y sale una vez, O(1) amortizado por muestra
+        :param window: Segundos de la ventana
+        :param maximum: True para el máximo, False para el mínimo
+        """
+        self.window = window
+        self.maximum = maximum
+        self.items = deque()
+        self.since = None
+
+    def push(self, ts, value):
+        if self.since is None:
+            self.since = ts
+        items = self.items
+        # Los valores que el nuevo domina ya no pueden ser el extremo de ninguna ventana
+        if self.maximum:
+            while items and items[-1][1] <= value:
+                items.pop()
+        else:
+            while items and items[-1][1] >= value:
+                items.pop()
+        items.append((ts, value))
+        cutoff = ts - self.window
+        while items[0][0] <= cutoff:
+            items.popleft()
+
+    @property
+    def value(self):
+        return self.items[0][1] if self.items else None
+
+
+class WindowMean:
+    __slots__ = ('window', 'items', 'total', 'since')
+
+    def __init__(self, window):
+        """
+        Media en una ventana deslizante con suma acumulada
+        """
+        self.window = window
+        self.items = deque()
+        self.total = 0.0
+        self.since = None
+
+    def push(self, ts, value):
+        if self.since is None:
+            self.since = ts
+        self.items.append((ts, value))
+        self.total += value
+        cutoff = ts - self.window
+        while self.items[0][0] <= cutoff:
+            self.total -= self.items.popleft()[1]
+
+    @property
+    def value(self):
+        return self.total / len(self.items) if self.items else None
+
+
+class Rule:
+    def __init__(self, name, field, op='value', window=0, above=None, below=None,
+                 cooldown=DEFAULT_COOLDOWN, message=None):
+        """
+        Regla de alerta compilada. Avisa al pasar su condición de falsa a verdadera
+        (flanco), como mucho una vez cada `cooldown` segundos; si la condición se
+        cumple durante la espera, avisa al terminarla si sigue cumpliéndose.
+        """
+        if op not in OPS:
+            raise ValueError(f"Operación desconocida en la regla {name}: {op}")
+        if above is None and below is None:
+            raise ValueError(f"La regla {name} necesita 'above' o 'below'")
+        if op != 'value' and window <= 0:
+            raise ValueError(f"La regla {name} necesita una ventana")
+        self.name = name
+        self.field = field
+        self.op = op
+        self.window = window
+        self.above = above
+        self.below = below
+        self.cooldown = cooldown
+        self.message = message
+        self.operators = ()
+        self.armed = True
+        self.last_fired = None
+        self.fired = 0
+
+    def statistic(self):
+        ops = self.operators
+        if self.op == 'rise':
+            return ops[0].value - ops[1].value
+        if self.op == 'drop':
+            return ops[1].value - ops[0].value
+        return ops[0].value
+
+    def condition(self, now):
+        """
+        :return: (estadístico, se cumple) o None si aún no hay una ventana completa
+        """
+        # Sin ventana completa no se puede afirmar nada "sostenido"
+        if now - self.operators[-1].since < self.window:
+            return None
+        value = self.statistic()
+        return value, ((self.above is None or value > self.above) and
+                       (self.below is None or value < self.below))
+
+    def evaluate(self, now):
+        """
+        :return: Alerta (dict) si la regla salta en este instante, o None
+        """
+        condition = self.condition(now)
+        if condition is None:
+            return None
+        value, active = condition
+        if not active:
+            self.armed = True
+            return None
+        if not self.armed or (self.last_fired is not None and now - self.last_fired < self.cooldown):
+            return None
+        self.armed = False
+        self.last_fired = now
+        self.fired += 1
+        template = self.message or "{rule}: {field} {op} = {value:.1f}"
+        return {
+            'rule': self.name,
+            'field': self.field,
+            'value': value,
+            'timestamp': now,
+            'message': template.format(rule=self.name, field=self.field, op=self.op, value=value,
+                                       above=self.above, below=self.below),
+        }
+
+
+class AlertEngine:
+    def __init__(self, rules=None, sinks=None):
+        """
+        Motor de alertas incremental alimentado desde la ingesta de la estación.
+        Las reglas se compilan en operadores de streaming que se comparten entre
+        reglas con el mismo (campo, operación, ventana): coste O(1) por regla y tick.
+        :param rules: dict nombre -> definición; ver DEFAULT_RULES
+        :param sinks: Destinos de las alertas (objetos con send(alert))
+        """
+        self.sinks = list(sinks or [])
+        self.operators = {}
+        self.by_field = {}
+        self.rules = [self._compile(name, spec) for name, spec in (rules or DEFAULT_RULES).items()]
+        self.rules_by_field = {}
+        for rule in self.rules:
+            self.rules_by_field.setdefault(rule.field, []).append(rule)
+        self.lock = threading.Lock()
+        self.alerts = 0
+
+    def _operator(self, field, kind, window):
+        key = (field, kind, window)
+        operator = self.operators.get(key)
+        if operator is None:
+            if kind == 'value':
+                operator = Latest()
+            elif kind == 'mean':
+                operator = WindowMean(window)
+            else:
+                operator = WindowExtreme(window, kind == 'max')
+            self.operators[key] = operator
+            self.by_field.setdefault(field, []).append(operator)
+        return operator
+
+    def _compile(self, name, spec):
+        rule = Rule(name, **spec)
+        if rule.op == 'value':
+            rule.operators = (self._operator(rule.field, 'value', 0),)
+        elif rule.op == 'rise':
+            rule.operators = (self._operator(rule.field, 'value', 0),
+                              self._operator(rule.field, 'min', rule.window))
+        elif rule.op == 'drop':
+            rule.operators = (self._operator(rule.field, 'value', 0),
+                              self._operator(rule.field, 'max', rule.window))
+        else:
+            rule.operators = (self._operator(rule.field, rule.op, rule.window),)
+        return rule
+
+    def put(self, reading, rec=None):
+        """
+        Actualiza los operadores con una lectura y evalúa las reglas de los campos
+        que traen dato (un campo sin dato no cambia el estado de sus reglas)
+        """
+        now = to_epoch(reading['timestamp'])
+        fired = []
+        with self.lock:
+            for field, operators in self.by_field.items():
+                value = reading.get(field)
+                if value is None or value != value:  # None o NaN
+                    continue
+                value = float(value)
+                for operator in operators:
+                    operator.push(now, value)
+                for rule in self.rules_by_field[field]:
+                    alert = rule.evaluate(now)
+                    if alert is not None:
+                        fired.append(alert)
+            self.alerts += len(fired)
+        for alert in fired:
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    log.error("Error enviando alerta %s: %s", alert['rule'], e)
+        return fired
+
+    def warm(self, ts, columns):
+        """
+        Rellena las ventanas con datos ya vistos (p. ej. tras un reinicio) sin avisar:
+        las reglas que ya se cumplen quedan desarmadas hasta que dejen de cumplirse
+        :param ts: Instantes (epoch s)
+        :param columns: dict campo -> array de valores (NaN sin dato)
+        """
+        with self.lock:
+            for field, operators in self.by_field.items():
+                values = columns.get(field)
+                if values is None:
+                    continue
+                for t, value in zip(ts.tolist(), values.tolist()):
+                    if value == value:
+                        for operator in operators:
+                            operator.push(t, value)
+            if len(ts):
+                now = float(ts[-1])
+                for rule in self.rules:
+                    if rule.operators[-1].since is not None:
+                        condition = rule.condition(now)
+                        rule.armed = condition is None or not condition[1]
+
+    def stats(self):
+        return {'rules': len(self.rules), 'operators': len(self.operators), 'alerts': self.alerts,
+                'fired': {rule.name: rule.fired for rule in self.rules if rule.fired}}
+
+    def cleanup(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'cleanup'):
+                sink.cleanup()
+
+
+def load_rules(path):
+    """
+    Reglas desde un fichero JSON con el formato de DEFAULT_RULES
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class LogSink:
+    """
+    Alertas al log de la estación (una clave por regla para el limitador de station_log)
+    """
+    def send(self, alert):
+        log.warning("Alerta %s: %s", alert['rule'], alert['message'], extra={'key': f"alert:{alert['rule']}"})
+
+
+class WebhookSink:
+    def __init__(self, url, timeout=5.0, queue_size=100):
+        """
+        Alertas por POST JSON a un webhook, desde un hilo propio: send() no bloquea
+        y descarta la alerta si la cola está llena
+        """
+        self.url = url
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {'sent': 0, 'errors': 0, 'dropped': 0}
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _post(self, alert):
+        data = json.dumps(alert, separators=(',', ':')).encode()
+        request = urllib.request.Request(self.url, data=data, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if 200 <= response.status < 300:
+                    self.stats['sent'] += 1
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        self.stats['errors'] += 1
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            if alert is None:
+                break
+            self._post(alert)
+
+    def cleanup(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join(timeout=self.timeout + 1)
+
+
+class LcdBanner:
+    def __init__(self, duration=30.0, clock=time.monotonic):
+        """
+        Última alerta como aviso en el LCD durante `duration` segundos
+        """
+        self.duration = duration
+        self.clock = clock
+        self.text = None
+        self.until = 0.0
+
+    def send(self, alert):
+        self.text = alert['message']
+        self.until = self.clock() + self.duration
+
+    def current(self):
+        """
+        Texto del aviso vigente o None
+        """
+        if self.text is not None and self.clock() < self.until:
+            return self.text
+        return None
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Receptor local de prueba que imprime las alertas recibidas
+    """
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        alert = json.loads(self.rfile.read(length))
+        print(f"Webhook: {alert['rule']} -> {alert['message']}")
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    """
+    Función principal para pruebas: un día a 1 Hz con un temporal por la tarde,
+    con las reglas por defecto y cientos de reglas más
+    """
+    import math
+    import station_log
+    station_log.setup()
+    server = HTTPServer(('127.0.0.1', 0), _WebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webhook = WebhookSink(f"http://127.0.0.1:{server.server_port}/alertas")
+
+    rng = random.Random(0)
+    rules = dict(DEFAULT_RULES)
+    fields = ('wind_speed', 'temperature', 'humidity', 'light_level')
+    for k in range(500):
+        op = rng.choice(OPS)
+        rules[f'regla_{k}'] = {'field': rng.choice(fields), 'op': op,
+                               'window': 0 if op == 'value' else rng.choice((60, 300, 600, 1800, 3600)),
+                               'above': rng.uniform(30, 90)}
+    engine = AlertEngine(rules)
+    defaults = AlertEngine(sinks=[LogSink(), webhook, LcdBanner()])
+    print(f"{len(engine.rules)} reglas compiladas en {len(engine.operators)} operadores")
+
+    start = time.time() - 86400
+    elapsed = 0.0
+    for t in range(86400):
+        hour = t / 3600
+        storm = 15 <= hour < 16
+        reading = {
+            'timestamp': start + t,
+            'wind_speed': 60 + rng.gauss(0, 3) if storm else abs(rng.gauss(10, 3)),
+            'temperature': 18 + 6 * math.sin((hour - 9) / 24 * 2 * math.pi),
+            'humidity': 50 + 30 * min(max(hour - 14.5, 0), 1) + rng.gauss(0, 1),
+            'light_level': None if t % 97 == 0 else 50.0,
+            'is_raining': 15.5 <= hour < 17,
+        }
+        defaults.put(reading)
+        t0 = time.perf_counter()
+        engine.put(reading)
+        elapsed += time.perf_counter() - t0
+    per_tick = elapsed / 86400 * 1e6
+    print(f"{per_tick:.0f} µs por tick, {per_tick / len(engine.rules) * 1000:.0f} ns por regla")
+    print(f"Por defecto: {defaults.stats()}")
+    time.sleep(0.5)
+    webhook.cleanup()
+    server.shutdown()
+    print(f"Webhook: {webhook.stats}")
+    station_log.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+# Diferencia máxima por defecto (s) entre un punto de la rejilla y la captura que se le asigna
+TOLERANCES = {
+    'temperature': 5.0,     # el DHT11 se lee cada pocos segundos y a veces falla
+    'humidity': 5.0,
+    'wind_speed': 1.5,      # ventana de 1 s centrada medio segundo antes del tick
+    'light_level': 2.0,
+    'is_raining': 2.0,
+}
+DEFAULT_TOLERANCE = 2.0
+
+
+def asof(grid, ts, values, tolerance, direction='backward'):
+    """
+    As-of join vectorizado: para cada instante de `grid`, el valor capturado más
+    cercano según `direction` si está a `tolerance` segundos o menos (NaN si no)
+    :param ts: Instantes de captura (se ordenan si hace falta)
+    :param direction: 'backward' (última captura anterior o igual, sin mirar al futuro),
+                      'forward' (primera posterior o igual) o 'nearest'
+    """
+    grid = np.asarray(grid, float)
+    ts = np.asarray(ts, float)
+    values = np.asarray(values, float)
+    # Sin huecos (NaN) ni repeticiones de la misma captura (lecturas no renovadas)
+    keep = ~np.isnan(values)
+    if len(ts) > 1:
+        keep[1:] &= np.diff(ts) != 0
+    ts, values = ts[keep], values[keep]
+    if len(ts) > 1 and (np.diff(ts) < 0).any():
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order]
+
+    out = np.full(len(grid), np.nan)
+    n = len(ts)
+    if n == 0:
+        return out
+    if direction == 'backward':
+        best = np.searchsorted(ts, grid, 'right') - 1
+    elif direction == 'forward':
+        best = np.searchsorted(ts, grid, 'left')
+    elif direction == 'nearest':
+        after = np.searchsorted(ts, grid, 'left')
+        before = after - 1
+        after_dist = np.abs(ts[np.minimum(after, n - 1)] - grid)
+        before_dist = np.abs(grid - ts[np.maximum(before, 0)])
+        best = np.where((before < 0) | ((after < n) & (after_dist < before_dist)), after, before)
+    else:
+        raise ValueError(f"Dirección desconocida: {direction}")
+    valid = (best >= 0) & (best < n)
+    best = np.clip(best, 0, n - 1)
+    valid &= np.abs(grid - ts[best]) <= tolerance
+    out[valid] = values[best[valid]]
+    return out
+
+
+def tolerance_for(field, tolerance=None):
+    """
+    Tolerancia de un campo: número para todos, dict por campo o None (TOLERANCES)
+    """
+    if isinstance(tolerance, (int, float)):
+        return float(tolerance)
+    return (tolerance or {}).get(field, TOLERANCES.get(field, DEFAULT_TOLERANCE))
+
+
+def resample(streams, grid, tolerance=None, direction='backward'):
+    """
+    Alinea varias series con sus propios instantes de captura sobre una rejilla común
+    :param streams: dict campo -> (instantes, valores)
+    :param tolerance: Número, dict campo -> segundos o None (TOLERANCES)
+    :return: dict con 'ts' (la rejilla) y un array por campo
+    """
+    grid = np.asarray(grid, float)
+    result = {'ts': grid}
+    for field, (ts, values) in streams.items():
+        result[field] = asof(grid, ts, values, tolerance_for(field, tolerance), direction)
+    return result
+
+
+def main():
+    """
+    Función principal para pruebas: un día de viento (1 s, con retardo variable) y de
+    DHT11 (cada ~2 s, con fallos) alineados a una rejilla de 1 s
+    """
+    n = 86400
+    rng = np.random.default_rng(0)
+    wind_ts = np.arange(n) + 0.5 + rng.uniform(0, 0.05, n)
+    wind = np.abs(rng.normal(10, 3, n))
+    dht_ts = np.cumsum(rng.uniform(1.8, 2.6, n // 2))
+    temperature = 20 + 5 * np.sin(dht_ts / 13751)
+    temperature[rng.random(len(dht_ts)) < 0.05] = np.nan
+    grid = np.arange(0, n, 1.0)
+
+    t0 = time.perf_counter()
+    aligned = resample({'wind_speed': (wind_ts, wind), 'temperature': (dht_ts, temperature)}, grid)
+    elapsed = (time.perf_counter() - t0) * 1000
+    print(f"{len(wind_ts) + len(dht_ts)} capturas alineadas a {len(grid)} puntos en {elapsed:.1f} ms")
+    for field in ('wind_speed', 'temperature'):
+        print(f"  {field}: {np.isnan(aligned[field]).mean() * 100:.1f} % sin dato dentro de tolerancia")
+
+    # Referencia en Python puro para comprobar el resultado
+    t0 = time.perf_counter()
+    expected = []
+    k = -1
+    for t in grid:
+        while k + 1 < len(dht_ts) and dht_ts[k + 1] <= t:
+            k += 1
+        j = k
+        while j >= 0 and np.isnan(temperature[j]):
+            j -= 1
+        ok = j >= 0 and t - dht_ts[j] <= TOLERANCES['temperature']
+        expected.append(temperature[j] if ok else np.nan)
+    elapsed = (time.perf_counter() - t0) * 1000
+    same = np.array_equal(np.array(expected), aligned['temperature'], equal_nan=True)
+    print(f"Bucle Python: {elapsed:.0f} ms; resultados {'iguales' if same else 'DISTINTOS'}")
+
+
+if __name__ == "__main__":
+    main()
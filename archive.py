@@ -0,0 +1,302 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+import numpy as np
+
+import record
+import calibration
+from history import to_epoch
+
+log = logging.getLogger(__name__)
+
+# Esquema tipado de las particiones diarias; solo valores crudos (ver read_calibrated)
+SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('ms', tz='UTC')),
+    ('temperature_raw', pa.float32()),
+    ('humidity_raw', pa.float32()),
+    ('wind_edges', pa.float32()),
+    ('is_raining', pa.bool_()),
+    ('wetness', pa.float32()),
+    ('profile', pa.uint16()),
+    ('momento', pa.dictionary(pa.int8(), pa.string())),
+    # Parquet la codifica con diccionario en disco pero la lee como uint16
+    ('quality', pa.uint16()),
+    ('red', pa.uint16()),
+    ('green', pa.uint16()),
+    ('blue', pa.uint16()),
+    ('clear', pa.uint16()),
+    ('rates', pa.uint16()),
+])
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+_MOMENTOS = pa.array(record.MOMENTOS, pa.string())
+
+
+def to_table(records):
+    """
+    Convierte un array de registros (ver record.py) a una tabla Arrow tipada,
+    columna a columna y sin pasar por objetos Python
+    """
+    records = np.asarray(records, record.RECORD_DTYPE)
+    columns = {
+        'timestamp': pa.array(records['wall_ns'] // 1_000_000, pa.int64()).cast(SCHEMA.field('timestamp').type),
+        'is_raining': pa.array(record.is_raining(records)),
+        'wetness': pa.array(records['wetness'] / np.float32(255), pa.float32()),
+        'momento': pa.DictionaryArray.from_arrays(
+            pa.array(records['momento'].astype(np.int8)), _MOMENTOS),
+    }
+    for name in ('temperature_raw', 'humidity_raw', 'wind_edges', 'profile', 'quality',
+                 'red', 'green', 'blue', 'clear', 'rates'):
+        columns[name] = pa.array(records[name])
+    return pa.Table.from_arrays([columns[name] for name in SCHEMA.names], schema=SCHEMA)
+
+
+def write_partition(table, root, day, compression='zstd'):
+    """
+    Escribe una tabla en la partición root/date=YYYY-MM-DD de forma atómica
+    """
+    directory = os.path.join(root, f'date={day.isoformat()}')
+    os.makedirs(directory, exist_ok=True)
+    first = table['timestamp'][0].value if len(table) else 0
+    path = os.path.join(directory, f'part-{first}.parquet')
+    tmp = path + '.tmp'
+    pq.write_table(table, tmp, compression=compression,
+                   use_dictionary=['momento', 'quality'], row_group_size=3600)
+    os.replace(tmp, path)
+    return path
+
+
+def write_ipc(table, path):
+    """
+    Guarda una tabla en formato Arrow IPC sin compresión (apto para memory-map)
+    """
+    tmp = path + '.tmp'
+    with pa.OSFile(tmp, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def read_ipc(path):
+    """
+    Lee un fichero Arrow IPC mapeado en memoria: las columnas no se copian
+    """
+    # El mapa se libera cuando ya no quedan referencias a la tabla
+    return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def read_range(root, start, end, columns=None):
+    """
+    Lee [start, end) de las particiones; el filtro por fecha descarta directorios
+    y el de timestamp usa las estadísticas de los row groups
+    """
+    start, end = to_epoch(start), to_epoch(end)
+    start_day = datetime.fromtimestamp(start).date().isoformat()
+    end_day = datetime.fromtimestamp(end).date().isoformat()
+    ts_type = SCHEMA.field('timestamp').type
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING,
+                         schema=SCHEMA.append(pa.field('date', pa.string())))
+    condition = ((ds.field('date') >= start_day) &
+                 (ds.field('date') <= end_day) &
+                 (ds.field('timestamp') >= pa.scalar(int(start * 1000), ts_type)) &
+                 (ds.field('timestamp') < pa.scalar(int(end * 1000), ts_type)))
+    table = dataset.to_table(columns=columns, filter=condition)
+    if columns is None or 'timestamp' in columns:
+        table = table.take(pc.sort_indices(table['timestamp']))
+    return table
+
+
+_calibrated = OrderedDict()
+_calibrated_lock = threading.Lock()
+CALIBRATED_CACHE = 32
+
+
+def read_calibrated(root, start, end, columns=None, profile=None):
+    """
+    Como read_range, añadiendo las columnas calibradas (temperature, humidity,
+    wind_speed, light_level) con el perfil indicado (None = el activo). Cachea por
+    rango y versión mientras no cambien los ficheros de las particiones.
+    """
+    profile = calibration.get(profile)
+    start, end = to_epoch(start), to_epoch(end)
+    files = tuple(sorted((entry.path, entry.stat().st_mtime_ns)
+                         for day in os.scandir(root) if day.is_dir()
+                         for entry in os.scandir(day.path) if entry.name.endswith('.parquet')))
+    key = (root, start, end, tuple(columns) if columns else None, profile.version, files)
+    with _calibrated_lock:
+        table = _calibrated.get(key)
+        if table is not None:
+            _calibrated.move_to_end(key)
+            return table
+    raw = [calibration.RAW_FIELDS[field] for field in columns or () if field in calibration.RAW_FIELDS]
+    # 'quality' hace falta para anular los campos sin dato válido, aunque no se pida
+    read = None if columns is None else list(dict.fromkeys(
+        [c for c in columns if c not in calibration.RAW_FIELDS] + raw + ['quality']))
+    table = read_range(root, start, end, read)
+    present = {name: table[name].to_numpy(zero_copy_only=False) for name in calibration.RAW_FIELDS.values()
+               if name in table.column_names}
+    # Igual que record.calibrated: NaN donde la calidad es MISSING, RANGE o BACKOFF
+    invalid = record.invalid({'quality': table['quality'].to_numpy(zero_copy_only=False)})
+    for field, values in profile.calibrate(present).items():
+        if columns is None or field in columns:
+            values = np.where(invalid[field], np.nan, values).astype(np.float32)
+            table = table.append_column(field, pa.array(values))
+    if columns is not None and 'quality' not in columns:
+        table = table.drop(['quality'])
+    with _calibrated_lock:
+        _calibrated[key] = table
+        while len(_calibrated) > CALIBRATED_CACHE:
+            _calibrated.popitem(last=False)
+    return table
+
+
+def compact_partition(root, day, compression='zstd'):
+    """
+    Une las partes de una partición diaria en un único fichero Parquet
+    :return: Tabla del día completo (None si no hay partes)
+    """
+    directory = os.path.join(root, f'date={day.isoformat()}')
+    parts = sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith('.parquet'))
+    if not parts:
+        return None
+    # ParquetFile no añade la columna de partición (date) que deduciría read_table
+    table = pa.concat_tables([pq.ParquetFile(path).read() for path in parts], promote_options='permissive')
+    columns = []
+    for field in SCHEMA:
+        column = table[field.name]
+        if pa.types.is_dictionary(field.type) and not pa.types.is_dictionary(column.type):
+            # Parquet solo conserva como diccionario las columnas de texto
+            column = column.dictionary_encode()
+        columns.append(column.cast(field.type))
+    table = pa.Table.from_arrays(columns, schema=SCHEMA)
+    table = table.take(pc.sort_indices(table['timestamp']))
+    if len(parts) > 1:
+        # La parte unida sustituye a la primera (mismo nombre) y después se borran las demás
+        path = write_partition(table, root, day, compression)
+        for part in parts:
+            if part != path:
+                os.remove(part)
+    return table
+
+
+class DailyArchiver:
+    def __init__(self, root='history', ipc_root=None, flush_interval=3600, flush_rows=3600):
+        """
+        Acumula las lecturas del día y las escribe en segundo plano como partes de la
+        partición Parquet cada `flush_interval` segundos o `flush_rows` lecturas, de modo
+        que un corte de luz pierde como mucho una parte; al cambiar de día se unen
+        :param root: Directorio raíz de las particiones Parquet
+        :param ipc_root: Si se indica, también se guarda cada día en Arrow IPC
+        :param flush_interval: Segundos de datos máximos sin escribir
+        :param flush_rows: Lecturas máximas sin escribir
+        """
+        self.root = root
+        self.ipc_root = ipc_root
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.day = None
+        self.rows = []
+        self.lock = threading.Lock()
+        self.writers = []
+
+    def put(self, reading, rec=None):
+        if rec is None:
+            rec = record.from_reading(reading)
+        wall_ns = int(rec['wall_ns'])
+        day = datetime.fromtimestamp(wall_ns / 1e9).date()
+        with self.lock:
+            if self.day is not None and day != self.day:
+                self._flush(self.day, compact=True)
+            elif self.rows and (len(self.rows) >= self.flush_rows or
+                                wall_ns - int(self.rows[0]['wall_ns']) >= self.flush_interval * 1_000_000_000):
+                self._flush(self.day)
+            self.day = day
+            self.rows.append(rec)
+
+    def _flush(self, day, compact=False):
+        if day is None or (not self.rows and not compact):
+            return
+        # Las escrituras de un día se serializan: la unión espera a las partes pendientes
+        previous = [w for w in self.writers if w.is_alive()]
+        writer = threading.Thread(target=self._write, args=(day, self.rows, compact, previous))
+        writer.daemon = True
+        writer.start()
+        self.writers = previous + [writer]
+        self.rows = []
+
+    def _write(self, day, rows, compact, previous):
+        for writer in previous:
+            writer.join()
+        try:
+            if rows:
+                path = write_partition(to_table(rows), self.root, day)
+                log.debug("Parte del %s guardada en %s (%d filas)", day, path, len(rows))
+            if compact:
+                table = compact_partition(self.root, day)
+                if table is not None and self.ipc_root:
+                    os.makedirs(self.ipc_root, exist_ok=True)
+                    write_ipc(table, os.path.join(self.ipc_root, f'{day.isoformat()}.arrow'))
+                log.info("Histórico del %s guardado en %s", day, self.root)
+        except Exception as e:
+            log.error("Error guardando histórico del %s: %s", day, e)
+
+    def cleanup(self):
+        """
+        Guarda el día en curso como parte; se une con el resto al terminar el día
+        """
+        with self.lock:
+            self._flush(self.day)
+        for writer in self.writers:
+            writer.join(timeout=30)
+
+
+def main():
+    """
+    Función principal para pruebas con tres días de datos simulados
+    """
+    import tempfile
+    root = tempfile.mkdtemp(prefix='historico_')
+    archiver = DailyArchiver(os.path.join(root, 'parquet'), ipc_root=os.path.join(root, 'ipc'))
+    start = datetime.combine(date.today() - timedelta(days=3), datetime.min.time())
+    # Anemómetro sin dato durante diez minutos del segundo día
+    missing = record.MISSING << (record.QUALITY_BITS * record.QUALITY_FIELDS.index('wind_speed'))
+    gap = range(86400 + 15 * 3600, 86400 + 15 * 3600 + 600)
+    for k in range(3 * 86400):
+        archiver.put({
+            'timestamp': (start + timedelta(seconds=k)).timestamp(),
+            'temperature': 20.0,
+            'humidity': 50,
+            'wind_speed': k % 40,
+            'is_raining': False,
+            'light_level': 50.0,
+            'momento': 'Luz: Media',
+            'quality': missing if k in gap else 0,
+        })
+    archiver.cleanup()
+    parts = sorted(os.listdir(os.path.join(root, 'parquet')))
+    last = os.listdir(os.path.join(root, 'parquet', parts[-1]))
+    print(f"{len(parts)} particiones; el día en curso en {len(last)} partes horarias")
+
+    for _ in range(2):
+        t0 = time.perf_counter()
+        table = read_calibrated(os.path.join(root, 'parquet'), start + timedelta(days=1, hours=14),
+                                start + timedelta(days=1, hours=16), columns=['timestamp', 'wind_speed'])
+        print(f"{len(table)} filas en {(time.perf_counter() - t0) * 1000:.1f} ms, "
+              f"viento máx {pc.max(table['wind_speed'])}")
+    nan = int(np.isnan(table['wind_speed'].to_numpy()).sum())
+    print(f"Viento sin dato: {nan} filas a NaN, {'correcto' if nan == len(gap) else 'INCORRECTO'}")
+    day = read_ipc(os.path.join(root, 'ipc', f'{(start + timedelta(days=1)).date()}.arrow'))
+    print(f"IPC: {len(day)} filas mapeadas desde disco")
+
+
+if __name__ == "__main__":
+    main()
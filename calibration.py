@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import threading
+
+import numpy as np
+
+# Campo calibrado -> campo crudo que se guarda en registros, histórico y archivo
+RAW_FIELDS = {
+    'temperature': 'temperature_raw',   # °C del DHT11 sin corregir
+    'humidity': 'humidity_raw',         # % del DHT11 sin corregir
+    'wind_speed': 'wind_edges',         # flancos por segundo del anemómetro
+    'light_level': 'clear',             # cuentas del canal clear del TCS34725
+}
+
+
+class Profile:
+    def __init__(self, version=1, temp_offset=-2.0, humidity_offset=0.0, light_full_scale=65535.0,
+                 radius_m=0.09, edges_per_rev=6, min_wind_kmh=1.0, note=''):
+        """
+        Perfil de calibración: transforma valores crudos en magnitudes físicas.
+        Todas las transformaciones son monótonas y, salvo los recortes, afines.
+        :param version: Versión del perfil (los perfiles no se modifican; se crea otro)
+        :param temp_offset: Corrección de temperatura del DHT11 en °C
+        :param humidity_offset: Corrección de humedad en %
+        :param light_full_scale: Cuentas del canal clear que equivalen al 100 %
+        :param radius_m: Radio de las copas del anemómetro en metros
+        :param edges_per_rev: Cambios del pin por vuelta (2 cambios × 3 copas)
+        :param min_wind_kmh: Velocidad por debajo de la cual se considera calma
+        :param note: Motivo del cambio
+        """
+        self.version = version
+        self.temp_offset = temp_offset
+        self.humidity_offset = humidity_offset
+        self.light_full_scale = light_full_scale
+        self.radius_m = radius_m
+        self.edges_per_rev = edges_per_rev
+        self.min_wind_kmh = min_wind_kmh
+        self.note = note
+
+    @property
+    def wind_gain(self):
+        """
+        km/h por flanco por segundo: ω = θ / t, v = ω × r
+        """
+        return 2 * math.pi * self.radius_m / self.edges_per_rev * 3.6
+
+    def apply(self, field, raw):
+        """
+        Valores calibrados de un campo a partir de sus valores crudos (escalar o array)
+        """
+        raw = np.asarray(raw, float)
+        if field == 'temperature':
+            return raw + self.temp_offset
+        if field == 'humidity':
+            return raw + self.humidity_offset
+        if field == 'light_level':
+            return np.minimum(raw / self.light_full_scale * 100, 100.0)
+        if field == 'wind_speed':
+            speed = raw * self.wind_gain
+            return np.where(speed < self.min_wind_kmh, 0.0, speed)
+        raise KeyError(field)
+
+    def invert(self, field, value):
+        """
+        Valor crudo que produce `value` (para lecturas que solo traen el valor calibrado)
+        """
+        value = np.asarray(value, float)
+        if field == 'temperature':
+            return value - self.temp_offset
+        if field == 'humidity':
+            return value - self.humidity_offset
+        if field == 'light_level':
+            return value / 100 * self.light_full_scale
+        if field == 'wind_speed':
+            return value / self.wind_gain
+        raise KeyError(field)
+
+    def calibrate(self, columns):
+        """
+        Aplica el perfil a columnas crudas (dict nombre crudo -> array)
+        :return: dict campo calibrado -> array, para los campos presentes
+        """
+        return {field: self.apply(field, columns[raw]) for field, raw in RAW_FIELDS.items()
+                if raw in columns}
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def derive(self, version, note='', **changes):
+        """
+        Nuevo perfil con los cambios indicados
+        """
+        params = self.to_dict()
+        params.update(changes, version=version, note=note)
+        return Profile(**params)
+
+
+class Profiles:
+    def __init__(self, path=None, data=None):
+        """
+        Registro versionado de perfiles de calibración, guardado en JSON.
+        Recalibrar es añadir una versión: los datos crudos no se reescriben.
+        :param path: Fichero JSON (None = solo en memoria, con el perfil por defecto)
+        :param data: Registro ya leído (ver to_dict), p. ej. de la cabecera de una traza
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.versions = {1: Profile()}
+        self.active_version = 1
+        if data is None and path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+        if data is not None:
+            self.versions = {p['version']: Profile(**p) for p in data['profiles']}
+            self.active_version = data['active']
+
+    def active(self):
+        return self.versions[self.active_version]
+
+    def get(self, version=None):
+        return self.active() if version is None else self.versions[version]
+
+    def add(self, note='', **changes):
+        """
+        Crea y activa una versión nueva a partir de la activa
+        """
+        with self.lock:
+            profile = self.active().derive(max(self.versions) + 1, note, **changes)
+            self.versions[profile.version] = profile
+            self.active_version = profile.version
+            self._save()
+        return profile
+
+    def activate(self, version):
+        with self.lock:
+            self.versions[version]  # KeyError si no existe
+            self.active_version = version
+            self._save()
+
+    def to_dict(self):
+        return {'active': self.active_version,
+                'profiles': [p.to_dict() for _, p in sorted(self.versions.items())]}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, self.path)
+
+
+_profiles = Profiles()
+
+
+def load(path):
+    """
+    Usa el registro de perfiles guardado en `path` (se crea al añadir versiones)
+    """
+    global _profiles
+    _profiles = Profiles(path)
+    return _profiles
+
+
+def use(registry):
+    """
+    Usa un registro ya construido (p. ej. el grabado en una traza) en vez del fichero
+    """
+    global _profiles
+    _profiles = registry
+    return _profiles
+
+
+def profiles():
+    return _profiles
+
+
+def active():
+    """
+    Perfil activo: el que se usa al leer si no se pide otra versión
+    """
+    return _profiles.active()
+
+
+def get(profile=None):
+    """
+    Perfil a partir de un Profile, un número de versión o None (el activo)
+    """
+    if isinstance(profile, Profile):
+        return profile
+    return _profiles.get(profile)
+
+
+def raw_value(reading, field, profile=None):
+    """
+    Valor crudo de un campo de una lectura; si solo trae el calibrado, lo invierte
+    """
+    value = reading.get(RAW_FIELDS[field])
+    if value is not None:
+        return value
+    value = reading.get(field)
+    if value is None:
+        return None
+    return float(get(profile).invert(field, value))
+
+
+def main():
+    """
+    Función principal para pruebas: recalibrar un año de datos crudos
+    """
+    import time
+    n = 365 * 86400
+    rng = np.random.default_rng(0)
+    raw = {'temperature_raw': rng.normal(22, 5, n).astype(np.float32),
+           'wind_edges': rng.poisson(40, n).astype(np.float32)}
+    registry = Profiles()
+    v1 = registry.active()
+    v2 = registry.add(note='Nuevo radio de copas', radius_m=0.1, temp_offset=-1.5)
+    for profile in (v1, v2):
+        t0 = time.perf_counter()
+        values = profile.calibrate(raw)
+        elapsed = time.perf_counter() - t0
+        print(f"v{profile.version}: {n / 1e6:.1f} M filas en {elapsed * 1000:.0f} ms, "
+              f"temperatura media {values['temperature'].mean():.2f} °C, "
+              f"viento medio {values['wind_speed'].mean():.2f} km/h")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import calibration
+from history import to_epoch
+
+# Método por defecto por serie: min/max conserva siempre los picos (rachas)
+METHODS = {'wind_speed': 'minmax'}
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: `n_out` puntos que conservan la forma de la serie.
+    Cubos de igual número de puntos; en cada uno se elige el punto que forma el
+    triángulo de mayor área con el elegido antes y la media del cubo siguiente.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    # n_out - 2 cubos en [1, n - 1); primer y último punto fijos
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(bounds)
+    avg_x = np.add.reduceat(x[:n - 1], bounds[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], bounds[:-1]) / counts
+
+    selected = np.empty(n_out, np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = bounds[k], bounds[k + 1]
+        if k + 1 < n_out - 2:
+            cx, cy = avg_x[k + 1], avg_y[k + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[k + 1] = a
+    return x[selected], y[selected]
+
+
+def minmax(x, y, n_out):
+    """
+    Mínimo y máximo de cada columna de tiempo (n_out / 2 columnas), en orden temporal.
+    Los extremos de la serie sobreviven siempre.
+    """
+    n = len(x)
+    if n <= n_out:
+        return x, y
+    edges = np.linspace(x[0], x[-1], max(n_out // 2, 1) + 1)
+    # Inicio de cada columna no vacía
+    starts = np.unique(np.searchsorted(x, edges[:-1]))
+    sizes = np.diff(np.append(starts, n))
+    bucket = np.repeat(np.arange(len(starts)), sizes)
+    positions = np.arange(n)
+    y_max = np.maximum.reduceat(y, starts)
+    y_min = np.minimum.reduceat(y, starts)
+    # Primera posición de cada columna que alcanza su máximo / mínimo
+    i_max = np.minimum.reduceat(np.where(y == y_max[bucket], positions, n), starts)
+    i_min = np.minimum.reduceat(np.where(y == y_min[bucket], positions, n), starts)
+    index = np.unique(np.concatenate([i_min, i_max]))
+    return x[index], y[index]
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """
+    Reduce una serie a como mucho `n_out` puntos; los huecos (NaN) se omiten
+    :param method: 'lttb' o 'minmax'
+    """
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    if method == 'lttb':
+        return lttb(x, y, n_out)
+    if method == 'minmax':
+        return minmax(x, y, n_out)
+    raise ValueError(f"Método desconocido: {method}")
+
+
+class ChartData:
+    def __init__(self, history, cache_size=64, long_history=None):
+        """
+        Series para gráficas con un número fijo de puntos (uno por píxel), calculadas
+        sobre el histórico y cacheadas por (serie, rango, ancho, método, versión de calibración)
+        :param history: History de la estación
+        :param cache_size: Series cacheadas como máximo (LRU)
+        :param long_history: gorilla.CompressedHistory para los rangos que empiezan
+                             antes de lo que conserva `history`
+        """
+        self.history = history
+        self.long_history = long_history
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _fresh(cached_ts, end, last_ts):
+        # Válida si no ha llegado nada nuevo o el rango ya estaba cerrado al calcularla
+        if cached_ts == last_ts:
+            return True
+        return cached_ts is not None and end <= cached_ts
+
+    def _source(self, start):
+        # El histórico crudo si cubre el inicio del rango; si no, el comprimido
+        if self.long_history is None:
+            return self.history
+        span = self.history.span()
+        if span is not None and start >= span[0]:
+            return self.history
+        return self.long_history
+
+    def series(self, field, start, end, width, method=None, profile=None):
+        """
+        :param width: Presupuesto de puntos (ancho de la gráfica en píxeles)
+        :param profile: Perfil de calibración (Profile, versión o None = el activo)
+        :return: (timestamps, valores)
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        method = method or METHODS.get(field, 'lttb')
+        profile = calibration.get(profile)
+        source = self._source(start)
+        key = (field, start, end, width, method, profile.version, source is self.history)
+        last_ts = source.last_ts
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and self._fresh(cached[0], end, last_ts):
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        data = source.slice(start, end, fields=(field,), profile=profile)
+        result = downsample(data['ts'], data[field], width, method)
+        with self.lock:
+            self.cache[key] = (last_ts, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+
+def main():
+    """
+    Función principal para pruebas: un mes a 1 Hz con una racha aislada
+    """
+    from history import History
+    n = 30 * 86400
+    rng = np.random.default_rng(0)
+    x = np.arange(n, dtype=float)
+    wind = np.abs(rng.normal(10, 3, n))
+    wind[1_234_567] = 95.0  # racha de un segundo
+    width = 1000
+    for method in ('lttb', 'minmax'):
+        t0 = time.perf_counter()
+        xs, ys = downsample(x, wind, width, method)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"{method:<7} {n} -> {len(xs)} puntos en {elapsed:.0f} ms, máx {ys.max():.1f} km/h "
+              f"(real {wind.max():.1f})")
+
+    history = History()
+    start = time.time() - 86400
+    for k in range(86400):
+        history.put({'timestamp': start + k, 'wind_speed': float(wind[k]), 'temperature': 20.0})
+    charts = ChartData(history)
+    for _ in range(2):
+        t0 = time.perf_counter()
+        xs, ys = charts.series('wind_speed', start, start + 86400, width)
+        print(f"ChartData: {len(xs)} puntos en {(time.perf_counter() - t0) * 1000:.2f} ms "
+              f"(aciertos de caché {charts.hits})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import os
+import sys
+import time
+import zlib
+import queue
+import logging
+import itertools
+import threading
+import urllib.error
+import urllib.request
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from history import History
+from uplink import decode_batch, encode_batch, CONTENT_TYPE
+import record
+import calibration
+
+log = logging.getLogger(__name__)
+
+
+def shard_for(station_id, n_shards):
+    """
+    Shard estable (no depende de PYTHONHASHSEED) para una estación
+    """
+    return zlib.crc32(str(station_id).encode()) % n_shards
+
+
+def _worker(inbox, outbox, retention):
+    """
+    Proceso de ingesta: mantiene el histórico y la última lectura de sus estaciones.
+    Un mensaje erróneo no detiene el proceso: los lotes inválidos se cuentan como
+    rechazados y las consultas responden con el error
+    """
+    stations = {}
+    latest = {}
+    ingested = 0
+    rejected = 0
+    while True:
+        message = inbox.get()
+        kind = message[0]
+        if kind == 'stop':
+            break
+        try:
+            if kind in ('ingest', 'records'):
+                if kind == 'ingest':
+                    batch = decode_batch(message[1])
+                    station, records = batch['station_id'], batch['records']
+                    # Enrutado por la cabecera: un lote de otra estación iría al proceso equivocado
+                    if str(station) != message[2]:
+                        raise ValueError(f"Lote de {station} enviado como {message[2]}")
+                else:
+                    station, records = message[1], message[2]
+                history = stations.get(station)
+                if history is None:
+                    history = stations[station] = History(retention=retention)
+                history.extend(records)
+                if len(records):
+                    latest[station] = record.to_reading(records[-1])
+                ingested += len(records)
+            elif kind == 'query':
+                _, query_id, start, end, field, agg = message
+                values = {}
+                for station, history in stations.items():
+                    result = history.query(start, end, fields=(field,), aggs=(agg,))
+                    value = result[field][agg][0]
+                    if not np.isnan(value):
+                        values[station] = float(value)
+                outbox.put((query_id, values, None))
+            elif kind == 'latest':
+                outbox.put((message[1], dict(latest), None))
+            elif kind == 'sync':
+                outbox.put((message[1], {'stations': len(stations), 'ingested': ingested,
+                                         'rejected': rejected}, None))
+        except Exception as e:
+            if kind in ('ingest', 'records'):
+                rejected += 1
+                log.warning("Lote rechazado: %s", e)
+            else:
+                outbox.put((message[1], None, f"{type(e).__name__}: {e}"))
+
+
+class Collector:
+    def __init__(self, workers=None, retention=86400, queue_size=1000, timeout=30.0):
+        """
+        Ingesta de varias estaciones repartida por estación en un pool de procesos
+        :param workers: Número de procesos (por defecto, uno por núcleo)
+        :param retention: Segundos de histórico crudo por estación
+        :param queue_size: Lotes pendientes máximos por proceso
+        :param timeout: Segundos máximos de espera de una consulta a los procesos
+        """
+        self.workers = workers or os.cpu_count()
+        self.outbox = mp.Queue()
+        self.inboxes = [mp.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self.processes = [
+            mp.Process(target=_worker, args=(inbox, self.outbox, retention), daemon=True)
+            for inbox in self.inboxes
+        ]
+        for process in self.processes:
+            process.start()
+        self.timeout = timeout
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def ingest(self, station_id, data):
+        """
+        Envía un lote comprimido (ver uplink.encode_batch) al proceso de su estación
+        sin decodificarlo en este proceso; el proceso rechaza el lote si no es válido
+        o es de otra estación
+        """
+        self.inboxes[shard_for(station_id, self.workers)].put(('ingest', data, str(station_id)))
+
+    def ingest_records(self, station_id, records):
+        """
+        Envía registros ya decodificados (array de RECORD_DTYPE) al proceso de su estación
+        """
+        self.inboxes[shard_for(station_id, self.workers)].put(('records', station_id, records))
+
+    def _ask(self, message):
+        # Pregunta a todos los procesos y espera una respuesta de cada uno; falla si
+        # un proceso ha muerto o no responde a tiempo en vez de esperar para siempre
+        with self.lock:
+            query_id = next(self.ids)
+            for inbox in self.inboxes:
+                inbox.put((message[0], query_id) + message[1:], timeout=self.timeout)
+            deadline = time.monotonic() + self.timeout
+            replies = []
+            while len(replies) < self.workers:
+                try:
+                    reply_id, payload, error = self.outbox.get(timeout=0.5)
+                except queue.Empty:
+                    dead = [p.pid for p in self.processes if not p.is_alive()]
+                    if dead:
+                        raise RuntimeError(f"Procesos de ingesta caídos: {dead}")
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Sin respuesta a '{message[0]}' en {self.timeout} s")
+                    continue
+                if reply_id != query_id:
+                    # Respuesta tardía de una consulta anterior que expiró
+                    continue
+                if error is not None:
+                    raise RuntimeError(f"Error en el proceso de ingesta: {error}")
+                replies.append(payload)
+        return replies
+
+    def query(self, start, end, field='wind_speed', agg='max'):
+        """
+        Agregado por estación en [start, end) para toda la flota
+        :return: {station_id: valor}
+        """
+        values = {}
+        for reply in self._ask(('query', start, end, field, agg)):
+            values.update(reply)
+        return values
+
+    def fleet_max(self, field, start, end):
+        """
+        Máximo de un campo en toda la flota, p. ej. la racha máxima de la última hora
+        :return: (station_id, valor) o None si no hay datos
+        """
+        values = self.query(start, end, field, 'max')
+        if not values:
+            return None
+        station = max(values, key=values.get)
+        return station, values[station]
+
+    def latest(self):
+        """
+        Última lectura recibida de cada estación
+        """
+        latest = {}
+        for reply in self._ask(('latest',)):
+            latest.update(reply)
+        return latest
+
+    def sync(self):
+        """
+        Espera a que se procesen los lotes encolados; devuelve estadísticas
+        """
+        replies = self._ask(('sync',))
+        return {key: sum(reply[key] for reply in replies) for key in ('stations', 'ingested', 'rejected')}
+
+    def cleanup(self):
+        for inbox in self.inboxes:
+            inbox.put(('stop',))
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        # Se enruta por la cabecera X-Station-Id sin decodificar el lote: los bytes
+        # comprimidos van al proceso de su estación, que valida y rechaza los lotes malos
+        station_id = self.headers.get('X-Station-Id')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        if not station_id or length <= 0:
+            self.send_error(400, "Falta X-Station-Id o el lote está vacío")
+            return
+        self.server.collector.ingest(station_id, self.rfile.read(length))
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CollectorServer:
+    def __init__(self, port=8000, host='0.0.0.0', **kwargs):
+        """
+        Servidor HTTP que recibe los lotes de uplink.Uplink (POST /ingest)
+        """
+        self.collector = Collector(**kwargs)
+        self.server = ThreadingHTTPServer((host, port), _IngestHandler)
+        self.server.daemon_threads = True
+        self.server.collector = self.collector
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cleanup(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.collector.cleanup()
+
+
+def generate_batches(n_stations, batch_size, start):
+    """
+    Genera un lote comprimido por estación con registros simulados
+    """
+    rng = np.random.default_rng(0)
+    for s in range(n_stations):
+        station = f'estacion-{s:05d}'
+        records = np.zeros(batch_size, record.RECORD_DTYPE)
+        records['wall_ns'] = (start + np.arange(batch_size)) * 1_000_000_000
+        # Valores crudos, como los envía la estación
+        records['temperature_raw'] = 22.0
+        records['humidity_raw'] = 50.0
+        records['wind_edges'] = calibration.active().invert(
+            'wind_speed', np.abs(rng.normal(10, 5, batch_size)).round(1))
+        records['clear'] = 32768
+        records['profile'] = calibration.active().version
+        yield station, encode_batch(station, records)
+
+
+def main():
+    """
+    Generador de carga: simula miles de estaciones y mide la ingesta por número de procesos
+    Uso: python collector.py [estaciones] [lecturas_por_lote]
+    """
+    n_stations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    start = int(time.time()) - batch_size
+    batches = list(generate_batches(n_stations, batch_size, start))
+    total = n_stations * batch_size
+    print(f"{n_stations} estaciones, {total} lecturas")
+
+    baseline = None
+    workers = 1
+    while workers <= os.cpu_count():
+        collector = Collector(workers=workers)
+        collector.sync()
+        t0 = time.perf_counter()
+        for station, data in batches:
+            collector.ingest(station, data)
+        stats = collector.sync()
+        elapsed = time.perf_counter() - t0
+        rate = stats['ingested'] / elapsed
+        baseline = baseline or rate
+        gust = collector.fleet_max('wind_speed', start, start + batch_size)
+        print(f"{workers:>2} procesos: {rate:>10.0f} lecturas/s (x{rate / baseline:.1f}), "
+              f"racha máx {gust[1]:.1f} km/h en {gust[0]}")
+        collector.cleanup()
+        workers *= 2
+
+    # Lo mismo a través del servidor HTTP, con varios clientes concurrentes
+    server = CollectorServer(port=0, host='127.0.0.1')
+    url = f'http://127.0.0.1:{server.server.server_address[1]}/ingest'
+
+    def post(item):
+        station, data = item
+        headers = {'Content-Type': CONTENT_TYPE}
+        if station is not None:
+            headers['X-Station-Id'] = station
+        request = urllib.request.Request(url, data=data, method='POST', headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    server.collector.sync()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(post, batches))
+    stats = server.collector.sync()
+    elapsed = time.perf_counter() - t0
+    print(f"HTTP, {server.collector.workers} procesos: {stats['ingested'] / elapsed:>10.0f} lecturas/s "
+          f"({len(batches) / elapsed:.0f} lotes/s, respuestas {sorted(set(statuses))})")
+    # Sin cabecera: 400; lote dañado o de otra estación: aceptado y rechazado en el proceso
+    statuses = [post((None, batches[0][1])), post(('estacion-x', b'basura')), post(('estacion-x', batches[0][1]))]
+    stats = server.collector.sync()
+    ok = statuses == [400, 202, 202] and stats['rejected'] == 2
+    print(f"Lotes erróneos: respuestas {statuses}, {stats['rejected']} rechazados, "
+          f"{'correcto' if ok else 'INCORRECTO'}")
+    server.cleanup()
+
+
+if __name__ == "__main__":
+    main()
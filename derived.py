@@ -0,0 +1,185 @@
+import time
+
+import numpy as np
+
+# Constantes de Magnus (Alduchov y Eskridge)
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12
+# Temperatura base para grados-día (°C)
+DEGREE_DAY_BASE = 18.0
+
+
+def _array(values):
+    array = np.asarray(values)
+    if array.dtype == object:
+        # None (sensor sin lectura) se trata como NaN
+        array = np.where(np.equal(array, None), np.nan, array)
+    return array.astype(np.float64, copy=False)
+
+
+def dew_point(temperature, humidity):
+    """
+    Punto de rocío (°C) con la fórmula de Magnus
+    """
+    t, rh = _array(temperature), _array(humidity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(np.where(rh > 0, rh, np.nan) / 100.0) + MAGNUS_A * t / (MAGNUS_B + t)
+        return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+def heat_index(temperature, humidity):
+    """
+    Índice de calor (°C) con la regresión de Rothfusz y los ajustes de la NOAA;
+    por debajo de 80 °F (26.7 °C) devuelve la temperatura
+    """
+    t, rh = _array(temperature), _array(humidity)
+    f = t * 1.8 + 32.0
+    simple = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * f + 10.14333127 * rh - 0.22475541 * f * rh
+            - 6.83783e-3 * f * f - 5.481717e-2 * rh * rh + 1.22874e-3 * f * f * rh
+            + 8.5282e-4 * f * rh * rh - 1.99e-6 * f * f * rh * rh)
+    with np.errstate(invalid='ignore'):
+        dry = (rh < 13) & (f >= 80) & (f <= 112)
+        full = full - np.where(dry, (13 - rh) / 4 * np.sqrt(np.abs(17 - np.abs(f - 95)) / 17), 0.0)
+        humid = (rh > 85) & (f >= 80) & (f <= 87)
+        full = full + np.where(humid, (rh - 85) / 10 * (87 - f) / 5, 0.0)
+        hi = np.where(f < 80, f, np.where((simple + f) / 2 >= 80, full, simple))
+    return (hi - 32.0) / 1.8
+
+
+def wind_chill(temperature, wind_speed):
+    """
+    Sensación térmica por viento (°C), fórmula de Environment Canada con viento en km/h;
+    fuera de su rango de validez (T > 10 °C o V < 4.8 km/h) devuelve la temperatura
+    """
+    t, v = _array(temperature), _array(wind_speed)
+    with np.errstate(invalid='ignore'):
+        v16 = np.power(np.maximum(v, 0.0), 0.16)
+        wc = 13.12 + 0.6215 * t - 11.37 * v16 + 0.3965 * t * v16
+        return np.where((t <= 10.0) & (v >= 4.8), wc, t)
+
+
+def apparent_temperature(temperature, humidity, wind_speed):
+    """
+    Temperatura aparente (°C) de Steadman/BoM sin radiación; viento en km/h
+    """
+    t, rh, v = _array(temperature), _array(humidity), _array(wind_speed)
+    vapour = rh / 100.0 * 6.105 * np.exp(17.27 * t / (237.7 + t))
+    return t + 0.33 * vapour - 0.70 * (v / 3.6) - 4.00
+
+
+def derive_arrays(temperature, humidity, wind_speed):
+    """
+    Calcula todas las magnitudes derivadas sobre arrays (o escalares)
+    """
+    return {
+        'dew_point': dew_point(temperature, humidity),
+        'heat_index': heat_index(temperature, humidity),
+        'wind_chill': wind_chill(temperature, wind_speed),
+        'apparent_temperature': apparent_temperature(temperature, humidity, wind_speed),
+    }
+
+
+def derive(reading):
+    """
+    Magnitudes derivadas de una lectura; usa las mismas funciones que el cálculo masivo,
+    por lo que los resultados son idénticos
+    """
+    values = derive_arrays(
+        [reading.get('temperature')], [reading.get('humidity')], [reading.get('wind_speed')])
+    return {name: float(value[0]) for name, value in values.items()}
+
+
+def day_index(ts, utc_offset=None):
+    """
+    Día local (días desde epoch) de cada timestamp
+    """
+    if utc_offset is None:
+        utc_offset = time.localtime().tm_gmtoff
+    return np.floor_divide(_array(ts) + utc_offset, 86400).astype(np.int64)
+
+
+def degree_days(ts, temperature, base=DEGREE_DAY_BASE, utc_offset=None):
+    """
+    Grados-día de calefacción y refrigeración por día, con la media
+    meteorológica (Tmin + Tmax) / 2
+    :return: (días, hdd, cdd)
+    """
+    t = _array(temperature)
+    valid = ~np.isnan(t)
+    days = day_index(_array(ts)[valid], utc_offset)
+    t = t[valid]
+    if len(t) == 0:
+        return days, np.empty(0), np.empty(0)
+    order = np.argsort(days, kind='stable')
+    days, t = days[order], t[order]
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    mean = (np.minimum.reduceat(t, starts) + np.maximum.reduceat(t, starts)) / 2.0
+    return days[starts], np.maximum(base - mean, 0.0), np.maximum(mean - base, 0.0)
+
+
+class DegreeDays:
+    def __init__(self, base=DEGREE_DAY_BASE, utc_offset=None):
+        """
+        Grados-día del día en curso, actualizados en cada lectura
+        """
+        self.base = base
+        self.utc_offset = utc_offset
+        self.day = None
+        self.t_min = np.inf
+        self.t_max = -np.inf
+
+    def update(self, ts, temperature):
+        """
+        :return: {'hdd': ..., 'cdd': ...} acumulados del día
+        """
+        day = int(day_index([ts], self.utc_offset)[0])
+        if day != self.day:
+            self.day = day
+            self.t_min, self.t_max = np.inf, -np.inf
+        t = _array([temperature])[0]
+        if not np.isnan(t):
+            self.t_min = min(self.t_min, t)
+            self.t_max = max(self.t_max, t)
+        if self.t_min > self.t_max:
+            return {'hdd': np.nan, 'cdd': np.nan}
+        mean = (self.t_min + self.t_max) / 2.0
+        return {'hdd': float(max(self.base - mean, 0.0)), 'cdd': float(max(mean - self.base, 0.0))}
+
+
+def main():
+    """
+    Función principal para pruebas: rendimiento masivo y coincidencia con el cálculo por lectura
+    """
+    n = 5_000_000
+    rng = np.random.default_rng(0)
+    t = rng.uniform(-20, 45, n)
+    rh = rng.uniform(5, 100, n)
+    v = rng.uniform(0, 80, n)
+
+    t0 = time.perf_counter()
+    bulk = derive_arrays(t, rh, v)
+    elapsed = time.perf_counter() - t0
+    print(f"Cálculo masivo: {n / elapsed / 1e6:.1f} M filas/s")
+
+    sample = rng.integers(0, n, 10000)
+    mismatches = 0
+    for i in sample:
+        single = derive({'temperature': t[i], 'humidity': rh[i], 'wind_speed': v[i]})
+        mismatches += sum(not np.array_equal(single[k], bulk[k][i], equal_nan=True) for k in single)
+    print(f"Diferencias entre cálculo por lectura y masivo: {mismatches}")
+
+    ts = time.time() + np.arange(3 * 86400, dtype=float)
+    temp = 15 + 10 * np.sin(np.arange(len(ts)) * 2 * np.pi / 86400)
+    days, hdd, cdd = degree_days(ts, temp)
+    tracker = DegreeDays()
+    incremental = {}
+    for a, b in zip(ts, temp):
+        incremental[int(day_index([a])[0])] = tracker.update(a, b)
+    print(f"Grados-día: {list(zip(days.tolist(), hdd.round(2).tolist(), cdd.round(2).tolist()))}")
+    print(f"Coinciden con el cálculo incremental: "
+          f"{all(incremental[d]['hdd'] == h and incremental[d]['cdd'] == c for d, h, c in zip(days, hdd, cdd))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import sys
+import time
+import struct
+import threading
+
+import numpy as np
+
+import calibration
+from history import to_epoch
+
+# Campos que se guardan: los numéricos en crudo (ver calibration.RAW_FIELDS) y la lluvia
+FIELDS = ('temperature', 'humidity', 'wind_speed', 'light_level', 'is_raining')
+FLOAT_COLUMNS = tuple(calibration.RAW_FIELDS[field] for field in FIELDS if field in calibration.RAW_FIELDS)
+# Muestras por bloque comprimido (~68 min a 1 Hz)
+BLOCK_SIZE = 4096
+
+
+def _bit_length(values):
+    # Bits significativos de cada entero sin signo (0 para 0); exacto por debajo de 2**53
+    return np.frexp(values.astype(np.float64))[1]
+
+
+def _pack(values, width):
+    """
+    Enteros sin signo de `width` bits cada uno, empaquetados (bit más significativo primero)
+    """
+    if width == 0 or not len(values):
+        return b''
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = ((values.astype(np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+    return np.packbits(bits.ravel()).tobytes()
+
+
+def _unpack(data, offset, count, width):
+    if width == 0 or count == 0:
+        return np.zeros(count, np.uint64)
+    bits = np.unpackbits(np.frombuffer(data, np.uint8, offset=offset), count=count * width)
+    weights = np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64)
+    return bits.reshape(count, width).astype(np.uint64) @ weights
+
+
+def encode_timestamps(ts):
+    """
+    Delta-of-delta: primer instante y primer delta enteros; después, un bit por muestra
+    (delta-of-delta nulo, lo normal con periodo fijo) y, para las demás, el
+    delta-of-delta en zigzag con el ancho fijo del bloque
+    :param ts: Instantes enteros (p. ej. ms epoch), crecientes
+    """
+    ts = np.asarray(ts, np.int64)
+    n = len(ts)
+    data = struct.pack('<q', ts[0]) if n else b''
+    if n < 2:
+        return data
+    data += struct.pack('<q', ts[1] - ts[0])
+    if n < 3:
+        return data
+    dod = np.diff(ts, 2)
+    zigzag = ((dod << 1) ^ (dod >> 63)).view(np.uint64)
+    nonzero = zigzag != 0
+    kept = zigzag[nonzero]
+    width = int(_bit_length(kept).max()) if len(kept) else 0
+    return data + bytes([width]) + np.packbits(nonzero).tobytes() + _pack(kept, width)
+
+
+def decode_timestamps(data, n):
+    if n == 0:
+        return np.zeros(0, np.int64)
+    first = struct.unpack_from('<q', data)[0]
+    if n == 1:
+        return np.array([first], np.int64)
+    delta = struct.unpack_from('<q', data, 8)[0]
+    dod = np.zeros(n - 2, np.int64)
+    if n > 2:
+        width = data[16]
+        flag_bytes = (n - 2 + 7) // 8
+        nonzero = np.unpackbits(np.frombuffer(data, np.uint8, flag_bytes, 17), count=n - 2).astype(bool)
+        zigzag = _unpack(data, 17 + flag_bytes, int(nonzero.sum()), width)
+        dod[nonzero] = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    deltas = delta + np.concatenate(([0], np.cumsum(dod)))
+    return first + np.concatenate(([0], np.cumsum(deltas)))
+
+
+def encode_floats(values):
+    """
+    XOR de cada float32 con el anterior: un bit por muestra (XOR nulo = valor repetido)
+    y, para las demás, los bits significativos del XOR en la ventana
+    (ceros a la izquierda y a la derecha) común a todo el bloque
+    """
+    bits = np.asarray(values, np.float32).view(np.uint32)
+    n = len(bits)
+    data = struct.pack('<I', bits[0]) if n else b''
+    if n < 2:
+        return data
+    xor = bits[1:] ^ bits[:-1]
+    nonzero = xor != 0
+    kept = xor[nonzero]
+    if len(kept):
+        trail = int(_bit_length(kept & (~kept + np.uint32(1))).min()) - 1
+        width = int(_bit_length(kept).max()) - trail
+    else:
+        trail = width = 0
+    return (data + bytes([trail, width]) + np.packbits(nonzero).tobytes() +
+            _pack(kept >> np.uint32(trail), width))
+
+
+def decode_floats(data, n):
+    if n == 0:
+        return np.zeros(0, np.float32)
+    xor = np.zeros(n, np.uint32)
+    xor[0] = struct.unpack_from('<I', data)[0]
+    if n > 1:
+        trail, width = data[4], data[5]
+        flag_bytes = (n - 1 + 7) // 8
+        nonzero = np.unpackbits(np.frombuffer(data, np.uint8, flag_bytes, 6), count=n - 1).astype(bool)
+        kept = _unpack(data, 6 + flag_bytes, int(nonzero.sum()), width)
+        xor[1:][nonzero] = (kept << np.uint64(trail)).astype(np.uint32)
+    return np.bitwise_xor.accumulate(xor).view(np.float32)
+
+
+def encode_bools(values):
+    return np.packbits(np.asarray(values, bool)).tobytes()
+
+
+def decode_bools(data, n):
+    return np.unpackbits(np.frombuffer(data, np.uint8), count=n).astype(bool)
+
+
+class CompressedHistory:
+    def __init__(self, retention=None, block_size=BLOCK_SIZE):
+        """
+        Histórico en memoria comprimido por bloques al estilo Gorilla: instantes en
+        delta-of-delta, valores crudos float32 en XOR y la lluvia en bits. Las
+        lecturas se acumulan en un bloque abierto de tamaño fijo que se comprime al
+        llenarse; la lectura descomprime bloques enteros con numpy.
+        :param retention: Segundos a conservar (se descartan bloques enteros; None = sin límite)
+        :param block_size: Muestras por bloque
+        """
+        self.retention = retention
+        self.block_size = block_size
+        # Bloques cerrados: (primer ts ms, último ts ms, muestras, dict columna -> bytes)
+        self.blocks = []
+        self.open_ts = np.empty(block_size, np.int64)
+        self.open = {column: np.empty(block_size, np.float32) for column in FLOAT_COLUMNS}
+        self.open_rain = np.empty(block_size, bool)
+        self.n_open = 0
+        self.lock = threading.Lock()
+        self.last_ts = None
+
+    def put(self, reading):
+        """
+        Añade una lectura; las lecturas fuera de orden se descartan
+        """
+        ts = to_epoch(reading['timestamp'])
+        profile = reading.get('profile')
+        with self.lock:
+            if self.last_ts is not None and ts <= self.last_ts:
+                return
+            self.last_ts = ts
+            k = self.n_open
+            self.open_ts[k] = round(ts * 1000)
+            for field, column in calibration.RAW_FIELDS.items():
+                value = calibration.raw_value(reading, field, profile)
+                self.open[column][k] = np.nan if value is None else value
+            self.open_rain[k] = bool(reading.get('is_raining'))
+            self.n_open += 1
+            if self.n_open == self.block_size:
+                self._seal()
+
+    def _seal(self):
+        n = self.n_open
+        ts = self.open_ts[:n]
+        data = {'ts': encode_timestamps(ts), 'is_raining': encode_bools(self.open_rain[:n])}
+        for column in FLOAT_COLUMNS:
+            data[column] = encode_floats(self.open[column][:n])
+        self.blocks.append((int(ts[0]), int(ts[-1]), n, data))
+        self.n_open = 0
+        if self.retention:
+            cutoff = (ts[-1] - self.retention * 1000)
+            while self.blocks and self.blocks[0][1] < cutoff:
+                self.blocks.pop(0)
+
+    def __len__(self):
+        return sum(block[2] for block in self.blocks) + self.n_open
+
+    def nbytes(self):
+        """
+        Memoria de los datos: bloques comprimidos más el bloque abierto (fijo)
+        """
+        sealed = sum(len(data) for *_, data in self.blocks for data in data.values())
+        return sealed + self.open_ts.nbytes + self.open_rain.nbytes + sum(a.nbytes for a in self.open.values())
+
+    def sealed(self, after=None):
+        """
+        Bloques cerrados que empiezan después de `after` (ms; None = todos). Son
+        inmutables, así que basta con copiar la lista para escribirlos fuera del lock
+        :return: Lista de (primer ts ms, último ts ms, muestras, dict columna -> bytes)
+        """
+        with self.lock:
+            return [block for block in self.blocks if after is None or block[0] > after]
+
+    def snapshot(self):
+        """
+        Estado del bloque abierto para snapshot.save(); los bloques cerrados se
+        guardan aparte una sola vez (ver sealed y snapshot.write_block)
+        :return: dict nombre -> array con claves 'long.*'
+        """
+        with self.lock:
+            k = self.n_open
+            state = {'long.open.ts': self.open_ts[:k].copy(),
+                     'long.open.is_raining': self.open_rain[:k].copy()}
+            for column in FLOAT_COLUMNS:
+                state[f'long.open.{column}'] = self.open[column][:k].copy()
+            state['long.last'] = np.array([np.nan if self.last_ts is None else self.last_ts])
+        return state
+
+    def restore(self, state=None, blocks=(), since=None):
+        """
+        Carga en un histórico vacío los bloques cerrados (ordenados) y el bloque abierto
+        de snapshot(), sin los bloques que terminan antes de `since` (epoch s; None =
+        todos). Las filas del bloque abierto que ya están en un bloque cerrado (se
+        cerró después de la instantánea) se descartan.
+        """
+        with self.lock:
+            if self.blocks or self.n_open:
+                raise RuntimeError("Solo se puede restaurar un histórico vacío")
+            cutoff = -np.inf if since is None else since * 1000
+            self.blocks = [tuple(block) for block in blocks if block[1] >= cutoff]
+            sealed = self.blocks[-1][1] if self.blocks else -np.inf
+            if state is not None:
+                keep = state['long.open.ts'] > sealed
+                k = int(keep.sum())
+                if k > self.block_size:
+                    raise ValueError("Bloque abierto mayor que block_size")
+                self.open_ts[:k] = state['long.open.ts'][keep]
+                self.open_rain[:k] = state['long.open.is_raining'][keep]
+                for column in FLOAT_COLUMNS:
+                    self.open[column][:k] = state[f'long.open.{column}'][keep]
+                self.n_open = k
+                last_ts = float(state['long.last'][0])
+                if not np.isnan(last_ts):
+                    self.last_ts = max(last_ts, sealed / 1000)
+            if self.last_ts is None and self.blocks:
+                self.last_ts = sealed / 1000
+
+    def columns(self, start=None, end=None, columns=FLOAT_COLUMNS + ('is_raining',)):
+        """
+        Columnas crudas en [start, end) (epoch s; None = sin límite) descomprimiendo
+        solo los bloques que se solapan con el rango
+        :return: dict con 'ts' (epoch s) y un array por columna
+        """
+        lo = -np.inf if start is None else to_epoch(start) * 1000
+        hi = np.inf if end is None else to_epoch(end) * 1000
+        parts = {name: [] for name in ('ts',) + tuple(columns)}
+        with self.lock:
+            for first, last, n, data in self.blocks:
+                if last < lo or first >= hi:
+                    continue
+                parts['ts'].append(decode_timestamps(data['ts'], n))
+                for name in columns:
+                    decode = decode_bools if name == 'is_raining' else decode_floats
+                    parts[name].append(decode(data[name], n))
+            if self.n_open:
+                k = self.n_open
+                parts['ts'].append(self.open_ts[:k].copy())
+                for name in columns:
+                    parts[name].append((self.open_rain if name == 'is_raining' else self.open[name])[:k].copy())
+        result = {name: np.concatenate(values) if values else np.zeros(0) for name, values in parts.items()}
+        ts = result['ts']
+        i, j = np.searchsorted(ts, [lo, hi])
+        result = {name: values[i:j] for name, values in result.items()}
+        result['ts'] = result['ts'] / 1000
+        return result
+
+    def slice(self, start, end, fields=FIELDS, profile=None):
+        """
+        Como History.slice: campos calibrados en [start, end) con el perfil indicado
+        """
+        profile = calibration.get(profile)
+        raw = self.columns(start, end, tuple(calibration.RAW_FIELDS.get(field, field) for field in fields))
+        data = {'ts': raw['ts']}
+        for field in fields:
+            values = raw[calibration.RAW_FIELDS.get(field, field)]
+            data[field] = profile.apply(field, values) if field in calibration.RAW_FIELDS else values
+        return data
+
+
+def _simulate(n, start, rng):
+    # Día típico a 1 Hz con los valores crudos tal como llegan de los sensores
+    t = np.arange(n)
+    hour = t / 3600 % 24
+    temperature = np.round(18 + 6 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.3, n))
+    humidity = np.round(60 - 2 * (temperature - 18))
+    speed = np.clip(12 * np.sin((hour - 6) / 24 * 2 * np.pi) + 4 + rng.normal(0, 2, n), 0, None)
+    edges = rng.poisson(calibration.active().invert('wind_speed', speed)).astype(float)
+    clear = np.round(np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None) * 40000 + rng.integers(0, 50, n))
+    raining = (t // 3600) % 11 == 3
+    return [{'timestamp': start + k, 'temperature_raw': temperature[k], 'humidity_raw': humidity[k],
+             'wind_edges': edges[k], 'clear': clear[k], 'is_raining': bool(raining[k])} for k in range(n)]
+
+
+def main():
+    """
+    Benchmark: memoria y decodificación frente al deque de dicts de la estación
+    Uso: python gorilla.py [días]
+    """
+    import tracemalloc
+    from collections import deque
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    n = int(days * 86400)
+    rng = np.random.default_rng(0)
+    start = float(int(time.time()) - n)
+    readings = _simulate(n, start, rng)
+    keys = ('temperature_raw', 'humidity_raw', 'wind_edges', 'clear', 'is_raining')
+
+    tracemalloc.start()
+    buffer = deque(dict(reading) for reading in readings)
+    deque_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    arrays = {key: np.fromiter((reading[key] for reading in buffer), float, len(buffer)) for key in keys}
+    deque_decode = time.perf_counter() - t0
+
+    compressed = CompressedHistory()
+    t0 = time.perf_counter()
+    for reading in readings:
+        compressed.put(reading)
+    put_us = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    columns = compressed.columns()
+    decode = time.perf_counter() - t0
+
+    same = all(np.array_equal(columns[key], arrays[key].astype(columns[key].dtype)) for key in keys)
+    same &= np.array_equal(columns['ts'], np.arange(n) + start)
+    print(f"{n} muestras × {len(keys)} campos; decodificación sin pérdidas: {'sí' if same else 'NO'}")
+    print(f"deque de dicts: {deque_bytes / 2**20:7.1f} MB ({deque_bytes / n / len(keys):6.1f} B/muestra/campo), "
+          f"a numpy en {deque_decode * 1000:.0f} ms")
+    total = compressed.nbytes()
+    print(f"comprimido:     {total / 2**20:7.1f} MB ({total / n / len(keys):6.2f} B/muestra/campo), "
+          f"a numpy en {decode * 1000:.0f} ms; {put_us:.1f} µs por lectura")
+    sizes = {name: sum(len(block[3][name]) for block in compressed.blocks) for name in ('ts',) + keys}
+    sealed = sum(block[2] for block in compressed.blocks)
+    print("  por campo (B/muestra): " + ", ".join(f"{name} {size / max(sealed, 1):.2f}"
+                                                 for name, size in sizes.items()))
+
+
+if __name__ == "__main__":
+    main()
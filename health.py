@@ -0,0 +1,188 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Código de calidad por campo; 3 bits por campo en record['quality'], en el orden de FIELDS
+OK = 0
+MISSING = 1     # el sensor no devolvió dato
+RANGE = 2       # fuera del rango físico del sensor (el valor se descarta)
+STUCK = 3       # el mismo valor durante demasiado tiempo
+FLAT = 4        # clavado en su mínimo (p. ej. anemómetro desconectado a 0 km/h)
+BACKOFF = 5     # sensor en espera por fallos repetidos; no se ha leído
+CODE_NAMES = ('ok', 'missing', 'range', 'stuck', 'flat', 'backoff')
+QUALITY_BITS = 3
+
+FIELDS = ('temperature', 'humidity', 'wind_speed', 'light_level', 'wetness')
+
+# Campo: (mínimo, máximo, segundos sin cambiar para darlo por atascado o None)
+LIMITS = {
+    'temperature': (-40.0, 60.0, 6 * 3600),    # el DHT11 tiene resolución de 1 °C
+    'humidity': (5.0, 100.0, 6 * 3600),
+    'wind_speed': (0.0, 200.0, 24 * 3600),     # un día entero sin un solo flanco
+    'light_level': (0.0, 100.0, 18 * 3600),    # más que una noche
+    'wetness': (0.0, 1.0, None),               # semanas sin llover es normal
+}
+
+# Sensores que se sondean (y pueden entrar en espera) y los campos que aportan
+SENSOR_FIELDS = {
+    'temperature': ('temperature', 'humidity'),
+    'light': ('light_level',),
+}
+
+
+class Backoff:
+    def __init__(self, failures=3, base=2.0, max_interval=300.0):
+        """
+        Espera exponencial para un sensor que falla de forma persistente
+        :param failures: Fallos seguidos antes de empezar a espaciar los intentos
+        :param base: Primera espera en segundos; se dobla con cada fallo
+        :param max_interval: Espera máxima en segundos
+        """
+        self.threshold = failures
+        self.base = base
+        self.max_interval = max_interval
+        self.failures = 0
+        self.interval = 0.0
+        self.next_due = None
+
+    def due(self, now):
+        return self.next_due is None or now >= self.next_due
+
+    def report(self, now, ok):
+        if ok:
+            self.failures = 0
+            self.interval = 0.0
+            self.next_due = None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.interval = min(self.base * 2 ** (self.failures - self.threshold), self.max_interval)
+            self.next_due = now + self.interval
+
+
+class _Channel:
+    __slots__ = ('lo', 'hi', 'stuck_s', 'value', 'since')
+
+    def __init__(self, lo, hi, stuck_s):
+        self.lo = lo
+        self.hi = hi
+        self.stuck_s = stuck_s
+        self.value = None
+        self.since = None
+
+    def check(self, now, value):
+        if value is None or value != value:  # None o NaN
+            return MISSING
+        if not self.lo <= value <= self.hi:
+            return RANGE
+        if value != self.value:
+            self.value = value
+            self.since = now
+            return OK
+        if self.stuck_s is not None and now - self.since >= self.stuck_s:
+            return FLAT if value == self.lo else STUCK
+        return OK
+
+
+class Health:
+    def __init__(self, limits=None, failures=3, base=2.0, max_interval=300.0):
+        """
+        Vigilancia de los sensores con comprobaciones en streaming de coste O(1) por campo
+        :param limits: dict campo -> (mínimo, máximo, segundos para atascado); ver LIMITS
+        :param failures, base, max_interval: Parámetros de Backoff por sensor
+        """
+        limits = limits or LIMITS
+        self.channels = {field: _Channel(*limits[field]) for field in FIELDS}
+        self.backoffs = {sensor: Backoff(failures, base, max_interval) for sensor in SENSOR_FIELDS}
+        self.waiting = set()
+        self.counts = {field: [0] * len(CODE_NAMES) for field in FIELDS}
+
+    def due(self, sensor, now):
+        """
+        Si toca leer el sensor; los que están en espera no se leen y sus campos
+        se marcan BACKOFF hasta el siguiente intento
+        """
+        if self.backoffs[sensor].due(now):
+            self.waiting.discard(sensor)
+            return True
+        self.waiting.add(sensor)
+        return False
+
+    def report(self, sensor, now, data):
+        """
+        Registra el resultado de una lectura: falla si algún campo del sensor falta
+        """
+        ok = all(data.get(field) is not None for field in SENSOR_FIELDS[sensor])
+        backoff = self.backoffs[sensor]
+        was_waiting = backoff.interval > 0
+        backoff.report(now, ok)
+        if ok and was_waiting:
+            log.info("Sensor %s recuperado", sensor)
+        elif backoff.interval > 0 and not was_waiting:
+            log.warning("Sensor %s en espera tras %d fallos seguidos", sensor, backoff.failures)
+
+    def check(self, readings, now):
+        """
+        Asigna un código de calidad a cada campo y descarta (None) los fuera de rango
+        :return: Códigos empaquetados para record['quality']
+        """
+        quality = 0
+        for i, field in enumerate(FIELDS):
+            code = self.channels[field].check(now, readings.get(field))
+            if code == RANGE:
+                readings[field] = None
+            elif code == MISSING and any(field in SENSOR_FIELDS[s] for s in self.waiting):
+                code = BACKOFF
+            self.counts[field][code] += 1
+            quality |= code << (QUALITY_BITS * i)
+        return quality
+
+    def stats(self):
+        """
+        Lecturas por campo y código de calidad distinto de 'ok', y sensores en espera
+        """
+        return {
+            'fields': {
+                field: {CODE_NAMES[code]: n for code, n in enumerate(counts) if code and n}
+                for field, counts in self.counts.items()
+            },
+            'waiting': {sensor: self.backoffs[sensor].interval for sensor in sorted(self.waiting)},
+        }
+
+
+def decode_quality(packed):
+    """
+    Inverso de Health.check: nombre del código de calidad de cada campo
+    """
+    packed = int(packed)
+    mask = (1 << QUALITY_BITS) - 1
+    return {field: CODE_NAMES[(packed >> (QUALITY_BITS * i)) & mask] for i, field in enumerate(FIELDS)}
+
+
+def main():
+    """
+    Función principal para pruebas: un DHT11 que falla durante diez minutos y un
+    anemómetro que se desconecta
+    """
+    health = Health()
+    reads = 0
+    for t in range(0, 2 * 86400):
+        dht_broken = 3600 <= t < 4200
+        readings = {'wind_speed': 12.0 if t < 3600 else 0.0, 'light_level': 50.0, 'wetness': 0.0}
+        if health.due('temperature', t):
+            reads += 1
+            data = {'temperature': None, 'humidity': None} if dht_broken else \
+                   {'temperature': 20.0 + (t // 600) % 3, 'humidity': 50.0 + (t // 900) % 4}
+            health.report('temperature', t, data)
+        else:
+            data = {'temperature': None, 'humidity': None}
+        readings.update(data)
+        quality = health.check(readings, t)
+        if t in (3599, 3700, 4300, 24 * 3600 + 3700):
+            print(f"t={t:>6}: {decode_quality(quality)}")
+    print(f"Lecturas del DHT11: {reads} de {2 * 86400} ticks")
+    print(f"Estadísticas: {health.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,666 @@
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+import calibration
+import align
+import adaptive
+import record
+
+# Campos numéricos que se consultan (calibrados)
+FIELDS = ('temperature', 'humidity', 'wind_speed', 'light_level', 'is_raining')
+# Columna cruda que se guarda para cada campo; la calibración se aplica al consultar
+COLUMNS = tuple(calibration.RAW_FIELDS.get(field, field) for field in FIELDS)
+# Sensor que aporta cada campo; cada sensor guarda su instante de captura
+SOURCES = {'temperature': 'temperature', 'humidity': 'temperature', 'wind_speed': 'wind',
+           'light_level': 'light', 'is_raining': 'rain'}
+# Desfase de la captura respecto al tick (s, float32) por sensor
+CAPTURE_COLUMNS = tuple(f'{sensor}_at' for sensor in dict.fromkeys(SOURCES.values()))
+# Resoluciones pre-agregadas en segundos
+RESOLUTIONS = (60, 3600)
+# Segundos que conserva cada agregado (None = sin límite)
+ROLLUP_RETENTION = {60: 14 * 86400, 3600: 365 * 86400}
+
+# Caché de calibración: bloques fijos de filas por (campo, versión de perfil)
+CALIBRATED_BLOCK = 4096
+CALIBRATED_BLOCKS = 64
+
+
+def to_epoch(value):
+    """
+    Convierte datetime, cadena ISO o número a segundos epoch
+    """
+    if isinstance(value, (int, float, np.floating, np.integer)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _column(field):
+    return calibration.RAW_FIELDS.get(field, field)
+
+
+def _value(reading, field):
+    if field in calibration.RAW_FIELDS:
+        value = calibration.raw_value(reading, field, reading.get('profile'))
+    else:
+        value = reading.get(field)
+    if value is None:
+        return np.nan
+    return float(value)
+
+
+def _rain_interval(reading):
+    # Intervalo hasta la siguiente muestra de lluvia con muestreo adaptativo (0 si fijo)
+    intervals = reading.get('sample_intervals')
+    if intervals and 'rain' in intervals:
+        return float(intervals['rain'])
+    if reading.get('rates'):
+        return adaptive.decode_rates(reading['rates'])['rain']
+    return 0.0
+
+
+def _calibrate(field, values, profile):
+    if field in calibration.RAW_FIELDS:
+        return profile.apply(field, values)
+    return values
+
+
+class _Columns:
+    def __init__(self, names, capacity=1024, dtypes=None):
+        """
+        Columnas numpy que crecen por duplicación (append amortizado O(1))
+        :param dtypes: dict nombre -> dtype para las columnas que no son float64
+        """
+        self.n = 0
+        # Filas descartadas desde el principio: fila absoluta = dropped + índice
+        self.dropped = 0
+        self.cols = {name: np.empty(capacity, (dtypes or {}).get(name, float)) for name in names}
+
+    def append(self, row):
+        capacity = len(self.cols['ts'])
+        if self.n == capacity:
+            for name, col in self.cols.items():
+                grown = np.empty(capacity * 2, col.dtype)
+                grown[:self.n] = col[:self.n]
+                self.cols[name] = grown
+        for name, value in row.items():
+            self.cols[name][self.n] = value
+        self.n += 1
+
+    def extend(self, columns):
+        """
+        Añade varias filas de golpe (dict nombre -> array de la misma longitud)
+        """
+        count = len(columns['ts'])
+        capacity = len(self.cols['ts'])
+        while self.n + count > capacity:
+            capacity *= 2
+        for name, col in self.cols.items():
+            if capacity > len(col):
+                grown = np.empty(capacity, col.dtype)
+                grown[:self.n] = col[:self.n]
+                self.cols[name] = col = grown
+            col[self.n:self.n + count] = columns[name]
+        self.n += count
+
+    def drop_before(self, index):
+        """
+        Descarta las primeras `index` filas
+        """
+        if index <= 0:
+            return
+        for name, col in self.cols.items():
+            col[:self.n - index] = col[index:self.n]
+        self.n -= index
+        self.dropped += index
+
+    def __getitem__(self, name):
+        return self.cols[name][:self.n]
+
+
+class _Rollup:
+    def __init__(self, resolution, retention=None):
+        """
+        Agregados incrementales (count/sum/min/max y minutos de lluvia) por intervalo fijo
+        :param retention: Segundos de intervalos a conservar (None = sin límite); como en
+                          el histórico crudo, se recorta al llenarse la capacidad
+        """
+        self.resolution = resolution
+        self.retention = retention
+        names = ['ts', 'rain_s']
+        for column in COLUMNS:
+            names += [f'{column}_count', f'{column}_sum', f'{column}_min', f'{column}_max']
+        self.columns = _Columns(names)
+        self.current = None
+
+    def _new_bucket(self, start):
+        bucket = {'ts': start, 'rain_s': 0.0}
+        for column in COLUMNS:
+            bucket[f'{column}_count'] = 0
+            bucket[f'{column}_sum'] = 0.0
+            bucket[f'{column}_min'] = np.inf
+            bucket[f'{column}_max'] = -np.inf
+        return bucket
+
+    def add(self, ts, values, rain_s):
+        start = ts - ts % self.resolution
+        if self.current is None or self.current['ts'] != start:
+            self.flush()
+            self.current = self._new_bucket(start)
+        bucket = self.current
+        bucket['rain_s'] += rain_s
+        for field, value in values.items():
+            if value != value:  # NaN
+                continue
+            bucket[f'{field}_count'] += 1
+            bucket[f'{field}_sum'] += value
+            if value < bucket[f'{field}_min']:
+                bucket[f'{field}_min'] = value
+            if value > bucket[f'{field}_max']:
+                bucket[f'{field}_max'] = value
+
+    def extend(self, ts, values, rain_s):
+        """
+        Como add() para muchas filas ordenadas: agrega con reduceat por intervalo
+        """
+        if not len(ts):
+            return
+        starts = ts - ts % self.resolution
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(starts)) + 1))
+        groups = {'ts': starts[bounds], 'rain_s': np.add.reduceat(rain_s, bounds)}
+        for column, value in values.items():
+            valid = ~np.isnan(value)
+            groups[f'{column}_count'] = np.add.reduceat(valid.astype(float), bounds)
+            groups[f'{column}_sum'] = np.add.reduceat(np.where(valid, value, 0.0), bounds)
+            groups[f'{column}_min'] = np.minimum.reduceat(np.where(valid, value, np.inf), bounds)
+            groups[f'{column}_max'] = np.maximum.reduceat(np.where(valid, value, -np.inf), bounds)
+        first = 0
+        if self.current is not None and self.current['ts'] == groups['ts'][0]:
+            # El primer intervalo continúa el que está en curso
+            bucket = self.current
+            for name, group in groups.items():
+                if name.endswith('_min'):
+                    bucket[name] = min(bucket[name], group[0].item())
+                elif name.endswith('_max'):
+                    bucket[name] = max(bucket[name], group[0].item())
+                elif name != 'ts':
+                    bucket[name] += group[0].item()
+            first = 1
+        if first < len(bounds):
+            self.flush()
+            self._trim(groups['ts'][-1], len(bounds) - first - 1)
+            self.columns.extend({name: group[first:-1] for name, group in groups.items()})
+            self.current = {name: group[-1].item() for name, group in groups.items()}
+
+    def flush(self):
+        if self.current is not None:
+            self._trim(self.current['ts'], 1)
+            self.columns.append(self.current)
+            self.current = None
+
+    def _trim(self, latest, count):
+        # Descarta los intervalos fuera de la retención si añadir `count` filas haría crecer las columnas
+        if self.retention and self.columns.n + count > len(self.columns.cols['ts']):
+            cutoff = latest - self.retention
+            self.columns.drop_before(int(np.searchsorted(self.columns['ts'], cutoff)))
+
+    def view(self, start, end):
+        """
+        Intervalos en [start, end), incluido el intervalo en curso
+        """
+        ts = self.columns['ts']
+        i, j = np.searchsorted(ts, [start, end])
+        cols = {name: self.columns[name][i:j] for name in self.columns.cols}
+        if self.current is not None and start <= self.current['ts'] < end:
+            cols = {name: np.append(col, self.current[name]) for name, col in cols.items()}
+        return cols
+
+
+class History:
+    def __init__(self, retention=None, max_gap=5.0, rollup_retention=None):
+        """
+        Histórico columnar en memoria con índice temporal y agregados pre-calculados.
+        Guarda valores crudos y calibra al consultar con el perfil pedido.
+        :param retention: Segundos de datos crudos a conservar (None = sin límite)
+        :param max_gap: Hueco máximo en segundos que cuenta como duración de lluvia; con
+                        muestreo adaptativo se amplía al intervalo real del sensor de lluvia
+        :param rollup_retention: dict resolución -> segundos a conservar de cada agregado
+                                 (por defecto ROLLUP_RETENTION)
+        """
+        self.retention = retention
+        self.max_gap = max_gap
+        # Solo el tiempo en float64: los valores crudos caben en float32 sin pérdida
+        # (décimas del DHT11, flancos, cuentas de 16 bits) y ocupan la mitad
+        self.raw = _Columns(('ts', 'rain_s') + COLUMNS + CAPTURE_COLUMNS,
+                            dtypes=dict.fromkeys(('rain_s',) + COLUMNS + CAPTURE_COLUMNS, np.float32))
+        rollup_retention = ROLLUP_RETENTION if rollup_retention is None else rollup_retention
+        self.rollups = {res: _Rollup(res, rollup_retention.get(res)) for res in RESOLUTIONS}
+        # (campo, versión de perfil, bloque absoluto) -> (perfil, valores calibrados), LRU
+        self.calibrated = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_ts = None
+        self.last_raining = False
+        self.rain_interval = 0.0
+
+    def put(self, reading):
+        """
+        Añade una lectura; las lecturas fuera de orden se descartan
+        """
+        ts = to_epoch(reading['timestamp'])
+        values = {_column(field): _value(reading, field) for field in FIELDS}
+        # Sin instantes de captura (p. ej. lecturas de un registro), se toma el tick
+        captured = reading.get('captured') or {}
+        offsets = {f'{sensor}_at': captured[sensor] - ts if sensor in captured else 0.0
+                   for sensor in dict.fromkeys(SOURCES.values())}
+
+        with self.lock:
+            if self.last_ts is not None and ts <= self.last_ts:
+                return
+            # La lluvia del intervalo previo se atribuye a esta muestra
+            rain_s = 0.0
+            if self.last_ts is not None and self.last_raining:
+                rain_s = min(ts - self.last_ts, max(self.max_gap, self.rain_interval))
+            self.last_ts = ts
+            self.last_raining = bool(values['is_raining'] == 1)
+            self.rain_interval = _rain_interval(reading)
+
+            self.raw.append(dict(values, ts=ts, rain_s=rain_s, **offsets))
+            for rollup in self.rollups.values():
+                rollup.add(ts, values, rain_s)
+
+            if self.retention and self.raw.n == len(self.raw.cols['ts']):
+                cutoff = ts - self.retention
+                self.raw.drop_before(int(np.searchsorted(self.raw['ts'], cutoff)))
+
+    def extend(self, records):
+        """
+        Añade de golpe un array de registros (record.RECORD_DTYPE) ordenado por tiempo,
+        sin pasar por dicts: equivale a put() de cada record.to_readings(records)
+        """
+        records = np.asarray(records, record.RECORD_DTYPE)
+        if not len(records):
+            return
+        ts = records['wall_ns'] / 1e9
+        # Los campos sin dato válido se guardan como NaN, como hace la estación
+        invalid = record.invalid(records)
+        values = {'is_raining': record.is_raining(records).astype(float)}
+        for field, raw in calibration.RAW_FIELDS.items():
+            values[raw] = np.where(invalid[field], np.nan, records[raw].astype(float))
+        rates = records['rates']
+        # Intervalo del sensor de lluvia (ver adaptive.decode_rates); 0 sin muestreo adaptativo
+        code = (rates >> (4 * adaptive.SENSORS.index('rain'))) & 0xF
+        rain_interval = np.where(rates != 0, 2.0 ** code, 0.0)
+
+        with self.lock:
+            # Fuera de orden: se descartan las filas que no superan a todas las anteriores
+            previous = np.maximum.accumulate(np.concatenate(
+                ([-np.inf if self.last_ts is None else self.last_ts], ts[:-1])))
+            keep = ts > previous
+            if not keep.all():
+                ts, rain_interval = ts[keep], rain_interval[keep]
+                values = {name: column[keep] for name, column in values.items()}
+            if not len(ts):
+                return
+            raining = values['is_raining'] == 1
+            # La lluvia del intervalo previo se atribuye a cada muestra (ver put)
+            prev_ts = np.concatenate(([np.nan if self.last_ts is None else self.last_ts], ts[:-1]))
+            prev_raining = np.concatenate(([self.last_raining], raining[:-1]))
+            prev_interval = np.concatenate(([self.rain_interval], rain_interval[:-1]))
+            with np.errstate(invalid='ignore'):
+                rain_s = np.where(prev_raining & ~np.isnan(prev_ts),
+                                  np.minimum(ts - prev_ts, np.maximum(self.max_gap, prev_interval)), 0.0)
+            self.last_ts = float(ts[-1])
+            self.last_raining = bool(raining[-1])
+            self.rain_interval = float(rain_interval[-1])
+
+            if self.retention and self.raw.n + len(ts) > len(self.raw.cols['ts']):
+                cutoff = ts[-1] - self.retention
+                self.raw.drop_before(int(np.searchsorted(self.raw['ts'], cutoff)))
+            columns = dict(values, ts=ts, rain_s=rain_s)
+            columns.update({name: np.zeros(len(ts)) for name in CAPTURE_COLUMNS})
+            self.raw.extend(columns)
+            for rollup in self.rollups.values():
+                rollup.extend(ts, values, rain_s)
+
+    def __len__(self):
+        return self.raw.n
+
+    def snapshot(self, since):
+        """
+        Copia de las filas crudas y de los agregados desde `since` (epoch s) para un
+        arranque en caliente; el intervalo en curso de cada agregado va como última fila
+        :return: dict nombre -> array (ver restore)
+        """
+        with self.lock:
+            i = int(np.searchsorted(self.raw['ts'], since))
+            state = {f'raw.{name}': self.raw[name][i:].copy() for name in self.raw.cols}
+            for res, rollup in self.rollups.items():
+                k = int(np.searchsorted(rollup.columns['ts'], since - res))
+                for name in rollup.columns.cols:
+                    values = rollup.columns[name][k:]
+                    if rollup.current is not None:
+                        values = np.append(values, rollup.current[name])
+                    state[f'rollup{res}.{name}'] = values
+                state[f'rollup{res}.open'] = np.array([rollup.current is not None])
+            state['last'] = np.array([np.nan if self.last_ts is None else self.last_ts,
+                                      float(self.last_raining), self.rain_interval])
+        return state
+
+    def restore(self, state, since):
+        """
+        Carga en un histórico vacío el estado de snapshot(), sin lo anterior a `since`
+        """
+        with self.lock:
+            if self.raw.n or self.last_ts is not None:
+                raise RuntimeError("Solo se puede restaurar un histórico vacío")
+            ts = state['raw.ts']
+            keep = ts >= since
+            if keep.any():
+                self.raw.extend({name: state[f'raw.{name}'][keep] for name in self.raw.cols})
+                last_ts, last_raining = state['last'][:2]
+                self.last_ts = float(last_ts)
+                self.last_raining = bool(last_raining)
+                if len(state['last']) > 2:
+                    self.rain_interval = float(state['last'][2])
+            for res, rollup in self.rollups.items():
+                columns = {name: state[f'rollup{res}.{name}'] for name in rollup.columns.cols}
+                if bool(state[f'rollup{res}.open'][0]) and len(columns['ts']):
+                    rollup.current = {name: values[-1].item() for name, values in columns.items()}
+                    columns = {name: values[:-1] for name, values in columns.items()}
+                keep = columns['ts'] >= since - res
+                rollup.columns.extend({name: values[keep] for name, values in columns.items()})
+                if rollup.current is not None and rollup.current['ts'] < since - res:
+                    rollup.current = None
+
+    def span(self):
+        """
+        Devuelve (primer, último) timestamp almacenado
+        """
+        if self.raw.n == 0:
+            return None
+        return self.raw['ts'][0], self.raw['ts'][-1]
+
+    def _calibrated(self, field, profile, i, j):
+        """
+        Filas [i, j) de un campo calibradas con un perfil (float64, copia). Los bloques
+        completos de CALIBRATED_BLOCK filas se cachean por versión de perfil (como mucho
+        CALIBRATED_BLOCKS); las filas crudas no cambian, así que el recorte por retención
+        solo deja de usar los bloques antiguos. El bloque abierto se calibra cada vez.
+        """
+        raw = self.raw[_column(field)]
+        if field not in calibration.RAW_FIELDS:
+            return raw[i:j].astype(float)
+        base = self.raw.dropped
+        first, last = (base + i) // CALIBRATED_BLOCK, (base + j - 1) // CALIBRATED_BLOCK
+        parts = []
+        for block in range(first, last + 1):
+            start = max(block * CALIBRATED_BLOCK - base, 0)
+            end = (block + 1) * CALIBRATED_BLOCK - base
+            lo, hi = max(i, start) - start, min(j, end) - start
+            if end > self.raw.n or start + base != block * CALIBRATED_BLOCK:
+                # Bloque abierto o ya recortado en parte: sin caché
+                parts.append(profile.apply(field, raw[start + lo:start + hi].astype(float)))
+                continue
+            key = (field, profile.version, block)
+            cached = self.calibrated.get(key)
+            if cached is None or cached[0] is not profile:
+                cached = (profile, profile.apply(field, raw[start:end].astype(float)))
+                self.calibrated[key] = cached
+                while len(self.calibrated) > CALIBRATED_BLOCKS:
+                    self.calibrated.popitem(last=False)
+            else:
+                self.calibrated.move_to_end(key)
+            parts.append(cached[1][lo:hi])
+        return np.concatenate(parts) if len(parts) > 1 else parts[0].copy() if parts else np.empty(0)
+
+    def slice(self, start, end, fields=FIELDS, profile=None):
+        """
+        Datos en [start, end) localizados por búsqueda binaria (copia, calibrada)
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        profile = calibration.get(profile)
+        with self.lock:
+            ts = self.raw['ts']
+            i, j = np.searchsorted(ts, [start, end])
+            data = {'ts': ts[i:j].copy()}
+            for field in fields:
+                data[field] = self._calibrated(field, profile, i, j)
+            data['rain_s'] = self.raw['rain_s'][i:j].astype(float)
+        return data
+
+    def align(self, start, end, step, fields=FIELDS, tolerance=None, direction='backward', profile=None):
+        """
+        Valores de cada campo en una rejilla regular [start, end) de paso `step`,
+        unidos as-of por el instante de captura de su sensor (ver align.asof)
+        :param tolerance: Número, dict campo -> segundos o None (align.TOLERANCES)
+        :param direction: 'backward', 'forward' o 'nearest'
+        :param profile: Perfil de calibración (Profile, versión o None = el activo)
+        :return: dict con 'ts' (la rejilla) y un array por campo (NaN sin dato a tiempo)
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        grid = np.arange(start, end, step)
+        profile = calibration.get(profile)
+        result = {'ts': grid}
+        if not len(grid):
+            return result
+        with self.lock:
+            ts = self.raw['ts']
+            for field in fields:
+                tol = align.tolerance_for(field, tolerance)
+                # Una captura va en la fila de su tick o después (repetida si el sensor no
+                # se renovó) y dista menos de 1 s de su tick (lectura o ventana del viento)
+                i, j = np.searchsorted(ts, [grid[0] - tol - 1.0, grid[-1] + tol + 1.0], 'right')
+                captured = ts[i:j] + self.raw[f'{SOURCES[field]}_at'][i:j]
+                result[field] = align.asof(grid, captured, self._calibrated(field, profile, i, j),
+                                           tol, direction)
+        return result
+
+    def _resolution_for(self, start, step, aggs):
+        # Los percentiles necesitan datos crudos
+        if any(isinstance(agg, (int, float)) or str(agg).startswith('p') for agg in aggs):
+            return None
+        best = None
+        for res in sorted(self.rollups):
+            if step >= res and step % res == 0 and start % res == 0:
+                best = res
+        return best
+
+    def query(self, start, end, fields=FIELDS, aggs=('min', 'max', 'mean', 'count'), step=None,
+              profile=None):
+        """
+        Agrega los campos en [start, end) por intervalos de `step` segundos
+        :param aggs: 'min', 'max', 'mean', 'sum', 'count' o percentiles como 'p95'
+        :param step: Tamaño del intervalo; None para un único agregado del rango
+        :param profile: Perfil de calibración (Profile, versión o None = el activo)
+        :return: {'ts': inicios de intervalo, 'rain_s': segundos de lluvia,
+                  campo: {agregado: array}}
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        if step is None:
+            step = end - start
+        if step <= 0 or end <= start:
+            raise ValueError("Rango o intervalo inválido")
+        n_buckets = int(np.ceil((end - start) / step))
+        edges = start + step * np.arange(n_buckets + 1)
+        edges[-1] = end
+
+        resolution = self._resolution_for(start, step, aggs)
+        profile = calibration.get(profile)
+        with self.lock:
+            if resolution is None:
+                result = self._query_raw(edges, fields, aggs, profile)
+            else:
+                result = self._query_rollup(self.rollups[resolution].view(edges[0], edges[-1]),
+                                            edges, fields, aggs, profile)
+        result['ts'] = edges[:-1]
+        result['resolution'] = resolution or 0
+        result['profile'] = profile.version
+        return result
+
+    def _query_raw(self, edges, fields, aggs, profile):
+        ts = self.raw['ts']
+        i, j = np.searchsorted(ts, [edges[0], edges[-1]])
+        bounds = np.searchsorted(ts[i:j], edges)
+        result = {'rain_s': _reduce_sum(self.raw['rain_s'][i:j], bounds)}
+        for field in fields:
+            values = self._calibrated(field, profile, i, j)
+            valid = ~np.isnan(values)
+            counts = _reduce_sum(valid.astype(float), bounds)
+            sums = _reduce_sum(np.where(valid, values, 0.0), bounds)
+            out = {}
+            for agg in aggs:
+                if agg == 'count':
+                    out[agg] = counts.astype(int)
+                elif agg == 'sum':
+                    out[agg] = sums
+                elif agg == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        out[agg] = np.where(counts > 0, sums / counts, np.nan)
+                elif agg == 'min':
+                    out[agg] = _reduce_ext(np.fmin, np.where(valid, values, np.inf), bounds)
+                elif agg == 'max':
+                    out[agg] = _reduce_ext(np.fmax, np.where(valid, values, -np.inf), bounds)
+                else:
+                    q = float(str(agg).lstrip('p'))
+                    out[agg] = np.array([
+                        np.nanpercentile(values[a:b], q) if counts[k] else np.nan
+                        for k, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))
+                    ])
+            result[field] = out
+        return result
+
+    def _query_rollup(self, cols, edges, fields, aggs, profile):
+        # Los agregados son de valores crudos. Las calibraciones son monótonas, así que
+        # min/max son exactos; la media lo es para las afines (no en los recortes de
+        # luz al 100 % ni en el umbral de calma del viento)
+        bounds = np.searchsorted(cols['ts'], edges)
+        result = {'rain_s': _reduce_sum(cols['rain_s'], bounds)}
+        for field in fields:
+            column = _column(field)
+            counts = _reduce_sum(cols[f'{column}_count'], bounds)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = _calibrate(field, np.where(counts > 0, _reduce_sum(cols[f'{column}_sum'], bounds) / counts,
+                                                   np.nan), profile)
+            out = {}
+            for agg in aggs:
+                if agg == 'count':
+                    out[agg] = counts.astype(int)
+                elif agg == 'sum':
+                    out[agg] = np.where(counts > 0, means * counts, 0.0)
+                elif agg == 'mean':
+                    out[agg] = means
+                elif agg == 'min':
+                    out[agg] = _calibrate(field, _reduce_ext(np.fmin, cols[f'{column}_min'], bounds), profile)
+                elif agg == 'max':
+                    out[agg] = _calibrate(field, _reduce_ext(np.fmax, cols[f'{column}_max'], bounds), profile)
+            result[field] = out
+        return result
+
+
+def _reduce_sum(values, bounds):
+    """
+    Suma por intervalos [bounds[k], bounds[k+1]) usando sumas acumuladas
+    """
+    cumsum = np.concatenate(([0.0], np.cumsum(values, dtype=float)))
+    return cumsum[bounds[1:]] - cumsum[bounds[:-1]]
+
+
+def _reduce_ext(ufunc, values, bounds):
+    """
+    Mínimo/máximo por intervalo con reduceat; los intervalos vacíos dan NaN
+    """
+    values = values[bounds[0]:bounds[-1]]
+    bounds = bounds - bounds[0]
+    starts, stops = bounds[:-1], bounds[1:]
+    out = np.full(len(starts), np.nan)
+    nonempty = stops > starts
+    if nonempty.any():
+        # Los intervalos vacíos tienen ancho cero, así que cada intervalo no vacío
+        # termina justo donde empieza el siguiente y reduceat es exacto
+        out[nonempty] = ufunc.reduceat(values, starts[nonempty])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def check_rollups(weeks=8):
+    """
+    Alimenta un histórico con `weeks` semanas de registros a 1 Hz, día a día, y mide
+    los agregados: con ROLLUP_RETENTION su tamaño deja de crecer
+    :return: Lista de (día, filas por resolución, MB de los agregados)
+    """
+    history = History(retention=86400)
+    start = time.time() - weeks * 7 * 86400
+    sizes = []
+    for day in range(weeks * 7):
+        records = np.zeros(86400, record.RECORD_DTYPE)
+        records['wall_ns'] = ((start + day * 86400 + np.arange(86400)) * 1e9).astype(np.int64)
+        records['temperature_raw'] = 20
+        history.extend(records)
+        rows = {res: rollup.columns.n for res, rollup in history.rollups.items()}
+        size = sum(col.nbytes for rollup in history.rollups.values() for col in rollup.columns.cols.values())
+        sizes.append((day + 1, rows, size / 2**20))
+    return sizes
+
+
+def main():
+    """
+    Función principal para pruebas con una semana de datos simulados
+    """
+    history = History()
+    now = time.time()
+    start = now - 7 * 86400
+    rng = np.random.default_rng(0)
+    print("Generando una semana de lecturas simuladas...")
+    for k, ts in enumerate(np.arange(start, now, 1.0)):
+        history.put({
+            'timestamp': ts,
+            'temperature': 20 + 5 * np.sin(k / 13751),
+            'humidity': 50 + rng.normal(),
+            'wind_speed': abs(rng.normal(10, 5)),
+            'light_level': 50.0,
+            'is_raining': (k // 3600) % 7 == 0,
+        })
+
+    end = now - now % 3600
+    for step in (None, 60, 3600):
+        t0 = time.perf_counter()
+        result = history.query(end - 86400, end, fields=('wind_speed',),
+                               aggs=('max', 'mean'), step=step)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"step={step}: {len(result['ts'])} intervalos, resolución {result['resolution']} s, "
+              f"{elapsed:.2f} ms, máx viento {np.nanmax(result['wind_speed']['max']):.1f} km/h, "
+              f"lluvia {result['rain_s'].sum() / 60:.0f} min")
+
+    size = sum(col.nbytes for col in history.raw.cols.values())
+    print(f"Memoria cruda: {size / 2**20:.0f} MB ({size / len(history):.0f} B por lectura con la capacidad libre)")
+
+    sizes = check_rollups()
+    for day, rows, size in sizes[27::28]:
+        print(f"Agregados tras {day} días: {rows} filas, {size:.1f} MB")
+    bounded = all(rows[res] <= 2 * ROLLUP_RETENTION[res] // res for res in RESOLUTIONS for _, rows, _ in sizes)
+    print(f"Agregados acotados por la retención: {'correcto' if bounded else 'INCORRECTO'}")
+
+    # Recalibrar: otra versión del perfil sobre los mismos datos crudos
+    v2 = calibration.profiles().active().derive(2, 'Copas de 10 cm', radius_m=0.1)
+    for profile in (None, v2, v2):
+        t0 = time.perf_counter()
+        data = history.slice(start, now, fields=('wind_speed',), profile=profile)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"perfil {calibration.get(profile).version}: {len(data['ts'])} filas en {elapsed:.1f} ms, "
+              f"viento medio {np.nanmean(data['wind_speed']):.2f} km/h")
+
+    # La caché por bloques da lo mismo que calibrar las filas crudas directamente
+    i, j = np.searchsorted(history.raw['ts'], [start, now])
+    direct = v2.apply('wind_speed', history.raw['wind_edges'][i:j].astype(float))
+    same = np.array_equal(history.slice(start, now, fields=('wind_speed',), profile=v2)['wind_speed'],
+                          direct, equal_nan=True)
+    print(f"Caché de calibración: {len(history.calibrated)} bloques, {'correcto' if same else 'INCORRECTO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -160,8 +160,7 @@ def main():
         
         print("\nMonitoreando luz ambiental. Presiona Ctrl+C para salir.")
         print("Actualizando cada segundo...")
-        print("\nFecha/Hora            | Hora  | Luz % | Momento del día      | Temp Color
- | RGB")
+        print("\nFecha/Hora            | Hora  | Luz % | Momento del día      | Temp Color | RGB")
         print("-" * 90)
         
         while True:
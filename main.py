@@ -1,15 +1,37 @@
 import time
-import board
-import busio
-import lgpio
-import adafruit_dht
-import adafruit_tcs34725
-from datetime import datetime
+try:
+    import board
+    import busio
+    import lgpio
+    import adafruit_dht
+    import adafruit_tcs34725
+except ImportError:
+    # Sin hardware (p. ej. reproducción de trazas en un PC)
+    board = busio = lgpio = adafruit_dht = adafruit_tcs34725 = None
 import signal
 import sys
-import math
 import threading
+import os
+import socket
+import logging
 from collections import deque
+from uplink import Uplink
+from stream import StreamServer
+from history import History
+from gorilla import CompressedHistory
+from archive import DailyArchiver
+import derived
+from rain_log import RainEventLog
+import record
+from scheduler import FixedRateScheduler
+from sensor_trace import TraceWriter
+from adaptive import AdaptiveSampler
+from health import Health
+from charts import ChartData
+from alerts import AlertEngine, LogSink, WebhookSink, LcdBanner, load_rules
+import calibration
+import snapshot
+import station_log
 
 # Configuración LCD
 LCD_RS = 25
@@ -24,6 +46,56 @@ LCD_CMD = False
 LCD_LINE_1 = 0x80
 LCD_LINE_2 = 0xC0
 
+# Configuración de envío al colector central
+STATION_ID = os.environ.get('WEATHER_STATION_ID', socket.gethostname())
+UPLINK_URL = os.environ.get('WEATHER_UPLINK_URL')
+UPLINK_SPOOL = os.environ.get('WEATHER_UPLINK_SPOOL', 'spool')
+
+# Puerto del streaming SSE en vivo (0 para desactivarlo)
+SSE_PORT = int(os.environ.get('WEATHER_SSE_PORT', 8502))
+
+# Días de histórico comprimido en memoria para gráficas de semanas (0 para desactivarlo)
+COMPRESSED_HISTORY_DAYS = float(os.environ.get('WEATHER_COMPRESSED_DAYS', 0))
+# Días de histórico crudo en memoria (~50 B por lectura: 7 días a 1 Hz son ~30 MB; los
+# agregados por minuto/hora se conservan siempre). Con histórico comprimido basta un día
+HISTORY_RETENTION_DAYS = float(os.environ.get('WEATHER_HISTORY_DAYS', 1 if COMPRESSED_HISTORY_DAYS else 7))
+# Directorio de las particiones Parquet diarias (vacío para desactivarlo)
+ARCHIVE_DIR = os.environ.get('WEATHER_ARCHIVE_DIR', 'history')
+# Registro de episodios de lluvia (run-length)
+RAIN_LOG = os.environ.get('WEATHER_RAIN_LOG', 'rain_events.bin')
+
+# Periodo de muestreo en segundos y política ante desbordamientos ('skip' o 'catch_up')
+SAMPLE_PERIOD = float(os.environ.get('WEATHER_SAMPLE_PERIOD', 1.0))
+OVERRUN_POLICY = os.environ.get('WEATHER_OVERRUN_POLICY', 'skip')
+# Muestreo adaptativo: cada sensor baja su frecuencia mientras su señal está estable
+ADAPTIVE_SAMPLING = os.environ.get('WEATHER_ADAPTIVE', '0') == '1'
+
+# Fichero donde grabar las entradas crudas de los sensores para reproducirlas (replay.py)
+TRACE_PATH = os.environ.get('WEATHER_TRACE')
+
+# Conteo de flancos del anemómetro en un proceso propio fijado a un núcleo (wind_process.py)
+WIND_PROCESS = os.environ.get('WEATHER_WIND_PROCESS', '0') == '1'
+WIND_CPU = int(os.environ['WEATHER_WIND_CPU']) if 'WEATHER_WIND_CPU' in os.environ else None
+
+# Logging: debug inicial (conmutable en marcha con kill -USR1) y fichero opcional
+LOG_DEBUG = os.environ.get('WEATHER_DEBUG', '0') == '1'
+LOG_FILE = os.environ.get('WEATHER_LOG_FILE')
+
+# Reglas de alerta (JSON, formato de alerts.DEFAULT_RULES) y webhook opcional para enviarlas
+ALERT_RULES = os.environ.get('WEATHER_ALERT_RULES')
+ALERT_WEBHOOK = os.environ.get('WEATHER_ALERT_WEBHOOK')
+
+# Instantánea del estado para arrancar en caliente tras un reinicio (vacío para desactivarla),
+# cada cuántos segundos se guarda y cuántos segundos de estado se conservan
+CHECKPOINT_FILE = os.environ.get('WEATHER_CHECKPOINT', 'state.npz')
+CHECKPOINT_INTERVAL = float(os.environ.get('WEATHER_CHECKPOINT_INTERVAL', 60))
+CHECKPOINT_HORIZON = float(os.environ.get('WEATHER_CHECKPOINT_HORIZON', 3600))
+
+# Registro versionado de perfiles de calibración (se crea al añadir la primera versión)
+CALIBRATION_FILE = os.environ.get('WEATHER_CALIBRATION', 'calibration.json')
+
+log = logging.getLogger(__name__)
+
 def cleanup_gpio():
     """Limpia todos los recursos GPIO antes de iniciar"""
     try:
@@ -56,7 +128,7 @@ class LCD:
                 lgpio.gpio_claim_output(self.h, pin)
             self.lcd_init()
         except Exception as e:
-            print(f"Error LCD: {e}")
+            log.error("Error LCD: %s", e)
             raise
 
     def lcd_init(self):
@@ -103,15 +175,18 @@ class LCD:
         time.sleep(0.0005)
 
 class Anemometer:
-    def __init__(self, pin):
-        self.RADIO_METROS = 0.09
-        self.CAMBIOS_POR_VUELTA = 6
+    # Radio de las copas y cambios por vuelta: ver calibration.Profile
+    # Ventana en la que se cuentan los flancos para calcular la velocidad
+    WINDOW_NS = 1_000_000_000
+
+    def __init__(self, pin, recorder=None):
         self.pin = pin
+        self.recorder = recorder
         self.wind_count = 0
-        self.last_time = time.time()
         self.last_state = None
         self.running = True
-        self.current_speed = 0
+        # Instantes (monotónico ns) de los flancos recientes
+        self.edges = deque(maxlen=10000)
         self.lock = threading.Lock()
         
         try:
@@ -125,45 +200,65 @@ class Anemometer:
             self.monitor_thread.start()
             
         except Exception as e:
-            print(f"Error Anemómetro: {e}")
+            log.error("Error Anemómetro: %s", e)
             raise
     
+    def read_pin(self):
+        return lgpio.gpio_read(self.h, self.pin)
+
     def _monitor_rotation(self):
-        last_calculation = time.time()
-        local_count = 0
-        
         while self.running:
-            current_state = lgpio.gpio_read(self.h, self.pin)
+            current_state = self.read_pin()
             if current_state != self.last_state:
+                # Reloj monotónico: los cambios de hora del sistema no distorsionan los intervalos
+                edge_time = time.monotonic_ns()
                 with self.lock:
-                    local_count += 1
+                    self.edges.append(edge_time)
                     self.wind_count += 1
+                if self.recorder:
+                    self.recorder.edge(edge_time, current_state)
                 self.last_state = current_state
             
-            current_time = time.time()
-            if current_time - last_calculation >= 1.0:
-                with self.lock:
-                    vueltas = local_count / self.CAMBIOS_POR_VUELTA
-                    omega = (vueltas * 2 * math.pi) / (current_time - last_calculation)
-                    velocidad_ms = omega * self.RADIO_METROS
-                    velocidad_kmh = velocidad_ms * 3.6
-                    
-                    if velocidad_kmh < 1:
-                        velocidad_kmh = 0
-                    
-                    self.current_speed = round(velocidad_kmh, 1)
-                    local_count = 0
-                last_calculation = current_time
-            
             time.sleep(0.001)
     
-    def get_reading(self):
+    def edges_per_s(self, changes):
+        """
+        Valor crudo que se guarda: flancos por segundo en la ventana
+        """
+        return changes / (self.WINDOW_NS / 1e9)
+
+    def speed_kmh(self, changes):
+        """
+        Velocidad a partir de los cambios contados en la ventana con el perfil de
+        calibración activo: ω = θ / t [rad/s], v = ω × r [m/s]
+        """
+        return round(float(calibration.active().apply('wind_speed', self.edges_per_s(changes))), 1)
+    
+    def _changes_in_window(self, now):
+        # Flancos en (now - ventana, now]; los flancos están ordenados en el tiempo
+        changes = 0
+        for edge_time in reversed(self.edges):
+            if edge_time <= now - self.WINDOW_NS:
+                break
+            if edge_time <= now:
+                changes += 1
+        return changes
+    
+    def get_reading(self, mono_ns=None):
+        """
+        Velocidad en la ventana de 1 s que termina en `mono_ns` (por defecto, ahora)
+        """
+        now = mono_ns if mono_ns is not None else time.monotonic_ns()
         with self.lock:
-            return {
-                'timestamp': datetime.now().isoformat(),
-                'wind_speed': self.current_speed,
-                'wind_speed_ms': round(self.current_speed / 3.6, 2)
-            }
+            changes = self._changes_in_window(now)
+            if self.recorder:
+                self.recorder.wind(now, self.wind_count)
+        speed = self.speed_kmh(changes)
+        return {
+            'wind_speed': speed,
+            'wind_speed_ms': round(speed / 3.6, 2),
+            'wind_edges': self.edges_per_s(changes)
+        }
     
     def cleanup(self):
         self.running = False
@@ -173,49 +268,82 @@ class Anemometer:
             lgpio.gpiochip_close(self.h)
 
 class RainSensor:
-    def __init__(self, pin):
+    def __init__(self, pin, log_path=None, recorder=None):
         self.pin = pin
+        self.recorder = recorder
+        # Episodios de lluvia (inicio, fin, confianza) en lugar de un booleano por muestra
+        self.events = RainEventLog(log_path)
         try:
             self.h = lgpio.gpiochip_open(0)
             lgpio.gpio_claim_input(self.h, self.pin, lgpio.SET_PULL_UP)
         except Exception as e:
-            print(f"Error Sensor de lluvia: {e}")
+            log.error("Error Sensor de lluvia: %s", e)
             raise
 
-    def get_reading(self):
+    def read_samples(self):
         samples = []
         for _ in range(5):
             samples.append(lgpio.gpio_read(self.h, self.pin))
             time.sleep(0.1)
-        return {'is_raining': sum(samples) < len(samples)/2}
+        return samples
+
+    def get_reading(self, ts=None, interval=None):
+        """
+        :param interval: Intervalo de muestreo adaptativo actual del sensor (None si fijo)
+        """
+        samples = self.read_samples()
+        if self.recorder:
+            self.recorder.rain(time.monotonic_ns(), samples)
+        # El sensor da 0 cuando está mojado
+        wetness = 1 - sum(samples) / len(samples)
+        is_raining = wetness > 0.5
+        self.events.update(ts if ts is not None else time.time(), is_raining, wetness, interval)
+        return {'is_raining': is_raining, 'wetness': wetness}
 
     def cleanup(self):
+        self.events.cleanup()
         if hasattr(self, 'h'):
             lgpio.gpio_free(self.h, self.pin)
             lgpio.gpiochip_close(self.h)
 
 class DHT11:
-    def __init__(self, pin):
+    # Lectura fallida: sin datos, nunca 0 °C / 0 % (ver health.py)
+    NO_DATA = {'temperature': None, 'humidity': None, 'temperature_raw': None, 'humidity_raw': None,
+               'status': 'error'}
+
+    def __init__(self, pin, recorder=None):
+        self.recorder = recorder
         try:
             self.device = adafruit_dht.DHT11(getattr(board, f'D{pin}'))
             time.sleep(1)
         except Exception as e:
-            print(f"Error DHT11: {e}")
+            log.error("Error DHT11: %s", e)
             raise
 
+    def read_raw(self):
+        return self.device.temperature, self.device.humidity
+
     def get_reading(self):
         try:
-            return {
-                'temperature': self.device.temperature,
-                'humidity': self.device.humidity,
-                'status': 'success'
-            }
-        except:
-            return {
-                'temperature': 0,
-                'humidity': 0,
-                'status': 'error'
-            }
+            temperature, humidity = self.read_raw()
+        except Exception as e:
+            log.warning("Error en lectura del DHT11: %s", e)
+            if self.recorder:
+                self.recorder.dht(time.monotonic_ns(), None)
+            return dict(self.NO_DATA)
+        if self.recorder:
+            self.recorder.dht(time.monotonic_ns(), (temperature, humidity))
+        if temperature is None or humidity is None:
+            return dict(self.NO_DATA)
+        # Se guarda el valor crudo; el calibrado es para mostrar y vigilar
+        profile = calibration.active()
+        return {
+            'temperature': round(float(profile.apply('temperature', temperature)), 1),
+            'humidity': round(float(profile.apply('humidity', humidity)), 1),
+            'temperature_raw': temperature,
+            'humidity_raw': humidity,
+            'status': 'success'
+        }
 
     def cleanup(self):
         try:
@@ -224,7 +352,11 @@ class DHT11:
             pass
 
 class LightSensor:
-    def __init__(self):
+    # Lectura fallida: sin datos en lugar de ceros
+    NO_DATA = {'light_level': None, 'clear': None, 'momento': "Error", 'rgb_values': None}
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
         try:
             i2c = busio.I2C(board.SCL, board.SDA)
             self.sensor = adafruit_tcs34725.TCS34725(i2c)
@@ -237,16 +369,21 @@ class LightSensor:
             time.sleep(0.5)  # Tiempo de estabilización
             
         except Exception as e:
-            print(f"Error Sensor de luz: {e}")
+            log.error("Error Sensor de luz: %s", e)
             raise
 
+    def read_raw(self):
+        return self.sensor.color_raw
+
     def get_reading(self):
         try:
             # Obtener valores RGB y Clear raw
-            r, g, b, c = self.sensor.color_raw
+            r, g, b, c = self.read_raw()
+            if self.recorder:
+                self.recorder.light(time.monotonic_ns(), (r, g, b, c))
             
-            # Calcular intensidad de luz en lux (aproximada)
-            lux = min(100, (c / 65535) * 100)
+            # Calcular intensidad de luz (aproximada) con el perfil de calibración activo
+            lux = float(calibration.active().apply('light_level', c))
             
             # Calcular porcentajes RGB relativos al total
             total = r + g + b
@@ -262,6 +399,7 @@ class LightSensor:
             
             return {
                 'light_level': round(lux, 1),
+                'clear': c,
                 'momento': f"Luz: {intensidad}",
                 'rgb_values': {
                     'red': round(r_percent, 1),
@@ -274,20 +412,10 @@ class LightSensor:
                 }
             }
         except Exception as e:
-            print(f"Error en lectura del sensor: {e}")
-            return {
-                'light_level': 0,
-                'momento': "Error",
-                'rgb_values': {
-                    'red': 0,
-                    'green': 0,
-                    'blue': 0,
-                    'clear': 0,
-                    'raw_r': 0,
-                    'raw_g': 0,
-                    'raw_b': 0
-                }
-            }
+            log.warning("Error en lectura del sensor de luz: %s", e)
+            if self.recorder:
+                self.recorder.light(time.monotonic_ns(), None)
+            return dict(self.NO_DATA)
 
     def print_debug(self):
         """
@@ -295,6 +423,9 @@ class LightSensor:
         """
         reading = self.get_reading()
         rgb = reading['rgb_values']
+        if rgb is None:
+            print("Lectura del sensor fallida")
+            return
         print(f"""
 Lectura del sensor:
 ------------------
@@ -314,45 +445,121 @@ Valores raw:
 """)
 
 class WeatherStation:
-    def __init__(self):
+    def __init__(self, sensors=None, consumers=None, recorder=None, sampler=None, alert_sinks=None,
+                 history_retention=None, clock=time.monotonic_ns):
+        """
+        :param sensors: dict con 'anemometer', 'rain', 'temperature' y 'light' para usar
+                        otros sensores (p. ej. replay.py); por defecto, el hardware con LCD
+        :param consumers: Consumidores de lecturas; por defecto, según la configuración
+        :param alert_sinks: Destinos de las alertas; por defecto, log, LCD y webhook según
+                            la configuración con el hardware, y ninguno con `sensors`
+        :param recorder: TraceWriter para grabar las entradas crudas de los sensores
+        :param sampler: AdaptiveSampler para muestrear cada sensor a frecuencia variable
+        :param history_retention: Segundos de histórico crudo; por defecto, WEATHER_HISTORY_DAYS
+        :param clock: Reloj monotónico en ns de los ticks (el del planificador), con el que se
+                      fechan las capturas
+        """
         try:
-            print("Iniciando sensores...")
-            self.lcd = LCD()
-            self.lcd.lcd_string("Iniciando", LCD_LINE_1)
-            self.lcd.lcd_string("Sensores...", LCD_LINE_2)
-            
-            self.anemometer = Anemometer(pin=17)
-            self.rain_sensor = RainSensor(pin=27)
-            self.temp_sensor = DHT11(pin=22)
-            self.light_sensor = LightSensor()
+            self.recorder = recorder
+            self.clock = clock
+            self.sampler = sampler
+            # Última lectura tomada de cada sensor y su instante de captura (epoch s)
+            self.sampled = {}
+            self.captured = {}
+            self.lcd = None
+            hardware = sensors is None
+            if hardware:
+                log.info("Iniciando sensores...")
+                self.lcd = LCD()
+                self.lcd.lcd_string("Iniciando", LCD_LINE_1)
+                self.lcd.lcd_string("Sensores...", LCD_LINE_2)
+                
+                sensors = {
+                    'anemometer': self._anemometer(17, recorder),
+                    'rain': RainSensor(pin=27, log_path=RAIN_LOG, recorder=recorder),
+                    'temperature': DHT11(pin=22, recorder=recorder),
+                    'light': LightSensor(recorder=recorder),
+                }
+            self.anemometer = sensors['anemometer']
+            self.rain_sensor = sensors['rain']
+            self.temp_sensor = sensors['temperature']
+            self.light_sensor = sensors['light']
             
             # Buffer para datos históricos
             self.data_buffer = deque(maxlen=1000)
+            # Histórico columnar indexado por tiempo para consultas por rango
+            if history_retention is None:
+                history_retention = HISTORY_RETENTION_DAYS * 86400
+            self.history = History(retention=history_retention)
+            # Semanas de lecturas comprimidas (~1 B por muestra y campo) para los rangos largos
+            self.long_history = None
+            if COMPRESSED_HISTORY_DAYS:
+                self.long_history = CompressedHistory(retention=COMPRESSED_HISTORY_DAYS * 86400)
+            # Series reducidas a un punto por píxel para las gráficas de tendencia
+            self.charts = ChartData(self.history, long_history=self.long_history)
+            # Grados-día del día en curso
+            self.degree_days = derived.DegreeDays()
+            # Calidad por campo y espera de los sensores que fallan
+            self.health = Health()
+            # Alertas evaluadas en streaming sobre cada lectura
+            if alert_sinks is None:
+                alert_sinks = []
+                if hardware:
+                    alert_sinks += [LogSink(), LcdBanner()]
+                    if ALERT_WEBHOOK:
+                        alert_sinks.append(WebhookSink(ALERT_WEBHOOK))
+            self.banner = next((sink for sink in alert_sinks if isinstance(sink, LcdBanner)), LcdBanner())
+            self.alerts = AlertEngine(load_rules(ALERT_RULES) if ALERT_RULES else None, alert_sinks)
             
-            self.lcd.lcd_string("Estacion Meteo", LCD_LINE_1)
-            self.lcd.lcd_string("Iniciada!", LCD_LINE_2)
-            time.sleep(2)
+            # Consumidores de lecturas (envío, streaming, ...); put() no debe bloquear
+            if consumers is None:
+                consumers = []
+                if UPLINK_URL:
+                    consumers.append(Uplink(UPLINK_URL, STATION_ID, spool_dir=UPLINK_SPOOL))
+                if SSE_PORT:
+                    consumers.append(StreamServer(port=SSE_PORT))
+                if ARCHIVE_DIR:
+                    consumers.append(DailyArchiver(ARCHIVE_DIR))
+            self.consumers = consumers
             
-            # Iniciar hilo de actualización de LCD
             self.lcd_thread_running = True
             self.current_readings = None
-            self.lcd_thread = threading.Thread(target=self._update_lcd)
-            self.lcd_thread.daemon = True
-            self.lcd_thread.start()
+            self.current_record = None
+            if self.lcd:
+                self.lcd.lcd_string("Estacion Meteo", LCD_LINE_1)
+                self.lcd.lcd_string("Iniciada!", LCD_LINE_2)
+                time.sleep(2)
+                
+                # Iniciar hilo de actualización de LCD
+                self.lcd_thread = threading.Thread(target=self._update_lcd)
+                self.lcd_thread.daemon = True
+                self.lcd_thread.start()
             
         except Exception as e:
-            print(f"Error iniciando estación: {e}")
+            log.error("Error iniciando estación: %s", e)
             raise
 
     def _update_lcd(self):
         display_index = 0
         while self.lcd_thread_running:
-            if self.current_readings:
+            banner = self.banner.current()
+            if banner:
+                # Una alerta reciente tiene prioridad sobre la rotación
+                try:
+                    self.lcd.lcd_string(banner[:LCD_WIDTH], LCD_LINE_1)
+                    self.lcd.lcd_string(banner[LCD_WIDTH:2 * LCD_WIDTH], LCD_LINE_2)
+                except Exception as e:
+                    log.warning("Error en LCD: %s", e)
+                time.sleep(3)
+            elif self.current_readings:
                 try:
                     if display_index == 0:
                         # Temperatura y Humedad
-                        self.lcd.lcd_string(f"Temp: {self.current_readings['temperature']}C", LCD_LINE_1)
-                        self.lcd.lcd_string(f"Hum: {self.current_readings['humidity']}%", LCD_LINE_2)
+                        # Sin dato (sensor fallando) se muestra '--'
+                        temperature = self.current_readings['temperature']
+                        humidity = self.current_readings['humidity']
+                        self.lcd.lcd_string(f"Temp: {'--' if temperature is None else temperature}C", LCD_LINE_1)
+                        self.lcd.lcd_string(f"Hum: {'--' if humidity is None else humidity}%", LCD_LINE_2)
                     elif display_index == 1:
                         # Viento y Lluvia
                         self.lcd.lcd_string(f"Viento: {self.current_readings['wind_speed']}km/h", LCD_LINE_1)
@@ -367,77 +574,213 @@ class WeatherStation:
                     display_index = (display_index + 1) % 3
                     time.sleep(3)
                 except Exception as e:
-                    print(f"Error en LCD: {e}")
+                    log.warning("Error en LCD: %s", e)
                     time.sleep(1)
             else:
                 time.sleep(0.1)
 
-    def get_readings(self):
-        """Obtiene lecturas de todos los sensores"""
-        temp_data = self.temp_sensor.get_reading()
-        wind_data = self.anemometer.get_reading()
-        rain_data = self.rain_sensor.get_reading()
-        light_data = self.light_sensor.get_reading()
+    @staticmethod
+    def _anemometer(pin, recorder):
+        if not WIND_PROCESS:
+            return Anemometer(pin=pin, recorder=recorder)
+        # Import diferido: wind_process importa este módulo
+        from wind_process import ProcessAnemometer
+        return ProcessAnemometer(pin=pin, recorder=recorder, cpu=WIND_CPU)
+
+    def _timed(self, ts, mono_ns, read):
+        # Captura a mitad de la lectura, contada desde el plazo del tick (mono_ns, al que
+        # corresponde ts): si el planificador despertó tarde, el retraso también cuenta
+        start = self.clock()
+        data = read()
+        return data, ts + ((start + self.clock()) / 2 - mono_ns) / 1e9
+
+    def _poll(self, sensor, now, source):
+        # Un sensor en espera por fallos repetidos no se lee y no consume tiempo del bucle
+        if not self.health.due(sensor, now):
+            return dict(source.NO_DATA)
+        data = source.get_reading()
+        self.health.report(sensor, now, data)
+        return data
+
+    def get_readings(self, tick=None):
+        """Obtiene lecturas de todos los sensores
+        :param tick: (monotónico ns, pared ns) del planificador; por defecto se toma ahora
+        :return: Lecturas, o None si con muestreo adaptativo no tocaba muestrear nada
+        """
+        # Una sola muestra de reloj (monotónico + pared) por tick; el texto de la
+        # hora solo se genera al mostrarla (record.format_timestamp)
+        mono_ns, wall_ns = tick if tick is not None else record.tick()
+        if self.recorder:
+            self.recorder.tick(mono_ns, wall_ns)
+        ts = wall_ns / 1e9
+        now = mono_ns / 1e9
+        sampler = self.sampler
+        # Barato: solo cuenta los flancos que ya detectó el hilo del anemómetro
+        wind_data = self.anemometer.get_reading(mono_ns)
+        
+        due = {'temperature', 'wind', 'rain', 'light'}
+        if sampler:
+            sampler.ticks += 1
+            # Un cambio en el viento (p. ej. aparecen flancos) fuerza frecuencia máxima
+            last_wind = self.sampled.get('wind')
+            if last_wind is not None and wind_data['wind_speed'] != last_wind['wind_speed']:
+                sampler.trigger('wind', now)
+            due = {name for name in due if name not in self.sampled or sampler.due(name, now)}
+            if not due:
+                return None
+        
+        # Cada sensor con su propio instante de captura: no se fuerzan lecturas simultáneas
+        if 'temperature' in due:
+            self.sampled['temperature'], self.captured['temperature'] = self._timed(
+                ts, mono_ns, lambda: self._poll('temperature', now, self.temp_sensor))
+        if 'wind' in due:
+            # Ventana de 1 s que termina en el tick: se fecha en su centro
+            self.sampled['wind'] = wind_data
+            self.captured['wind'] = ts - self.anemometer.WINDOW_NS / 2e9
+        if 'rain' in due:
+            self.sampled['rain'], self.captured['rain'] = self._timed(
+                ts, mono_ns, lambda: self.rain_sensor.get_reading(
+                    ts, sampler.intervals()['rain'] if sampler else None))
+        if 'light' in due:
+            self.sampled['light'], self.captured['light'] = self._timed(
+                ts, mono_ns, lambda: self._poll('light', now, self.light_sensor))
+        temp_data = self.sampled['temperature']
+        wind_data = self.sampled['wind']
+        rain_data = self.sampled['rain']
+        light_data = self.sampled['light']
         
         readings = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': ts,
+            'mono_ns': mono_ns,
             'temperature': temp_data['temperature'],
             'humidity': temp_data['humidity'],
             'wind_speed': wind_data['wind_speed'],
             'is_raining': rain_data['is_raining'],
+            'wetness': rain_data['wetness'],
             'light_level': light_data['light_level'],
             'momento': light_data['momento'],
-            'rgb_values': light_data.get('rgb_values')
+            'rgb_values': light_data.get('rgb_values'),
+            # Valores crudos que se almacenan y versión de calibración con la que se muestran
+            'temperature_raw': temp_data.get('temperature_raw'),
+            'humidity_raw': temp_data.get('humidity_raw'),
+            'wind_edges': wind_data.get('wind_edges'),
+            'clear': light_data.get('clear'),
+            'profile': calibration.active().version,
+            'captured': dict(self.captured),
         }
+        # Código de calidad por campo; los valores fuera de rango no se guardan
+        readings['quality'] = self.health.check(readings, now)
+        for field, raw in calibration.RAW_FIELDS.items():
+            if readings[field] is None:
+                readings[raw] = None
+        # Magnitudes derivadas (punto de rocío, índice de calor, sensación térmica...)
+        readings.update(derived.derive(readings))
+        readings.update(self.degree_days.update(ts, readings['temperature']))
+        
+        if sampler:
+            values = {
+                'temperature': (readings['temperature'], readings['humidity']),
+                'wind': readings['wind_speed'],
+                'rain': readings['wetness'],
+                'light': readings['light_level'],
+            }
+            for name in due:
+                sampler.update(name, now, values[name])
+            # Intervalo efectivo de cada sensor junto a los datos
+            readings['sample_intervals'] = sampler.intervals()
+            readings['rates'] = sampler.encode()
+        
+        # Registro binario canónico que comparten almacenamiento, IPC y envío
+        rec = record.from_reading(readings, mono_ns, wall_ns)
+        if self.recorder:
+            self.recorder.output(mono_ns, rec.tobytes())
         
         self.current_readings = readings
+        self.current_record = rec
         self.data_buffer.append(readings)
+        self.history.put(readings)
+        if self.long_history is not None:
+            self.long_history.put(readings)
+        self.alerts.put(readings)
+        for consumer in self.consumers:
+            consumer.put(readings, rec)
         return readings
 
     def cleanup(self):
         try:
             self.lcd_thread_running = False
-            time.sleep(0.2)
-            
-            self.lcd.lcd_string("Apagando...", LCD_LINE_1)
-            self.lcd.lcd_string("", LCD_LINE_2)
-            time.sleep(1)
+            if self.lcd:
+                time.sleep(0.2)
+                
+                self.lcd.lcd_string("Apagando...", LCD_LINE_1)
+                self.lcd.lcd_string("", LCD_LINE_2)
+                time.sleep(1)
             
             self.anemometer.cleanup()
             self.rain_sensor.cleanup()
             self.temp_sensor.cleanup()
-            lgpio.gpiochip_close(self.lcd.h)
+            for consumer in self.consumers:
+                consumer.cleanup()
+            self.alerts.cleanup()
+            if self.recorder:
+                self.recorder.close()
+            if self.lcd:
+                lgpio.gpiochip_close(self.lcd.h)
         except:
             pass
 
+def _terminate(signum, frame):
+    log.info("Señal %d recibida, deteniendo la estación", signum)
+    sys.exit(0)
+
 def main():
+    station_log.setup(debug=LOG_DEBUG, path=LOG_FILE)
+    calibration.load(CALIBRATION_FILE)
+    log.info("Calibración: perfil v%d", calibration.active().version)
+    # systemctl stop / docker stop envían SIGTERM: salir por el finally para guardar
+    # la última instantánea y liberar los sensores
+    signal.signal(signal.SIGTERM, _terminate)
     try:
         # Limpiar GPIO antes de iniciar
-        print("Limpiando GPIO...")
+        log.info("Limpiando GPIO...")
         cleanup_gpio()
         
-        # Inicializar estación
-        station = WeatherStation()
-        print("Estación iniciada correctamente")
+        # Inicializar estación (grabando las entradas crudas si se pidió una traza)
+        recorder = TraceWriter(TRACE_PATH) if TRACE_PATH else None
+        sampler = AdaptiveSampler(SAMPLE_PERIOD) if ADAPTIVE_SAMPLING else None
+        station = WeatherStation(recorder=recorder, sampler=sampler)
+        if CHECKPOINT_FILE:
+            snapshot.restore(station, CHECKPOINT_FILE, CHECKPOINT_HORIZON)
+            station.consumers.append(snapshot.Checkpointer(
+                station, CHECKPOINT_FILE, CHECKPOINT_INTERVAL, CHECKPOINT_HORIZON))
+        log.info("Estación iniciada correctamente")
         
-        # Bucle principal
-        while True:
-            readings = station.get_readings()
-            # Debug de valores RGB
+        # Bucle principal a periodo fijo: los timestamps caen en una rejilla regular
+        scheduler = FixedRateScheduler(SAMPLE_PERIOD, policy=OVERRUN_POLICY)
+        for tick in scheduler:
+            readings = station.get_readings(tick)
+            if readings is None:
+                continue
+            # Debug de valores RGB (formateado solo si el debug está activo)
             if readings['rgb_values']:
                 rgb = readings['rgb_values']
-                print(f"\nLuz: {readings['light_level']}% | R:{rgb['red']}% G:{rgb['green']}% B:{rgb['blue']}%")
-            time.sleep(1)
+                log.debug("Luz: %s%% | R:%s%% G:%s%% B:%s%%",
+                          readings['light_level'], rgb['red'], rgb['green'], rgb['blue'])
             
     except KeyboardInterrupt:
-        print("\nPrograma interrumpido por el usuario")
+        log.info("Programa interrumpido por el usuario")
     except Exception as e:
-        print(f"\nError: {e}")
+        log.error("Error: %s", e)
     finally:
+        if 'scheduler' in locals():
+            log.info("Planificador: %s", scheduler.stats())
         if 'station' in locals():
+            log.info("Calidad de sensores: %s", station.health.stats())
+            log.info("Alertas: %s", station.alerts.stats())
             station.cleanup()
         cleanup_gpio()
-        print("Programa finalizado")
+        log.info("Programa finalizado")
+        station_log.shutdown()
 
 if __name__ == "__main__":
     main()
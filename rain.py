@@ -4,15 +4,18 @@ import atexit
 from datetime import datetime
 import signal
 import sys
+from rain_log import RainEventLog
 
 class RainSensor:
-    def __init__(self, pin):
+    def __init__(self, pin, log_path=None):
         """
         Inicializa el sensor de lluvia YL-83
         :param pin: Pin GPIO para la señal digital
+        :param log_path: Fichero del registro de episodios de lluvia (None = solo memoria)
         """
         self.pin = pin
         self.last_reading = None
+        self.events = RainEventLog(log_path)
         
         try:
             # Inicializar la conexión con el chip GPIO
@@ -53,7 +56,9 @@ class RainSensor:
                 time.sleep(0.1)
             
             # Si la mayoría de las muestras son 0, está lloviendo
-            is_raining = sum(samples) < len(samples)/2
+            wetness = 1 - sum(samples) / len(samples)
+            is_raining = wetness > 0.5
+            self.events.update(time.time(), is_raining, wetness)
             
             # Determinar el estado basado en las muestras
             if is_raining:
@@ -68,6 +73,7 @@ class RainSensor:
                 'is_raining': is_raining,
                 'rain_status': rain_status,
                 'rain_code': rain_code,
+                'wetness': wetness,
                 'raw_value': samples[-1]  # Último valor leído
             }
             
@@ -83,6 +89,7 @@ class RainSensor:
         Limpia los recursos GPIO
         """
         try:
+            self.events.cleanup()
             if hasattr(self, 'h'):
                 lgpio.gpio_free(self.h, self.pin)
                 lgpio.gpiochip_close(self.h)
@@ -97,7 +104,7 @@ def main():
     rain_sensor = None
     try:
         # Usar GPIO27 (ajusta según tu conexión)
-        rain_sensor = RainSensor(pin=27)
+        rain_sensor = RainSensor(pin=27, log_path='rain_events.bin')
         
         print("\nMonitoreando lluvia. Presiona Ctrl+C para salir.")
         print("Códigos de estado:")
@@ -110,6 +117,9 @@ def main():
                 print(f"\nEstado: {reading['rain_status']}")
                 print(f"Código: {reading['rain_code']}")
                 print(f"Valor raw: {reading['raw_value']}")
+                last_rain = rain_sensor.events.last_rain()
+                if last_rain:
+                    print(f"Última lluvia: {datetime.fromtimestamp(last_rain).strftime('%H:%M:%S')}")
                 
             time.sleep(1)
             
@@ -0,0 +1,191 @@
+import os
+import time
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+
+# inicio (epoch s), fin (epoch s), confianza media de humedad (0-1)
+EVENT_FORMAT = struct.Struct('<ddf')
+
+
+class RainEventLog:
+    def __init__(self, path=None, max_gap=60.0):
+        """
+        Registro de episodios de lluvia codificados por rachas (run-length)
+        :param path: Fichero binario donde se añaden los episodios cerrados (None = solo memoria)
+        :param max_gap: Segundos sin muestras tras los que se cierra un episodio abierto,
+                        además del intervalo de muestreo previsto (ver update)
+        """
+        self.path = path
+        self.max_gap = max_gap
+        self.starts = []
+        self.ends = []
+        self.confidence = []
+        # Duraciones acumuladas: cumulative[i] = suma de duraciones de los episodios < i
+        self.cumulative = [0.0]
+        self.lock = threading.Lock()
+
+        # Episodio abierto: [inicio, última muestra, suma de humedad, muestras]
+        self.open = None
+        self.last_ts = None
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % EVENT_FORMAT.size
+        for start, end, confidence in EVENT_FORMAT.iter_unpack(data[:usable]):
+            self._append(start, end, confidence)
+
+    def _append(self, start, end, confidence):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.confidence.append(confidence)
+        self.cumulative.append(self.cumulative[-1] + end - start)
+
+    def _close(self, end):
+        start, _, wet_sum, samples = self.open
+        self.open = None
+        confidence = wet_sum / samples
+        self._append(start, end, confidence)
+        if self.path:
+            with open(self.path, 'ab') as f:
+                f.write(EVENT_FORMAT.pack(start, end, confidence))
+
+    def update(self, ts, is_raining, wetness=None, interval=None):
+        """
+        Registra una muestra; solo se escribe algo al cerrar un episodio
+        :param ts: Timestamp epoch de la muestra
+        :param is_raining: Estado de lluvia decidido por el sensor
+        :param wetness: Fracción de submuestras mojadas (0-1), confianza del estado
+        :param interval: Intervalo de muestreo con el que se tomó esta muestra (muestreo
+                         adaptativo); el hueco tolerado es max_gap más este intervalo
+        """
+        if wetness is None:
+            wetness = 1.0 if is_raining else 0.0
+        max_gap = self.max_gap + (interval or 0.0)
+        with self.lock:
+            if self.open is not None and ts - self.open[1] > max_gap:
+                # Hueco sin datos: el episodio termina en la última muestra vista
+                self._close(self.open[1])
+            if is_raining:
+                if self.open is None:
+                    self.open = [ts, ts, 0.0, 0]
+                self.open[1] = ts
+                self.open[2] += wetness
+                self.open[3] += 1
+            elif self.open is not None:
+                self._close(ts)
+            self.last_ts = ts
+
+    def events(self, start=None, end=None):
+        """
+        Episodios (inicio, fin, confianza) que se solapan con [start, end)
+        """
+        with self.lock:
+            i = 0 if start is None else bisect_right(self.ends, start)
+            j = len(self.starts) if end is None else bisect_left(self.starts, end)
+            result = list(zip(self.starts[i:j], self.ends[i:j], self.confidence[i:j]))
+            if self.open is not None and (end is None or self.open[0] < end):
+                result.append((self.open[0], self.open[1], self.open[2] / self.open[3]))
+        return result
+
+    def rain_seconds(self, start, end):
+        """
+        Segundos de lluvia en [start, end) en O(log episodios)
+        """
+        with self.lock:
+            i = bisect_right(self.ends, start)
+            j = bisect_left(self.starts, end)
+            total = 0.0
+            if i < j:
+                total = self.cumulative[j] - self.cumulative[i]
+                # Recortar los episodios que sobresalen por los extremos
+                total -= max(0.0, start - self.starts[i])
+                total -= max(0.0, self.ends[j - 1] - end)
+            if self.open is not None:
+                total += max(0.0, min(end, self.open[1]) - max(start, self.open[0]))
+        return total
+
+    def rain_minutes(self, start, end):
+        return self.rain_seconds(start, end) / 60.0
+
+    def last_rain(self):
+        """
+        Timestamp de la última lluvia (ahora mismo si está lloviendo) o None
+        """
+        with self.lock:
+            if self.open is not None:
+                return self.open[1]
+            return self.ends[-1] if self.ends else None
+
+    def is_raining(self):
+        return self.open is not None
+
+    def cleanup(self):
+        """
+        Cierra el episodio abierto para no perderlo al apagar
+        """
+        with self.lock:
+            if self.open is not None:
+                self._close(self.last_ts)
+
+
+def check_adaptive(minutes=40):
+    """
+    Lluvia continua muestreada con el AdaptiveSampler real, que alarga el intervalo
+    del sensor de lluvia hasta su máximo: debe quedar un único episodio de la duración
+    de la lluvia
+    :return: Lista de episodios (inicio, fin, confianza)
+    """
+    from adaptive import AdaptiveSampler
+    sampler = AdaptiveSampler(base_period=1.0)
+    log = RainEventLog()
+    start = 1_000_000.0
+    for k in range(minutes * 60 + 1):
+        now = start + k
+        if sampler.due('rain', now):
+            log.update(now, True, 1.0, interval=sampler.intervals()['rain'])
+            sampler.update('rain', now, 1.0)
+    log.cleanup()
+    return log.events()
+
+
+def main():
+    """
+    Función principal para pruebas con un mes de lluvia simulada
+    """
+    import random
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'lluvia.bin')
+    log = RainEventLog(path)
+    random.seed(0)
+    now = time.time()
+    ts = now - 30 * 86400
+    raining = False
+    while ts < now:
+        if random.random() < 0.0005:
+            raining = not raining
+        log.update(ts, raining, 0.8 if raining else 0.0)
+        ts += 1.0
+    log.cleanup()
+
+    reloaded = RainEventLog(path)
+    t0 = time.perf_counter()
+    minutes = reloaded.rain_minutes(now - 7 * 86400, now)
+    elapsed = (time.perf_counter() - t0) * 1e6
+    print(f"{len(reloaded.starts)} episodios, {os.path.getsize(path)} bytes en disco")
+    print(f"Lluvia últimos 7 días: {minutes:.0f} min ({elapsed:.0f} µs)")
+    print(f"Última lluvia: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reloaded.last_rain()))}")
+
+    events = check_adaptive(40)
+    total = sum(end - start for start, end, _ in events) / 60
+    ok = len(events) == 1 and total >= 39
+    print(f"Lluvia continua con muestreo adaptativo: {len(events)} episodio(s), {total:.1f} min "
+          f"({'correcto' if ok else 'INCORRECTO'})")
+
+
+if __name__ == "__main__":
+    main()
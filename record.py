@@ -0,0 +1,192 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+import calibration
+from health import FIELDS as QUALITY_FIELDS, QUALITY_BITS, MISSING, RANGE, BACKOFF
+
+# Registro binario canónico de una lectura (48 bytes, little-endian).
+# Lo comparten el almacenamiento, la IPC y el envío: ninguna capa re-serializa.
+# Guarda valores crudos; la calibración (calibration.py) se aplica al leer.
+RECORD_DTYPE = np.dtype([
+    ('mono_ns', '<i8'),       # reloj monotónico del tick
+    ('wall_ns', '<i8'),       # reloj de pared del mismo tick (epoch ns)
+    ('temperature_raw', '<f4'),
+    ('humidity_raw', '<f4'),
+    ('wind_edges', '<f4'),    # flancos por segundo del anemómetro
+    ('profile', '<u2'),       # versión de calibración activa al capturar
+    ('reserved', '<u2'),
+    ('red', '<u2'),           # canales crudos del TCS34725 (clear da la luz)
+    ('green', '<u2'),
+    ('blue', '<u2'),
+    ('clear', '<u2'),
+    ('flags', '<u2'),         # ver FLAG_*
+    ('quality', '<u2'),       # 0 = todo correcto
+    ('momento', 'u1'),        # índice en MOMENTOS
+    ('wetness', 'u1'),        # fracción mojada del sensor de lluvia, 0-255
+    ('rates', '<u2'),         # intervalos de muestreo efectivos (ver adaptive.py)
+])
+assert RECORD_DTYPE.itemsize == 48
+
+FLAG_RAINING = 0x01
+
+MOMENTOS = ('', 'Luz: Baja', 'Luz: Media', 'Luz: Alta', 'Error')
+_MOMENTO_CODES = {name: code for code, name in enumerate(MOMENTOS)}
+
+
+def tick():
+    """
+    Única muestra de reloj por tick: (monotónico ns, pared ns)
+    """
+    return time.monotonic_ns(), time.time_ns()
+
+
+def _float(value):
+    return np.nan if value is None else value
+
+
+def from_reading(reading, mono_ns=0, wall_ns=None):
+    """
+    Empaqueta una lectura (dict) en un registro; el timestamp de pared se toma
+    de `wall_ns` o de reading['timestamp'] (epoch en segundos). Se guardan los
+    valores crudos; si la lectura solo trae los calibrados, se invierte el perfil.
+    """
+    if wall_ns is None:
+        ts = reading['timestamp']
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts).timestamp()
+        wall_ns = int(round(ts * 1e9))
+    rec = np.zeros(1, RECORD_DTYPE)[0]
+    rec['mono_ns'] = reading.get('mono_ns', mono_ns)
+    rec['wall_ns'] = wall_ns
+    profile = reading.get('profile')
+    rec['profile'] = calibration.active().version if profile is None else profile
+    rec['temperature_raw'] = _float(calibration.raw_value(reading, 'temperature', profile))
+    rec['humidity_raw'] = _float(calibration.raw_value(reading, 'humidity', profile))
+    rec['wind_edges'] = _float(calibration.raw_value(reading, 'wind_speed', profile))
+    rgb = reading.get('rgb_values') or {}
+    rec['red'] = rgb.get('raw_r', 0)
+    rec['green'] = rgb.get('raw_g', 0)
+    rec['blue'] = rgb.get('raw_b', 0)
+    clear = calibration.raw_value(reading, 'light_level', profile)
+    rec['clear'] = min(round(clear), 65535) if clear is not None else 0
+    rec['flags'] = FLAG_RAINING if reading.get('is_raining') else 0
+    rec['quality'] = reading.get('quality', 0)
+    rec['momento'] = _MOMENTO_CODES.get(reading.get('momento', ''), 0)
+    rec['wetness'] = round(reading.get('wetness', 0) * 255)
+    rec['rates'] = reading.get('rates', 0)
+    return rec
+
+
+def encode(records):
+    """
+    Serializa registros (array de RECORD_DTYPE o lista de registros) a bytes
+    """
+    return np.asarray(records, RECORD_DTYPE).tobytes()
+
+
+def decode(data):
+    """
+    Vista sin copia de bytes como array de registros
+    """
+    return np.frombuffer(data, RECORD_DTYPE)
+
+
+def timestamps(records):
+    """
+    Timestamps de pared en segundos epoch (float64)
+    """
+    return records['wall_ns'] / 1e9
+
+
+def is_raining(records):
+    return (records['flags'] & FLAG_RAINING) != 0
+
+
+def invalid(records):
+    """
+    Máscara por campo de los registros sin dato válido según record['quality']
+    :return: dict campo -> array de bool
+    """
+    mask = (1 << QUALITY_BITS) - 1
+    return {field: np.isin((records['quality'] >> (QUALITY_BITS * i)) & mask, (MISSING, RANGE, BACKOFF))
+            for i, field in enumerate(QUALITY_FIELDS)}
+
+
+def calibrated(records, profile=None):
+    """
+    Columnas calibradas de un array de registros con un perfil (por defecto el activo).
+    Los campos sin dato válido según record['quality'] quedan a NaN.
+    """
+    records = np.asarray(records, RECORD_DTYPE)
+    columns = calibration.get(profile).calibrate(
+        {raw: records[raw] for raw in calibration.RAW_FIELDS.values()})
+    for field, bad in invalid(records).items():
+        if field in columns:
+            columns[field] = np.where(bad, np.nan, columns[field])
+    return columns
+
+
+def to_readings(records, profile=None):
+    """
+    Convierte registros a dicts con valores numéricos (timestamp en segundos epoch),
+    calibrados de una vez para todo el array
+    """
+    records = np.asarray(records, RECORD_DTYPE)
+    columns = {name: values.tolist() for name, values in calibrated(records, profile).items()}
+    readings = []
+    for k, rec in enumerate(records):
+        reading = {
+            'timestamp': int(rec['wall_ns']) / 1e9,
+            'mono_ns': int(rec['mono_ns']),
+            'is_raining': bool(rec['flags'] & FLAG_RAINING),
+            'wetness': int(rec['wetness']) / 255,
+            'momento': MOMENTOS[rec['momento']] if rec['momento'] < len(MOMENTOS) else '',
+            'quality': int(rec['quality']),
+            'rates': int(rec['rates']),
+            'profile': int(rec['profile']),
+        }
+        for field, raw in calibration.RAW_FIELDS.items():
+            reading[field] = columns[field][k]
+            reading[raw] = rec[raw].item()
+        readings.append(reading)
+    return readings
+
+
+def to_reading(rec, profile=None):
+    return to_readings(np.asarray([rec], RECORD_DTYPE), profile)[0]
+
+
+def format_timestamp(wall, fmt='%Y-%m-%d %H:%M:%S'):
+    """
+    Formatea un timestamp (segundos epoch o registro) solo al mostrarlo
+    """
+    if isinstance(wall, np.void):
+        wall = int(wall['wall_ns']) / 1e9
+    return datetime.fromtimestamp(wall).strftime(fmt)
+
+
+def main():
+    """
+    Función principal para pruebas: tamaño y velocidad de codificación masiva
+    """
+    n = 1_000_000
+    mono, wall = tick()
+    records = np.zeros(n, RECORD_DTYPE)
+    records['mono_ns'] = mono + np.arange(n) * 1_000_000_000
+    records['wall_ns'] = wall + np.arange(n) * 1_000_000_000
+    records['temperature_raw'] = 20.0
+
+    t0 = time.perf_counter()
+    data = encode(records)
+    t1 = time.perf_counter()
+    decoded = decode(data)
+    t2 = time.perf_counter()
+    print(f"{RECORD_DTYPE.itemsize} bytes por registro, {len(data) / 1e6:.0f} MB para {n} registros")
+    print(f"Codificación {n / (t1 - t0) / 1e6:.0f} M/s, decodificación {n / (t2 - t1) / 1e6:.0f} M/s")
+    print(f"Primer registro: {format_timestamp(decoded[0])} {to_reading(decoded[0])}")
+
+
+if __name__ == "__main__":
+    main()
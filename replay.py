@@ -0,0 +1,169 @@
+import sys
+import math
+import time
+from bisect import bisect_right
+
+import record
+import calibration
+from main import Anemometer, RainSensor, DHT11, LightSensor, WeatherStation
+from rain_log import RainEventLog
+from sensor_trace import read_trace, read_meta, TICK, EDGE, WIND, RAIN, DHT, LIGHT, OUTPUT
+
+
+class ReplayAnemometer(Anemometer):
+    def __init__(self, edges, winds):
+        """
+        Anemómetro que cuenta los flancos grabados con el mismo cálculo que el real
+        """
+        self.recorder = None
+        self.edges = [edge[0] for edge in edges]
+        self.winds = iter(winds)
+
+    def get_reading(self, mono_ns=None):
+        now, seen = next(self.winds)
+        # Solo los `seen` primeros flancos se habían detectado al leer en vivo
+        hi = min(seen, bisect_right(self.edges, now))
+        lo = bisect_right(self.edges, now - self.WINDOW_NS)
+        changes = max(0, hi - lo)
+        speed = self.speed_kmh(changes)
+        return {
+            'wind_speed': speed,
+            'wind_speed_ms': round(speed / 3.6, 2),
+            'wind_edges': self.edges_per_s(changes)
+        }
+
+    def cleanup(self):
+        pass
+
+
+class ReplayRainSensor(RainSensor):
+    def __init__(self, samples):
+        self.recorder = None
+        self.events = RainEventLog()
+        self.samples = iter(samples)
+
+    def read_samples(self):
+        _, mask, count = next(self.samples)
+        return [(mask >> i) & 1 for i in range(count)]
+
+    def cleanup(self):
+        self.events.cleanup()
+
+
+class ReplayDHT11(DHT11):
+    def __init__(self, results):
+        self.recorder = None
+        self.results = iter(results)
+
+    def read_raw(self):
+        _, ok, temperature, humidity = next(self.results)
+        if not ok:
+            raise RuntimeError("Fallo grabado del DHT11")
+        return tuple(None if math.isnan(v) else v for v in (temperature, humidity))
+
+    def cleanup(self):
+        pass
+
+
+class ReplayLightSensor(LightSensor):
+    def __init__(self, results):
+        self.recorder = None
+        self.results = iter(results)
+
+    def read_raw(self):
+        _, ok, r, g, b, c = next(self.results)
+        if not ok:
+            raise OSError("Fallo grabado del TCS34725")
+        return r, g, b, c
+
+
+class Replay:
+    def __init__(self, path, consumers=None, sampler=None):
+        """
+        Reproduce una traza grabada (WEATHER_TRACE) a través de WeatherStation
+        :param path: Fichero de la traza
+        :param consumers: Consumidores de lecturas (por defecto ninguno)
+        :param sampler: AdaptiveSampler con la misma configuración que al grabar, si se usó
+        """
+        # Los perfiles de calibración con los que se grabó, no los del fichero local
+        meta = read_meta(path)
+        if 'calibration' in meta:
+            calibration.use(calibration.Profiles(data=meta['calibration']))
+        events = read_trace(path)
+        self.ticks = events[TICK]
+        self.expected = [data for _, data in events[OUTPUT]]
+        # Tick en reproducción: las capturas se fechan en su plazo (la traza no guarda cuánto
+        # tardó cada lectura)
+        self.mono_ns = 0
+        self.station = WeatherStation(
+            sensors={
+                'anemometer': ReplayAnemometer(events[EDGE], events[WIND]),
+                'rain': ReplayRainSensor(events[RAIN]),
+                'temperature': ReplayDHT11(events[DHT]),
+                'light': ReplayLightSensor(events[LIGHT]),
+            },
+            consumers=consumers if consumers is not None else [],
+            sampler=sampler,
+            clock=lambda: self.mono_ns)
+
+    def run(self, speed=None):
+        """
+        Genera el registro (record.py) de cada tick
+        :param speed: Factor de velocidad (1 = tiempo real, 100 = 100x); None = lo más rápido posible
+        """
+        start = time.monotonic()
+        first = self.ticks[0][0] if self.ticks else 0
+        for mono_ns, wall_ns in self.ticks:
+            if speed:
+                delay = start + (mono_ns - first) / 1e9 / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self.mono_ns = mono_ns
+            # Con muestreo adaptativo hay ticks que no generan registro
+            if self.station.get_readings((mono_ns, wall_ns)) is not None:
+                yield self.station.current_record
+
+    def verify(self, speed=None):
+        """
+        Reproduce la traza y la compara byte a byte con los registros grabados
+        :return: (ticks reproducidos, ticks distintos)
+        """
+        ticks = mismatches = 0
+        for expected, rec in zip(self.expected, self.run(speed)):
+            ticks += 1
+            if rec.tobytes() != expected:
+                mismatches += 1
+        return ticks, mismatches
+
+    def cleanup(self):
+        self.station.cleanup()
+
+
+def main():
+    """
+    Uso: python replay.py traza.bin [velocidad]   (velocidad: 1, 100, ... o 'max')
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__.strip())
+        sys.exit(1)
+    speed = None if len(sys.argv) < 3 or sys.argv[2] == 'max' else float(sys.argv[2])
+
+    replay = Replay(sys.argv[1])
+    try:
+        t0 = time.perf_counter()
+        ticks, mismatches = replay.verify(speed)
+        elapsed = time.perf_counter() - t0
+        print(f"{ticks} ticks reproducidos en {elapsed:.2f} s ({ticks / elapsed:.0f} ticks/s)")
+        if replay.expected:
+            print(f"Registros distintos de los grabados: {mismatches}")
+        last = replay.station.current_record
+        if last is not None:
+            print(f"Último: {record.format_timestamp(last)} {record.to_reading(last)}")
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+    finally:
+        replay.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import time
+
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+
+
+class FixedRateScheduler:
+    def __init__(self, period=1.0, policy=SKIP, max_catch_up=5,
+                 clock=time.monotonic_ns, wall_clock=time.time_ns, sleep=time.sleep):
+        """
+        Planificador de periodo fijo basado en plazos sobre el reloj monotónico.
+        El plazo k es inicio + k * periodo, así que el retraso de una iteración no
+        se acumula en las siguientes.
+        :param period: Periodo en segundos
+        :param policy: Qué hacer tras un desbordamiento: SKIP salta los plazos perdidos
+                       (la rejilla se mantiene), CATCH_UP los ejecuta seguidos
+        :param max_catch_up: Plazos perdidos máximos a recuperar antes de saltar
+        :param clock: Reloj monotónico en ns
+        :param wall_clock: Reloj de pared en ns (solo para anclar la rejilla)
+        :param sleep: Función de espera en segundos
+        """
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError(f"Política desconocida: {policy}")
+        self.period_ns = int(round(period * 1e9))
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.running = True
+
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_max_ns = 0
+        self.jitter_sum_ns = 0
+
+    def _anchor(self):
+        # Primer plazo en el siguiente múltiplo exacto del periodo en hora de pared
+        mono, wall = self.clock(), self.wall_clock()
+        wall0 = -(-wall // self.period_ns) * self.period_ns
+        return mono + (wall0 - wall), wall0
+
+    def __iter__(self):
+        """
+        Genera (plazo monotónico ns, hora de pared de la rejilla ns) para cada tick
+        """
+        mono0, wall0 = self._anchor()
+        k = 0
+        # Retraso del tick anterior si llegó tarde (None si se iba a tiempo)
+        behind = None
+        while self.running:
+            deadline = mono0 + k * self.period_ns
+            now = self.clock()
+            # Sin tiempo que esperar: la iteración anterior terminó después de este plazo
+            late = now > deadline
+            if not late:
+                self.sleep((deadline - now) / 1e9)
+                now = self.clock()
+
+            lateness = now - deadline
+            if late:
+                # Cada plazo perdido es un desbordamiento, salvo que el retraso venga del
+                # mismo atasco: al recuperar (o tras un salto) los ticks siguientes también
+                # llegan tarde, y solo es uno nuevo si el retraso crece
+                if behind is None or lateness > behind:
+                    self.overruns += 1
+                missed = lateness // self.period_ns
+                if missed and (self.policy == SKIP or missed > self.max_catch_up):
+                    k += missed
+                    self.skipped += missed
+                    deadline = mono0 + k * self.period_ns
+                    lateness = now - deadline
+            behind = lateness if late else None
+            self.ticks += 1
+            self.jitter_sum_ns += lateness
+            self.jitter_max_ns = max(self.jitter_max_ns, lateness)
+
+            yield deadline, wall0 + k * self.period_ns
+            k += 1
+
+            # Si el reloj de pared se ajusta (NTP), re-anclar la rejilla en periodos enteros
+            drift = self.wall_clock() - (wall0 + (self.clock() - mono0))
+            if abs(drift) >= self.period_ns:
+                wall0 += (drift // self.period_ns) * self.period_ns
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """
+        Estadísticas de puntualidad: ticks, desbordamientos, plazos saltados y jitter (ms)
+        """
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_mean_ms': self.jitter_sum_ns / self.ticks / 1e6 if self.ticks else 0.0,
+            'jitter_max_ms': self.jitter_max_ns / 1e6,
+        }
+
+
+def check_overruns(work, policy=SKIP):
+    """
+    Ejecuta el planificador con un reloj simulado (periodo 1 s) y una duración de
+    trabajo por tick en periodos; al acabarse la lista el trabajo es de 0.2 periodos
+    :return: Estadísticas del planificador
+    """
+    now = [0]
+
+    def sleep(seconds):
+        now[0] += round(seconds * 1e9)
+
+    scheduler = FixedRateScheduler(1.0, policy, clock=lambda: now[0], wall_clock=lambda: now[0], sleep=sleep)
+    for k, _ in enumerate(scheduler):
+        if k == len(work) + 5:
+            break
+        sleep(work[k] if k < len(work) else 0.2)
+    return scheduler.stats()
+
+
+def main():
+    """
+    Función principal para pruebas: periodo de 0.2 s con trabajo variable
+    """
+    import random
+    # Dos iteraciones largas (1.5 y 2.5 periodos): dos desbordamientos con ambas políticas
+    for policy in (SKIP, CATCH_UP):
+        stats = check_overruns([0.2, 1.5, 0.2, 0.2, 2.5, 0.2, 0.2], policy)
+        print(f"{policy}: {stats['overruns']} desbordamientos, {stats['skipped']} saltados, "
+              f"{'correcto' if stats['overruns'] == 2 else 'INCORRECTO'}")
+    scheduler = FixedRateScheduler(0.2)
+    try:
+        for deadline, wall in scheduler:
+            print(f"{time.strftime('%H:%M:%S', time.localtime(wall / 1e9))}"
+                  f".{wall % 1_000_000_000 // 1_000_000:03d}  {scheduler.stats()}")
+            # Trabajo variable; a veces más largo que el periodo
+            time.sleep(random.choice([0.05, 0.1, 0.15, 0.45]))
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+    finally:
+        print(f"Estadísticas: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
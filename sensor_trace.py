@@ -0,0 +1,148 @@
+import json
+import math
+import struct
+import threading
+
+import calibration
+
+# Tipos de evento de la traza
+TICK = 1     # tick del planificador: pared ns
+EDGE = 2     # flanco del anemómetro: nivel
+WIND = 3     # lectura del anemómetro: flancos vistos hasta ese momento
+RAIN = 4     # muestras del sensor de lluvia: máscara de bits, número de muestras
+DHT = 5      # DHT11: ok, temperatura, humedad
+LIGHT = 6    # TCS34725: ok, r, g, b, clear
+OUTPUT = 7   # registro resultante del tick (record.py), para verificar la reproducción
+
+# Cabecera común: tipo (u8) + reloj monotónico (i64 ns)
+HEADER = struct.Struct('<Bq')
+PAYLOADS = {
+    TICK: struct.Struct('<q'),
+    EDGE: struct.Struct('<B'),
+    WIND: struct.Struct('<Q'),
+    RAIN: struct.Struct('<HB'),
+    DHT: struct.Struct('<Bdd'),
+    LIGHT: struct.Struct('<B4H'),
+    OUTPUT: struct.Struct('<48s'),
+}
+MAGIC = b'WSTRACE2'
+# Trazas anteriores, sin cabecera de calibración
+MAGIC_V1 = b'WSTRACE1'
+# Tras MAGIC: longitud (u32) y JSON con el registro de calibración al grabar
+META = struct.Struct('<I')
+
+
+class TraceWriter:
+    def __init__(self, path, buffer_size=64 * 1024, profiles=None):
+        """
+        Graba las entradas crudas de los sensores en un fichero binario compacto
+        (9 bytes de cabecera + 1-17 bytes por evento; 48 el registro de salida)
+        :param path: Fichero de la traza
+        :param buffer_size: Bytes acumulados antes de escribir en disco
+        :param profiles: Registro de calibración que se guarda en la cabecera para
+                         reproducir con los mismos perfiles (None = el cargado)
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        meta = json.dumps({'calibration': (profiles or calibration.profiles()).to_dict()}).encode()
+        self.file.write(MAGIC + META.pack(len(meta)) + meta)
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+
+    def _write(self, kind, mono_ns, *payload):
+        data = HEADER.pack(kind, mono_ns) + PAYLOADS[kind].pack(*payload)
+        with self.lock:
+            self.buffer += data
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+
+    def tick(self, mono_ns, wall_ns):
+        self._write(TICK, mono_ns, wall_ns)
+
+    def edge(self, mono_ns, level):
+        self._write(EDGE, mono_ns, level)
+
+    def wind(self, mono_ns, edges_seen):
+        self._write(WIND, mono_ns, edges_seen)
+
+    def rain(self, mono_ns, samples):
+        mask = sum(1 << i for i, sample in enumerate(samples) if sample)
+        self._write(RAIN, mono_ns, mask, len(samples))
+
+    def dht(self, mono_ns, values):
+        """
+        :param values: (temperatura, humedad) o None si la lectura falló
+        """
+        if values is None:
+            self._write(DHT, mono_ns, 0, math.nan, math.nan)
+        else:
+            t, h = (math.nan if v is None else v for v in values)
+            self._write(DHT, mono_ns, 1, t, h)
+
+    def light(self, mono_ns, raw):
+        """
+        :param raw: (r, g, b, clear) o None si la lectura falló
+        """
+        if raw is None:
+            self._write(LIGHT, mono_ns, 0, 0, 0, 0, 0)
+        else:
+            self._write(LIGHT, mono_ns, 1, *raw)
+
+    def output(self, mono_ns, data):
+        self._write(OUTPUT, mono_ns, data)
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer = bytearray()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+
+def _read_meta(data, path):
+    # Cabecera de la traza: (metadatos, posición del primer evento)
+    if data.startswith(MAGIC_V1):
+        return {}, len(MAGIC_V1)
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} no es una traza de la estación")
+    offset = len(MAGIC)
+    (length,) = META.unpack_from(data, offset)
+    offset += META.size
+    return json.loads(data[offset:offset + length]), offset + length
+
+
+def read_meta(path):
+    """
+    Metadatos de la cabecera de una traza ({} en las trazas sin cabecera)
+    :return: dict con 'calibration' (ver calibration.Profiles.to_dict)
+    """
+    with open(path, 'rb') as f:
+        head = f.read(len(MAGIC) + META.size)
+        if head.startswith(MAGIC):
+            head += f.read(META.unpack_from(head, len(MAGIC))[0])
+    return _read_meta(head, path)[0]
+
+
+def read_trace(path):
+    """
+    Lee una traza completa
+    :return: dict tipo -> lista de (monotónico ns, *payload) en orden de grabación
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    _, offset = _read_meta(data, path)
+    events = {kind: [] for kind in PAYLOADS}
+    while offset + HEADER.size <= len(data):
+        kind, mono_ns = HEADER.unpack_from(data, offset)
+        payload = PAYLOADS[kind]
+        offset += HEADER.size
+        if offset + payload.size > len(data):
+            break  # Evento incompleto al final (corte de corriente)
+        events[kind].append((mono_ns,) + payload.unpack_from(data, offset))
+        offset += payload.size
+    return events
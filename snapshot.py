@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Versión del formato; una instantánea de otra versión se ignora
+VERSION = 2
+
+
+def _json_default(value):
+    # Escalares numpy (np.float32, np.int64...) como números de Python
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def capture(station, horizon):
+    """
+    Estado de la estación necesario para un arranque en caliente: el histórico
+    (crudo y agregados), el buffer de lecturas, la última lectura para el LCD y los
+    grados-día del día, sin nada anterior a `horizon` segundos. Del histórico
+    comprimido solo va el bloque abierto; los cerrados se escriben aparte (write_block)
+    :return: dict nombre -> array más 'meta' (dict), listo para save()
+    """
+    saved_at = time.time()
+    since = saved_at - horizon
+    state = station.history.snapshot(since)
+    if station.long_history is not None:
+        state.update(station.long_history.snapshot())
+    buffer = [reading for reading in list(station.data_buffer) if reading['timestamp'] >= since]
+    degree_days = station.degree_days
+    meta = {
+        'version': VERSION,
+        'saved_at': saved_at,
+        'data_buffer': buffer,
+        'degree_days': [degree_days.day, degree_days.t_min, degree_days.t_max],
+    }
+    state['meta'] = meta
+    return state
+
+
+def save(state, path):
+    """
+    Escribe una instantánea comprimida de forma atómica (fichero temporal + fsync + rename)
+    """
+    # La serialización se hace aquí, en el hilo de escritura, no al capturar
+    arrays = dict(state, meta=np.frombuffer(json.dumps(state['meta'], default=_json_default).encode(),
+                                            np.uint8))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def blocks_dir(path):
+    """
+    Directorio de los bloques cerrados del histórico comprimido (state.npz -> state.blocks)
+    """
+    return os.path.splitext(path)[0] + '.blocks'
+
+
+def write_block(block, directory):
+    """
+    Escribe un bloque cerrado de gorilla.CompressedHistory como fichero inmutable
+    (temporal + fsync + rename); cada bloque se escribe una sola vez
+    :return: True si se ha escrito, False si ya estaba
+    """
+    first, last, n, data = block
+    path = os.path.join(directory, f'block-{first}-{last}.npz')
+    if os.path.exists(path):
+        return False
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        # Sin compresión: los bytes ya vienen comprimidos
+        np.savez(f, bounds=np.array([first, last, n], np.int64),
+                 **{name: np.frombuffer(chunk, np.uint8) for name, chunk in data.items()})
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return True
+
+
+def _block_bounds(name):
+    # 'block-<primer ms>-<último ms>.npz' -> (primer, último); None si no es un bloque
+    parts = name[:-len('.npz')].split('-') if name.endswith('.npz') else ()
+    if len(parts) != 3 or parts[0] != 'block':
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def read_blocks(directory, since=None):
+    """
+    Bloques cerrados guardados con write_block, ordenados, sin los que terminan antes
+    de `since` (epoch s; None = todos); los ficheros dañados se ignoran
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    blocks = []
+    for name in names:
+        bounds = _block_bounds(name)
+        if bounds is None or (since is not None and bounds[1] < since * 1000):
+            continue
+        try:
+            with np.load(os.path.join(directory, name), allow_pickle=False) as data:
+                first, last, n = (int(value) for value in data['bounds'])
+                chunks = {key: data[key].tobytes() for key in data.files if key != 'bounds'}
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Bloque %s no válido: %s", name, e)
+            continue
+        blocks.append((first, last, n, chunks))
+    return sorted(blocks, key=lambda block: block[0])
+
+
+def prune_blocks(directory, since):
+    """
+    Borra los bloques que terminan antes de `since` (epoch s)
+    :return: Bloques borrados
+    """
+    removed = 0
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        bounds = _block_bounds(name)
+        if bounds is not None and bounds[1] < since * 1000:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+
+def load(path):
+    """
+    Lee una instantánea; None si no existe, está dañada o es de otra versión
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            state = {name: data[name] for name in data.files}
+        meta = json.loads(state.pop('meta').tobytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("Instantánea %s no válida: %s", path, e)
+        return None
+    if meta.get('version') != VERSION:
+        log.warning("Instantánea %s de otra versión (%s); se ignora", path, meta.get('version'))
+        return None
+    state['meta'] = meta
+    return state
+
+
+def restore(station, path, horizon):
+    """
+    Carga la instantánea en una estación recién creada descartando lo anterior a
+    `horizon` segundos: histórico, buffer, última lectura (LCD), grados-día y
+    ventanas de las alertas quedan válidos desde el primer tick
+    :return: Lecturas del buffer restauradas (0 si no había instantánea utilizable)
+    """
+    state = load(path)
+    now = time.time()
+    since = now - horizon
+    if state is not None and state['meta']['saved_at'] < since:
+        log.info("Instantánea de hace %.0f s, más antigua que el horizonte; se ignora",
+                 now - state['meta']['saved_at'])
+        state = None
+    # Los bloques cerrados valen aunque la instantánea falte o sea antigua
+    long_history = station.long_history
+    if long_history is not None:
+        long_since = now - long_history.retention if long_history.retention else None
+        long_state = state if state is not None and 'long.open.ts' in state else None
+        long_history.restore(long_state, read_blocks(blocks_dir(path), long_since), long_since)
+    if state is None:
+        return 0
+    meta = state.pop('meta')
+    station.history.restore(state, since)
+    buffer = [reading for reading in meta['data_buffer'] if reading['timestamp'] >= since]
+    station.data_buffer.extend(buffer)
+    if buffer:
+        station.current_readings = buffer[-1]
+    degree_days = station.degree_days
+    degree_days.day, degree_days.t_min, degree_days.t_max = meta['degree_days']
+    data = station.history.slice(since, now + 1)
+    station.alerts.warm(data['ts'], data)
+    log.info("Arranque en caliente: %d filas de histórico y %d lecturas de hace %.0f s",
+             len(station.history), len(buffer), now - meta['saved_at'])
+    return len(buffer)
+
+
+class Checkpointer:
+    def __init__(self, station, path='state.npz', interval=60.0, horizon=3600.0):
+        """
+        Consumidor de lecturas que guarda periódicamente el estado de la estación.
+        El hilo de muestreo solo lanza la escritura: la copia del estado y el fichero
+        se hacen en segundo plano; si la escritura anterior no ha terminado, se espera
+        a la siguiente. Los bloques cerrados del histórico comprimido se escriben una
+        sola vez en blocks_dir(path) y se borran al salir de su retención.
+        :param interval: Segundos entre instantáneas
+        :param horizon: Segundos de estado que se guardan
+        """
+        self.station = station
+        self.path = path
+        self.interval = interval
+        self.horizon = horizon
+        self.last = None
+        self.writer = None
+        # Primer ts (ms) del último bloque cerrado ya escrito
+        self.written = None
+        self.stats = {'saved': 0, 'skipped': 0, 'errors': 0, 'blocks': 0}
+
+    def put(self, reading, rec=None):
+        ts = reading['timestamp']
+        if self.last is not None and ts - self.last < self.interval:
+            return
+        if self.writer is not None and self.writer.is_alive():
+            self.stats['skipped'] += 1
+            return
+        self.last = ts
+        self.writer = threading.Thread(target=self._write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def _write(self):
+        try:
+            long_history = self.station.long_history
+            if long_history is not None:
+                # Primero los bloques: la instantánea nunca depende de uno sin escribir
+                directory = blocks_dir(self.path)
+                for block in long_history.sealed(self.written):
+                    self.stats['blocks'] += write_block(block, directory)
+                    self.written = block[0]
+                if long_history.retention and long_history.last_ts is not None:
+                    prune_blocks(directory, long_history.last_ts - long_history.retention)
+            save(capture(self.station, self.horizon), self.path)
+            self.stats['saved'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            log.error("Error guardando la instantánea %s: %s", self.path, e)
+
+    def cleanup(self):
+        """
+        Última instantánea al apagar
+        """
+        if self.writer is not None:
+            self.writer.join(timeout=10)
+        self._write()
+
+
+def main():
+    """
+    Función principal para pruebas: una hora de estación simulada, reinicio y
+    arranque en caliente desde la instantánea
+    """
+    import random
+    import tempfile
+    import station_log
+    from soak import SimClock, SimAnemometer, SimRainSensor, SimDHT11, SimLightSensor
+    from main import WeatherStation
+    from gorilla import CompressedHistory
+    station_log.setup()
+
+    def station(clock, rng):
+        st = WeatherStation(sensors={
+            'anemometer': SimAnemometer(clock, rng),
+            'rain': SimRainSensor(clock, rng, None),
+            'temperature': SimDHT11(clock, rng),
+            'light': SimLightSensor(clock, rng),
+        }, consumers=[], clock=clock.monotonic_ns)
+        # Histórico comprimido con bloques pequeños para que se cierren varios en una hora
+        st.long_history = st.charts.long_history = CompressedHistory(retention=7 * 86400, block_size=512)
+        return st
+
+    path = os.path.join(tempfile.mkdtemp(prefix='instantanea_'), 'state.npz')
+    rng = random.Random(0)
+    clock = SimClock()
+    first = station(clock, rng)
+    checkpointer = Checkpointer(first, path, interval=600)
+    first.consumers.append(checkpointer)
+    wall0 = time.time_ns() - 3600 * 1_000_000_000
+    for k in range(3600):
+        clock.now = 12 * 3600 + k
+        first.get_readings((clock.monotonic_ns(), wall0 + k * 1_000_000_000))
+    first.cleanup()
+    blocks = sum(os.path.getsize(entry.path) for entry in os.scandir(blocks_dir(path)))
+    print(f"Instantáneas: {checkpointer.stats}, {os.path.getsize(path) / 1024:.0f} KB por instantánea "
+          f"más {blocks / 1024:.0f} KB de bloques cerrados escritos una vez")
+
+    second = station(clock, rng)
+    t0 = time.perf_counter()
+    restored = restore(second, path, horizon=1800)
+    print(f"Restauradas {restored} lecturas y {len(second.history)} filas en "
+          f"{(time.perf_counter() - t0) * 1000:.1f} ms")
+    before, after = first.long_history.columns(), second.long_history.columns()
+    same = all(np.array_equal(before[name], after[name], equal_nan=True) for name in before)
+    print(f"Histórico comprimido: {len(second.long_history)} muestras en "
+          f"{len(second.long_history.blocks)} bloques, {'correcto' if same else 'INCORRECTO'}")
+    now = time.time()
+    for name, st in (('antes', first), ('después', second)):
+        result = st.history.query(now - 600, now, fields=('wind_speed',), aggs=('max', 'count'))
+        print(f"{name:<8}: viento máx 10 min {result['wind_speed']['max'][0]:.1f} km/h "
+              f"({result['wind_speed']['count'][0]} lecturas), LCD {st.current_readings['temperature']} °C")
+    second.cleanup()
+    station_log.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import gc
+import os
+import sys
+import math
+import random
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import calibration
+from main import Anemometer, RainSensor, DHT11, LightSensor, WeatherStation
+from rain_log import RainEventLog
+from archive import DailyArchiver
+from alerts import LogSink, LcdBanner
+from scheduler import FixedRateScheduler
+from uplink import Uplink
+import station_log
+
+# Crecimiento máximo permitido entre el final del calentamiento y el final de la prueba
+BUDGETS = {
+    'traced_mb': 4.0,    # memoria Python (tracemalloc)
+    'rss_mb': 32.0,      # memoria residente del proceso
+    'threads': 0,
+    'fds': 2,
+}
+
+
+class SimClock:
+    """
+    Tiempo simulado compartido por los sensores (segundos desde el inicio). Ofrece
+    los relojes y la espera de FixedRateScheduler: esperar es avanzar el reloj
+    """
+    def __init__(self, wall0_ns=0):
+        self.ns = 0
+        self.wall0_ns = wall0_ns
+
+    @property
+    def now(self):
+        return self.ns / 1e9
+
+    @now.setter
+    def now(self, seconds):
+        self.ns = int(round(seconds * 1e9))
+
+    def monotonic_ns(self):
+        # Nunca 0: el anemómetro toma 0 como "sin lectura anterior"
+        return self.ns + 1
+
+    def time_ns(self):
+        return self.wall0_ns + self.ns
+
+    def sleep(self, seconds):
+        self.ns += int(math.ceil(seconds * 1e9))
+
+
+class SimAnemometer(Anemometer):
+    def __init__(self, clock, rng):
+        # Sin GPIO ni hilo: los flancos se generan al avanzar el reloj simulado
+        self.recorder = None
+        self.clock = clock
+        self.rng = rng
+        self.wind_count = 0
+        self.edges = deque(maxlen=10000)
+        self.lock = threading.Lock()
+        self.last_ns = 0
+
+    def get_reading(self, mono_ns=None):
+        # Viento racheado por la tarde; de madrugada, calma total
+        hour = self.clock.now / 3600 % 24
+        kmh = max(0.0, 15 * math.sin((hour - 6) / 24 * 2 * math.pi) + self.rng.gauss(0, 3))
+        edges_per_s = float(calibration.active().invert('wind_speed', kmh))
+        n = int(edges_per_s * (mono_ns - self.last_ns) / 1e9) if self.last_ns else 0
+        with self.lock:
+            for i in range(n):
+                self.edges.append(self.last_ns + (i + 1) * (mono_ns - self.last_ns) // (n + 1))
+            self.wind_count += n
+        self.last_ns = mono_ns
+        return super().get_reading(mono_ns)
+
+    def cleanup(self):
+        pass
+
+
+class SimRainSensor(RainSensor):
+    def __init__(self, clock, rng, log_path):
+        self.recorder = None
+        self.clock = clock
+        self.rng = rng
+        self.events = RainEventLog(log_path)
+        self.raining_until = 0.0
+
+    def read_samples(self):
+        # Un chubasco de media hora cada dos días, de media
+        if self.clock.now >= self.raining_until and self.rng.random() < 1 / 172800:
+            self.raining_until = self.clock.now + 1800
+        wet = self.clock.now < self.raining_until
+        return [0 if wet else 1] * 5
+
+    def cleanup(self):
+        self.events.cleanup()
+
+
+class SimDHT11(DHT11):
+    def __init__(self, clock, rng, failure_rate=0.05):
+        self.recorder = None
+        self.clock = clock
+        self.rng = rng
+        self.failure_rate = failure_rate
+
+    def read_raw(self):
+        # Fallos esporádicos como los del DHT11 real (ejercitan la vigilancia)
+        if self.rng.random() < self.failure_rate:
+            raise RuntimeError("Checksum did not validate")
+        hour = self.clock.now / 3600 % 24
+        temperature = round(18 + 6 * math.sin((hour - 9) / 24 * 2 * math.pi))
+        return float(temperature), float(round(60 - 2 * (temperature - 18)))
+
+    def cleanup(self):
+        pass
+
+
+class SimLightSensor(LightSensor):
+    def __init__(self, clock, rng):
+        self.recorder = None
+        self.clock = clock
+        self.rng = rng
+
+    def read_raw(self):
+        hour = self.clock.now / 3600 % 24
+        c = int(max(0.0, math.sin((hour - 6) / 12 * math.pi)) * 40000) + self.rng.randrange(50)
+        return c // 3, c // 3, c // 4, c
+
+
+def _rss_mb():
+    # Memoria residente actual (no el pico) en Linux; None si no hay /proc
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+class Soak:
+    def __init__(self, days=14, period=1.0, retention_days=2, warmup_days=None,
+                 sample_hours=6, budgets=None, seed=0):
+        """
+        Prueba de larga duración de WeatherStation con sensores simulados y reloj acelerado
+        :param days: Días simulados
+        :param period: Periodo de muestreo simulado en segundos
+        :param retention_days: Retención del histórico (más corta que la prueba para que llegue a recortar)
+        :param warmup_days: Días hasta llenar los buffers; por defecto, la retención más un día
+        :param sample_hours: Cada cuántas horas simuladas se toma una medida
+        :param budgets: Crecimiento permitido tras el calentamiento; ver BUDGETS
+        """
+        self.days = days
+        self.period = period
+        self.retention_days = retention_days
+        self.warmup_days = retention_days + 1 if warmup_days is None else warmup_days
+        self.sample_hours = sample_hours
+        self.budgets = dict(BUDGETS, **(budgets or {}))
+        self.seed = seed
+        self.samples = []
+        self.snapshots = {}
+
+    def _measure(self, day):
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        sample = {
+            'day': day,
+            'traced_mb': traced / 2**20,
+            'rss_mb': _rss_mb(),
+            'threads': threading.active_count(),
+            'fds': _fds(),
+        }
+        self.samples.append(sample)
+        return sample
+
+    def run(self, progress=print):
+        """
+        Ejecuta la prueba
+        :return: Lista de incumplimientos del presupuesto (vacía si todo está dentro)
+        """
+        rng = random.Random(self.seed)
+        # Medianoche: la hora del día simulada coincide con la de la rejilla de pared
+        clock = SimClock((int(time.time()) // 86400) * 86400 * 1_000_000_000)
+        workdir = tempfile.mkdtemp(prefix='soak_')
+        station = None
+        tracemalloc.start()
+        try:
+            station = WeatherStation(
+                sensors={
+                    'anemometer': SimAnemometer(clock, rng),
+                    'rain': SimRainSensor(clock, rng, os.path.join(workdir, 'rain_events.bin')),
+                    'temperature': SimDHT11(clock, rng),
+                    'light': SimLightSensor(clock, rng),
+                },
+                consumers=[
+                    # Colector inalcanzable: todo acaba en el spool, que tiene tamaño máximo
+                    Uplink('http://127.0.0.1:9/ingest', 'soak', spool_dir=os.path.join(workdir, 'spool'),
+                           max_spool_bytes=1024 * 1024, timeout=0.1),
+                    DailyArchiver(os.path.join(workdir, 'history')),
+                ],
+                alert_sinks=[LogSink(), LcdBanner()],
+                history_retention=self.retention_days * 86400,
+                clock=clock.monotonic_ns)
+
+            # El mismo planificador que en producción, sobre el reloj simulado
+            scheduler = FixedRateScheduler(self.period, clock=clock.monotonic_ns,
+                                           wall_clock=clock.time_ns, sleep=clock.sleep)
+            ticks_per_sample = int(self.sample_hours * 3600 / self.period)
+            total = int(self.days * 86400 / self.period)
+            t0 = time.perf_counter()
+            for k, tick in enumerate(scheduler):
+                if k % ticks_per_sample == 0:
+                    day = k * self.period / 86400
+                    sample = self._measure(day)
+                    if 'warm' not in self.snapshots and (day >= self.warmup_days or k == total):
+                        self.snapshots['warm'] = (sample, tracemalloc.take_snapshot())
+                    progress(f"día {day:5.2f}: Python {sample['traced_mb']:.1f} MB, RSS {sample['rss_mb'] or 0:.1f} MB, "
+                             f"hilos {sample['threads']}, fds {sample['fds']} "
+                             f"({k / max(time.perf_counter() - t0, 1e-9):.0f} ticks/s)")
+                if k == total:
+                    break
+                station.get_readings(tick)
+            if scheduler.overruns:
+                progress(f"Planificador: {scheduler.stats()}")
+            self.snapshots['end'] = (self.samples[-1], tracemalloc.take_snapshot())
+            return self.check()
+        finally:
+            if station:
+                station.cleanup()
+            tracemalloc.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def check(self):
+        """
+        Compara la última medida con la del final del calentamiento
+        """
+        warm, warm_snapshot = self.snapshots['warm']
+        end, end_snapshot = self.snapshots['end']
+        failures = []
+        for key, budget in self.budgets.items():
+            if warm[key] is None or end[key] is None:
+                continue
+            growth = end[key] - warm[key]
+            if growth > budget:
+                failures.append(f"{key}: +{growth:.2f} (presupuesto {budget})")
+        if failures:
+            # Dónde ha crecido la memoria Python
+            for stat in end_snapshot.compare_to(warm_snapshot, 'lineno')[:10]:
+                failures.append(f"  {stat}")
+        return failures
+
+
+def check_late_tick(lateness=0.3):
+    """
+    Un tick en el que el planificador despierta `lateness` s tarde: las capturas de los
+    sensores leídos en el tick se fechan tarde (los simulados leen en tiempo cero) y la
+    ventana del viento sigue centrada medio segundo antes del plazo
+    :return: dict sensor -> desfase de la captura respecto al tick (s)
+    """
+    rng = random.Random(0)
+    clock = SimClock()
+    clock.now = 12 * 3600
+    station = WeatherStation(sensors={
+        'anemometer': SimAnemometer(clock, rng),
+        'rain': SimRainSensor(clock, rng, None),
+        'temperature': SimDHT11(clock, rng),
+        'light': SimLightSensor(clock, rng),
+    }, consumers=[], clock=clock.monotonic_ns)
+    tick = (clock.monotonic_ns(), clock.time_ns())
+    clock.sleep(lateness)
+    readings = station.get_readings(tick)
+    offsets = {sensor: at - readings['timestamp'] for sensor, at in readings['captured'].items()}
+    station.cleanup()
+    return offsets
+
+
+def main():
+    """
+    Uso: python soak.py [días] [periodo_s]   (por defecto, 14 días a una muestra cada 10 s)
+    Sale con código 1 si el crecimiento tras el calentamiento supera BUDGETS
+    """
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 14
+    period = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    station_log.setup()
+    offsets = check_late_tick(0.3)
+    late = all(abs(offsets[sensor] - 0.3) < 1e-6 for sensor in ('temperature', 'rain', 'light'))
+    print(f"Tick 300 ms tarde: capturas {', '.join(f'{s} {o:+.3f} s' for s, o in offsets.items())}, "
+          f"{'correcto' if late and abs(offsets['wind'] + 0.5) < 1e-6 else 'INCORRECTO'}")
+    soak = Soak(days=days, period=period)
+    try:
+        failures = soak.run()
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+        sys.exit(1)
+    if failures:
+        print("Presupuesto superado:")
+        for failure in failures:
+            print(failure)
+        sys.exit(1)
+    print("Memoria, hilos y descriptores dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import signal
+import threading
+import time
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_handler = None
+_listener = None
+_level = logging.INFO
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=60.0, min_level=logging.WARNING, max_keys=1000, clock=time.monotonic):
+        """
+        Deja pasar un mensaje por clave y por intervalo; el siguiente que pasa indica
+        cuántas repeticiones se suprimieron
+        :param interval: Segundos entre mensajes con la misma clave
+        :param min_level: Nivel a partir del cual se limita (el debug se activa a propósito)
+        :param max_keys: Claves recordadas como máximo
+        :param clock: Reloj monotónico en segundos
+        La clave es extra={'key': ...} o, por defecto, (logger, nivel, plantilla sin formatear)
+        """
+        super().__init__()
+        self.interval = interval
+        self.min_level = min_level
+        self.max_keys = max_keys
+        self.clock = clock
+        self.seen = {}  # clave -> [próxima emisión permitida, suprimidos]
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = getattr(record, 'key', None) or (record.name, record.levelno, record.msg)
+        now = self.clock()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now < entry[0]:
+                entry[1] += 1
+                self.suppressed += 1
+                return False
+            if entry is None and len(self.seen) >= self.max_keys:
+                # Olvidar las claves ya caducadas
+                self.seen = {k: v for k, v in self.seen.items() if now < v[0]}
+            repeated = entry[1] if entry else 0
+            self.seen[key] = [now + self.interval, 0]
+        if repeated:
+            record.msg = f"{record.msg} [{repeated} repeticiones suprimidas]"
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q):
+        # Nunca bloquea al hilo que registra: si la cola está llena, descarta
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup(level=logging.INFO, path=None, debug=False, interval=60.0, queue_size=10000):
+    """
+    Configura el logging de la estación: los hilos de muestreo solo encolan y un hilo
+    de fondo escribe en stderr (y en `path` si se indica, con rotación)
+    :param level: Nivel normal
+    :param path: Fichero de log opcional
+    :param debug: Empezar con la salida de debug activada
+    :param interval: Segundos de limitación por clave de mensaje (ver RateLimitFilter)
+    :param queue_size: Mensajes pendientes máximos antes de descartar
+    """
+    global _handler, _listener, _level
+    if _listener is not None:
+        return
+    _level = level
+
+    formatter = logging.Formatter(FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path:
+        handlers.append(logging.handlers.RotatingFileHandler(path, maxBytes=1_000_000, backupCount=3))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    q = queue.Queue(maxsize=queue_size)
+    _handler = _QueueHandler(q)
+    _handler.addFilter(RateLimitFilter(interval))
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(logging.DEBUG if debug else level)
+
+    # kill -USR1 <pid> activa/desactiva el debug sin reiniciar
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: toggle_debug())
+    atexit.register(shutdown)
+
+
+def set_debug(enabled):
+    logging.getLogger().setLevel(logging.DEBUG if enabled else _level)
+    logging.getLogger(__name__).warning("Debug %s", "activado" if enabled else "desactivado")
+
+
+def is_debug():
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
+def toggle_debug():
+    set_debug(not is_debug())
+
+
+def stats():
+    """
+    Mensajes descartados por cola llena y suprimidos por repetición
+    """
+    if _handler is None:
+        return {'dropped': 0, 'suppressed': 0}
+    return {
+        'dropped': _handler.dropped,
+        'suppressed': sum(f.suppressed for f in _handler.filters if isinstance(f, RateLimitFilter)),
+    }
+
+
+def shutdown():
+    """
+    Vacía la cola y detiene el hilo de escritura
+    """
+    global _handler, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _handler = _listener = None
+
+
+def main():
+    """
+    Función principal para pruebas: un error repetido a 1 kHz y debug conmutado con SIGUSR1
+    """
+    import os
+    setup(interval=1.0)
+    log = logging.getLogger('prueba')
+    print(f"kill -USR1 {os.getpid()} para conmutar el debug")
+    try:
+        t0 = time.perf_counter()
+        for i in range(5000):
+            log.warning("Fallo de lectura del sensor: %s", "timeout")
+            log.debug("Muestra %d", i)
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - t0
+        print(f"5000 iteraciones en {elapsed:.2f} s, {stats()}")
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+    finally:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
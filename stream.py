@@ -0,0 +1,224 @@
+import json
+import math
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+
+class _Client:
+    def __init__(self, queue_size):
+        """
+        Cola acotada de un suscriptor; al llenarse descarta el evento más antiguo
+        """
+        self.events = deque(maxlen=queue_size)
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+    def push(self, frame):
+        with self.cond:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(frame)
+            self.cond.notify()
+
+    def pop_all(self, timeout):
+        with self.cond:
+            if not self.events:
+                self.cond.wait(timeout)
+            frames = list(self.events)
+            self.events.clear()
+            return frames
+
+
+def _sanitize(value):
+    # NaN/inf (campo sin dato válido) no son JSON: se envían como null, también dentro
+    # de dicts y listas; los escalares y arrays numpy pasan a tipos de Python
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, dict):
+        return {key: _sanitize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sanitize(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class Broadcaster:
+    def __init__(self, queue_size=16):
+        """
+        Difunde cada lectura a todos los suscriptores SSE
+        :param queue_size: Eventos pendientes máximos por cliente
+        """
+        self.queue_size = queue_size
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.last_frame = None
+        self.event_id = 0
+        # Lecturas descartadas por no poder serializarse
+        self.dropped = 0
+
+    def put(self, reading):
+        """
+        Serializa la lectura una sola vez y la reparte sin bloquear. Una lectura que no
+        se puede serializar se descarta con un aviso: nunca interrumpe el tick
+        """
+        try:
+            data = json.dumps(_sanitize(reading), separators=(',', ':'), default=str, allow_nan=False)
+        except (TypeError, ValueError, RecursionError) as e:
+            self.dropped += 1
+            log.warning("Lectura no serializable, no se difunde: %s", e)
+            return
+        self.event_id += 1
+        frame = f"id: {self.event_id}\nevent: reading\ndata: {data}\n\n".encode()
+        self.last_frame = frame
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.push(frame)
+
+    def subscribe(self):
+        client = _Client(self.queue_size)
+        if self.last_frame is not None:
+            client.push(self.last_frame)
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def cleanup(self):
+        with self.lock:
+            clients = list(self.clients)
+            self.clients.clear()
+        for client in clients:
+            with client.cond:
+                client.cond.notify()
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    keepalive = 15.0
+
+    def do_GET(self):
+        broadcaster = self.server.broadcaster
+        if self.path == '/latest':
+            body = broadcaster.last_frame or b''
+            self.send_response(200 if body else 204)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != '/stream':
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        client = broadcaster.subscribe()
+        try:
+            while self.server.running:
+                frames = client.pop_all(self.keepalive)
+                # Comentario SSE para mantener viva la conexión
+                self.wfile.write(b''.join(frames) if frames else b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            broadcaster.unsubscribe(client)
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StreamServer:
+    def __init__(self, port=8502, host='0.0.0.0', queue_size=16):
+        """
+        Servidor Server-Sent Events con las lecturas en vivo
+        GET /stream  -> flujo de eventos 'reading'
+        GET /latest  -> última lectura
+        :param port: Puerto HTTP
+        :param host: Interfaz de escucha
+        :param queue_size: Eventos pendientes máximos por cliente
+        """
+        self.broadcaster = Broadcaster(queue_size)
+        self.server = ThreadingHTTPServer((host, port), _StreamHandler)
+        self.server.daemon_threads = True
+        self.server.broadcaster = self.broadcaster
+        self.server.running = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_port
+
+    def put(self, reading, rec=None):
+        self.broadcaster.put(reading)
+
+    def cleanup(self):
+        self.server.running = False
+        self.broadcaster.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def check_unserializable():
+    """
+    Difunde una lectura con inf anidado, una que no es JSON (clave no textual) y una
+    normal: la primera sale con null, la segunda se descarta sin excepción
+    :return: (eventos recibidos por un suscriptor, lecturas descartadas)
+    """
+    broadcaster = Broadcaster()
+    client = broadcaster.subscribe()
+    broadcaster.put({'timestamp': time.time(), 'rgb_values': [1.0, float('inf')]})
+    broadcaster.put({'timestamp': time.time(), 'rates': {('rain', 'wind'): 1}})
+    broadcaster.put({'timestamp': time.time(), 'temperature': 20.0})
+    frames = client.pop_all(0)
+    return [json.loads(frame.decode().split('data: ', 1)[1]) for frame in frames], broadcaster.dropped
+
+
+def main():
+    """
+    Función principal para pruebas con lecturas simuladas
+    """
+    events, dropped = check_unserializable()
+    ok = len(events) == 2 and events[0]['rgb_values'][1] is None and dropped == 1
+    print(f"Lecturas no serializables: {len(events)} difundidas, {dropped} descartada, "
+          f"{'correcto' if ok else 'INCORRECTO'}")
+    stream = StreamServer(port=8502)
+    print(f"Streaming en http://localhost:{stream.port}/stream")
+    try:
+        while True:
+            stream.put({
+                'timestamp': time.time(),
+                'temperature': 20.0,
+                'humidity': 50,
+                'wind_speed': 0,
+                'is_raining': False,
+            })
+            print(f"Clientes conectados: {len(stream.broadcaster.clients)}")
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+    finally:
+        stream.cleanup()
+        print("Programa finalizado")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,38 +7,37 @@ import signal
 import sys
 import logging
 
+import station_log
+import calibration
+
+log = logging.getLogger(__name__)
+
 class DHT11:
-    def __init__(self, pin, temp_offset=-2):
+    def __init__(self, pin, temp_offset=None):
         """
         Inicializa el sensor DHT11 (KY-015)
         :param pin: Pin GPIO para la señal de datos
-        :param temp_offset: Factor de calibración de temperatura
+        :param temp_offset: Factor de calibración de temperatura (None = el del perfil activo)
         """
         self.pin = pin
         self.last_reading = None
-        self.TEMP_OFFSET = temp_offset
-        
-        # Configurar logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        self.TEMP_OFFSET = calibration.active().temp_offset if temp_offset is None else temp_offset
         
         try:
             # En Raspberry Pi, usamos el número de pin directamente
             self.device = adafruit_dht.DHT11(getattr(board, f'D{pin}'))
-            logging.info(f"Sensor KY-015 inicializado en GPIO{pin}")
-            logging.info("Conexiones:")
-            logging.info(f"SEÑAL → GPIO{pin}")
-            logging.info("VCC   → 3.3V")
-            logging.info("GND   → GND")
+            log.info(f"Sensor KY-015 inicializado en GPIO{pin}")
+            log.info("Conexiones:")
+            log.info(f"SEÑAL → GPIO{pin}")
+            log.info("VCC   → 3.3V")
+            log.info("GND   → GND")
             
             # Tiempo de estabilización inicial
-            logging.info("Esperando 2 segundos para estabilizar el sensor...")
+            log.info("Esperando 2 segundos para estabilizar el sensor...")
             time.sleep(2)  # Reducido a 2 segundos, suficiente para DHT11
             
         except Exception as e:
-            logging.error(f"Error al inicializar sensor: {str(e)}")
+            log.error(f"Error al inicializar sensor: {str(e)}")
             sys.exit(1)
         
         # Registrar función de limpieza
@@ -47,7 +46,7 @@ class DHT11:
         signal.signal(signal.SIGINT, self.signal_handler)
     
     def signal_handler(self, signum, frame):
-        logging.info("Señal recibida. Limpiando recursos...")
+        log.info("Señal recibida. Limpiando recursos...")
         self.cleanup()
         sys.exit(0)
     
@@ -81,13 +80,13 @@ class DHT11:
                     return reading
                     
             except RuntimeError as error:
-                logging.warning(f"Intento {attempt + 1}/{retries} fallido: {error}")
+                log.warning("Intento %d/%d fallido: %s", attempt + 1, retries, error)
                 if attempt < retries - 1:
                     time.sleep(1)  # Espera 1 segundo entre intentos
                 continue
                 
             except Exception as error:
-                logging.error(f"Error inesperado: {error}")
+                log.error("Error inesperado: %s", error)
                 self.cleanup()
                 return {
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -107,7 +106,7 @@ class DHT11:
         """
         try:
             self.device.exit()
-            logging.info("Sensor liberado correctamente")
+            log.info("Sensor liberado correctamente")
         except:
             pass
 
@@ -115,6 +114,7 @@ def main():
     """
     Función principal para pruebas
     """
+    station_log.setup()
     dht11 = None
     try:
         # Puedes cambiar el pin y el offset de temperatura según necesites
@@ -129,18 +129,16 @@ def main():
             reading = dht11.get_reading()
             
             if reading['status'] == 'success':
-                print(f"{reading['timestamp']} |   {reading['temperature']:>5}°C |   {read
-ing['temperature_f']:>5}°F |    {reading['humidity']}%")
+                print(f"{reading['timestamp']} |   {reading['temperature']:>5}°C |   {reading['temperature_f']:>5}°F |    {reading['humidity']}%")
             else:
                 print(f"{reading['timestamp']} | Error: {reading['error_message']}")
             
-            time.sleep(3)  # Intervalo entre lecturas aumentado a 3 segundos para mayor es
-tabilidad
+            time.sleep(3)  # Intervalo entre lecturas aumentado a 3 segundos para mayor estabilidad
             
     except KeyboardInterrupt:
         print("\nPrograma interrumpido por el usuario")
     except Exception as e:
-        logging.error(f"Error inesperado: {str(e)}")
+        log.error(f"Error inesperado: {str(e)}")
     finally:
         if dht11:
             dht11.cleanup()
@@ -0,0 +1,265 @@
+import os
+import time
+import zlib
+import queue
+import threading
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import cbor2
+
+import record
+
+CONTENT_TYPE = 'application/cbor'
+CONTENT_ENCODING = 'deflate'
+SPOOL_SUFFIX = '.cbor.z'
+
+
+def encode_batch(station_id, records):
+    """
+    Codifica un lote de registros (ver record.py) en CBOR comprimido con zlib;
+    los registros viajan tal cual, sin re-serializar cada campo
+    """
+    payload = {'station_id': station_id, 'format': 'record-v1', 'records': record.encode(records)}
+    return zlib.compress(cbor2.dumps(payload), 6)
+
+
+def decode_batch(data):
+    """
+    Decodifica un lote generado por encode_batch; 'records' es un array de RECORD_DTYPE
+    """
+    batch = cbor2.loads(zlib.decompress(data))
+    batch['records'] = record.decode(batch['records'])
+    return batch
+
+
+class Spool:
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        """
+        Almacén en disco para lotes pendientes de envío
+        :param path: Directorio donde se guardan los lotes
+        :param max_bytes: Tamaño máximo del spool; se descartan los lotes más antiguos
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+        existing = self._files()
+        self.seq = int(existing[-1][:-len(SPOOL_SUFFIX)]) + 1 if existing else 0
+        self.size = sum(os.path.getsize(os.path.join(self.path, f)) for f in existing)
+
+    def _files(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith(SPOOL_SUFFIX))
+
+    def push(self, data):
+        """
+        Guarda un lote de forma atómica y aplica el límite de tamaño
+        """
+        name = f"{self.seq:012d}{SPOOL_SUFFIX}"
+        self.seq += 1
+        tmp = os.path.join(self.path, name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.path, name))
+        self.size += len(data)
+
+        # Descartar los lotes más antiguos si se supera el límite
+        files = self._files()
+        while self.size > self.max_bytes and len(files) > 1:
+            self.remove(files.pop(0))
+
+    def peek(self):
+        """
+        Devuelve (nombre, datos) del lote más antiguo o None si está vacío
+        """
+        files = self._files()
+        if not files:
+            return None
+        with open(os.path.join(self.path, files[0]), 'rb') as f:
+            return files[0], f.read()
+
+    def remove(self, name):
+        path = os.path.join(self.path, name)
+        try:
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._files())
+
+
+class Uplink:
+    def __init__(self, url, station_id, spool_dir='spool', batch_size=60,
+                 flush_interval=60.0, max_spool_bytes=50 * 1024 * 1024,
+                 drain_rate=2.0, timeout=5.0, queue_size=10000):
+        """
+        Envío por lotes de lecturas a un colector central (store-and-forward)
+        :param url: URL del colector que recibe los lotes por POST
+        :param station_id: Identificador de esta estación
+        :param spool_dir: Directorio del spool local para trabajar sin conexión
+        :param batch_size: Lecturas por lote
+        :param flush_interval: Segundos máximos que espera un lote incompleto
+        :param max_spool_bytes: Tamaño máximo del spool en disco
+        :param drain_rate: Lotes por segundo al vaciar el spool tras reconectar
+        :param timeout: Timeout de cada POST en segundos
+        :param queue_size: Capacidad de la cola en memoria
+        """
+        self.url = url
+        self.station_id = station_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drain_interval = 1.0 / drain_rate
+        self.timeout = timeout
+        self.spool = Spool(spool_dir, max_spool_bytes)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {'sent': 0, 'spooled': 0, 'drained': 0, 'dropped': 0, 'errors': 0}
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, reading, rec=None):
+        """
+        Encola el registro de una lectura sin bloquear nunca al llamador
+        """
+        if rec is None:
+            rec = record.from_reading(reading)
+        try:
+            self.queue.put_nowait(rec)
+        except queue.Full:
+            # Descartar la lectura más antigua para dejar sitio
+            try:
+                self.queue.get_nowait()
+                self.stats['dropped'] += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(rec)
+            except queue.Full:
+                self.stats['dropped'] += 1
+
+    def _post(self, data):
+        request = urllib.request.Request(
+            self.url, data=data, method='POST',
+            headers={'Content-Type': CONTENT_TYPE,
+                     'Content-Encoding': CONTENT_ENCODING,
+                     'X-Station-Id': str(self.station_id)})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return 200 <= response.status < 300
+        except (urllib.error.URLError, OSError):
+            self.stats['errors'] += 1
+            return False
+
+    def _send(self, batch):
+        data = encode_batch(self.station_id, batch)
+        # Mantener el orden: si hay pendientes en el spool, el lote nuevo va detrás
+        if len(self.spool) == 0 and self._post(data):
+            self.stats['sent'] += 1
+        else:
+            self.spool.push(data)
+            self.stats['spooled'] += 1
+
+    def _drain(self):
+        """
+        Envía un lote del spool; devuelve True si se envió
+        """
+        item = self.spool.peek()
+        if item is None:
+            return False
+        name, data = item
+        if self._post(data):
+            self.spool.remove(name)
+            self.stats['drained'] += 1
+            return True
+        return False
+
+    def _run(self):
+        batch = []
+        batch_start = time.monotonic()
+        last_drain = 0.0
+
+        while self.running:
+            try:
+                batch.append(self.queue.get(timeout=0.2))
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if batch and (len(batch) >= self.batch_size or now - batch_start >= self.flush_interval):
+                self._send(batch)
+                batch = []
+            if not batch:
+                batch_start = now
+
+            # Vaciar el spool a ritmo controlado
+            if now - last_drain >= self.drain_interval:
+                last_drain = now
+                self._drain()
+
+        # Vaciar la cola y guardar lo pendiente en el spool
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.spool.push(encode_batch(self.station_id, batch))
+            self.stats['spooled'] += 1
+
+    def cleanup(self):
+        self.running = False
+        self.thread.join(timeout=self.timeout + 1)
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    """
+    Colector local de prueba que imprime los lotes recibidos
+    """
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        batch = decode_batch(self.rfile.read(length))
+        print(f"Lote de {batch['station_id']}: {len(batch['records'])} lecturas")
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    """
+    Función principal para pruebas contra un colector local
+    """
+    server = HTTPServer(('127.0.0.1', 0), _CollectorHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ingest"
+    print(f"Colector de prueba en {url}")
+
+    uplink = Uplink(url, station_id='prueba', spool_dir='spool_prueba',
+                    batch_size=10, flush_interval=2)
+    try:
+        while True:
+            uplink.put({
+                'timestamp': time.time(),
+                'temperature': 20.0,
+                'humidity': 50,
+                'wind_speed': 0,
+                'is_raining': False,
+            })
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        print("\nPrograma interrumpido por el usuario")
+    finally:
+        uplink.cleanup()
+        server.shutdown()
+        print(f"Estadísticas: {uplink.stats}")
+        print("Programa finalizado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import random
+import threading
+import multiprocessing as mp
+from collections import deque
+
+import numpy as np
+
+import calibration
+from main import Anemometer
+
+# Memoria compartida: [flancos contados, última lectura del pin ns, secuencia] + anillo de instantes
+HEADER = 3
+COUNT, POLLED, SEQUENCE = range(HEADER)
+RING = 4096
+# Margen del anillo que no se lee por si el proceso de adquisición lo está sobrescribiendo
+RING_MARGIN = 64
+# Lecturas que se reintentan si el escritor publica un flanco a mitad de la copia
+READ_RETRIES = 8
+
+
+class GpioPin:
+    """
+    Pin real del anemómetro; se abre dentro del proceso de adquisición
+    """
+    def __init__(self, pin):
+        self.pin = pin
+
+    def open(self):
+        import lgpio
+        self.lgpio = lgpio
+        self.h = lgpio.gpiochip_open(0)
+        lgpio.gpio_claim_input(self.h, self.pin, lgpio.SET_PULL_UP)
+
+    def read(self):
+        return self.lgpio.gpio_read(self.h, self.pin)
+
+    def close(self):
+        self.lgpio.gpio_free(self.h, self.pin)
+        self.lgpio.gpiochip_close(self.h)
+
+
+class SimulatedPin:
+    """
+    Pin simulado que conmuta como un anemómetro a velocidad constante
+    """
+    def __init__(self, kmh):
+        self.edge_ns = 1e9 / float(calibration.active().invert('wind_speed', kmh))
+
+    def open(self):
+        pass
+
+    def read(self):
+        return int(time.monotonic_ns() // self.edge_ns) & 1
+
+    def close(self):
+        pass
+
+
+def _pin_to(cpu):
+    # Núcleo dedicado y, si hay permisos, prioridad de tiempo real
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu})
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+    except (AttributeError, PermissionError, OSError):
+        pass
+
+
+def _acquire(shared, source, cpu, stop, poll_s):
+    """
+    Proceso de adquisición: sondea el pin y publica el instante de cada flanco.
+    Único escritor con seqlock: la secuencia es impar mientras se escriben el
+    instante y el contador y par al terminar (ver ProcessAnemometer._snapshot)
+    """
+    _pin_to(cpu)
+    counters = np.frombuffer(shared, np.int64)
+    ring = counters[HEADER:]
+    source.open()
+    try:
+        last_state = source.read()
+        count = 0
+        while not stop.is_set():
+            state = source.read()
+            now = time.monotonic_ns()
+            if state != last_state:
+                counters[SEQUENCE] += 1
+                ring[count % RING] = now
+                count += 1
+                counters[COUNT] = count
+                counters[SEQUENCE] += 1
+                last_state = state
+            counters[POLLED] = now
+            time.sleep(poll_s)
+    finally:
+        source.close()
+
+
+class ProcessAnemometer(Anemometer):
+    def __init__(self, pin=17, recorder=None, cpu=None, source=None, poll_s=0.001):
+        """
+        Anemómetro cuyo conteo de flancos corre en un proceso aparte, fuera del GIL
+        del proceso principal, y publica los instantes en memoria compartida
+        :param pin: Pin GPIO del anemómetro
+        :param recorder: TraceWriter para grabar los flancos (se graban al leer)
+        :param cpu: Núcleo al que fijar el proceso; por defecto, el último
+        :param source: Origen de la señal (GpioPin o SimulatedPin); por defecto, el pin real
+        :param poll_s: Periodo de sondeo del pin
+        """
+        self.pin = pin
+        self.recorder = recorder
+        self.shared = mp.RawArray('q', HEADER + RING)
+        self.counters = np.frombuffer(self.shared, np.int64)
+        self.ring = self.counters[HEADER:]
+        self.recorded = 0
+        self.torn_reads = 0
+        self.stop = mp.Event()
+        if cpu is None and os.cpu_count() > 1:
+            cpu = os.cpu_count() - 1
+        self.process = mp.Process(
+            target=_acquire, args=(self.shared, source or GpioPin(pin), cpu, self.stop, poll_s))
+        self.process.daemon = True
+        self.process.start()
+
+    @property
+    def wind_count(self):
+        return int(self.counters[COUNT])
+
+    def _window(self, count):
+        # Instantes publicados en orden, sin la zona que se puede estar sobrescribiendo
+        n = min(count, RING - RING_MARGIN)
+        return self.ring[np.arange(count - n, count) % RING]
+
+    def _snapshot(self):
+        """
+        Contador y copia coherente de los instantes publicados (lado lector del seqlock).
+        Python no da barreras de memoria explícitas, así que además de comprobar que
+        la secuencia no cambió durante la copia se valida el resultado: los instantes
+        deben ser crecientes. Si tras READ_RETRIES intentos no lo son, se descarta todo
+        lo anterior al último salto hacia atrás.
+        :return: (contador, instantes)
+        """
+        for _ in range(READ_RETRIES):
+            before = int(self.counters[SEQUENCE])
+            if before & 1:
+                continue
+            count = self.wind_count
+            edges = self._window(count)
+            if int(self.counters[SEQUENCE]) == before and (np.diff(edges) >= 0).all():
+                return count, edges
+        self.torn_reads += 1
+        count = self.wind_count
+        edges = self._window(count)
+        backwards = np.flatnonzero(np.diff(edges) < 0)
+        if len(backwards):
+            edges = edges[backwards[-1] + 1:]
+        return count, edges
+
+    def get_reading(self, mono_ns=None):
+        """
+        Velocidad en la ventana de 1 s que termina en `mono_ns` (por defecto, ahora)
+        """
+        now = mono_ns if mono_ns is not None else time.monotonic_ns()
+        count, edges = self._snapshot()
+        changes = int(np.searchsorted(edges, now, 'right') -
+                      np.searchsorted(edges, now - self.WINDOW_NS, 'right'))
+        if self.recorder:
+            first = count - len(edges)
+            for i in range(max(self.recorded, first), count):
+                self.recorder.edge(int(edges[i - first]), i & 1)
+            self.recorded = count
+            self.recorder.wind(now, count)
+        speed = self.speed_kmh(changes)
+        return {
+            'wind_speed': speed,
+            'wind_speed_ms': round(speed / 3.6, 2),
+            'wind_edges': self.edges_per_s(changes)
+        }
+
+    def alive(self):
+        """
+        Si el proceso de adquisición sigue sondeando el pin
+        """
+        return self.process.is_alive() and time.monotonic_ns() - int(self.counters[POLLED]) < 1_000_000_000
+
+    def cleanup(self):
+        self.stop.set()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ThreadAnemometer(Anemometer):
+    """
+    El anemómetro de siempre (hilo en el proceso principal) sobre un pin simulado
+    """
+    def __init__(self, source):
+        self.recorder = None
+        self.source = source
+        self.wind_count = 0
+        self.edges = deque(maxlen=10000)
+        self.lock = threading.Lock()
+        self.running = True
+        self.last_state = source.read()
+        self.monitor_thread = threading.Thread(target=self._monitor_rotation)
+        self.monitor_thread.daemon = True
+        self.monitor_thread.start()
+
+    def read_pin(self):
+        return self.source.read()
+
+    def cleanup(self):
+        self.running = False
+
+
+def _load(stop):
+    # Carga que retiene el GIL durante tramos largos, como una agregación con pandas
+    rng = random.Random(0)
+    data = [rng.random() for _ in range(300_000)]
+    while not stop.is_set():
+        sorted(data)
+
+
+def _measure(anemometer, seconds):
+    speeds = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        speeds.append(anemometer.get_reading()['wind_speed'])
+    return speeds
+
+
+def check_ring(seconds=2.0, kmh=5000.0):
+    """
+    Prueba de concurrencia del anillo: el proceso de adquisición publica flancos sin
+    pausa mientras se copian sin parar; toda copia aceptada debe ser creciente y no
+    adelantarse al contador
+    :return: (copias, copias incoherentes, lecturas que agotaron los reintentos)
+    """
+    anemometer = ProcessAnemometer(source=SimulatedPin(kmh), poll_s=0)
+    reads = bad = 0
+    try:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            count, edges = anemometer._snapshot()
+            reads += 1
+            if len(edges) and ((np.diff(edges) < 0).any() or count > anemometer.wind_count):
+                bad += 1
+    finally:
+        anemometer.cleanup()
+    return reads, bad, anemometer.torn_reads
+
+
+def main():
+    """
+    Benchmark: error de la velocidad medida con el proceso principal cargado
+    Uso: python wind_process.py [km/h] [hilos_de_carga] [segundos]
+    """
+    kmh = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    n_load = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    reads, bad, torn = check_ring()
+    print(f"Anillo: {reads} copias concurrentes, {bad} incoherentes, {torn} tras agotar reintentos")
+    source = SimulatedPin(kmh)
+    print(f"Viento simulado: {kmh} km/h; carga: {n_load} hilos")
+
+    for name, factory in (('hilo', lambda: ThreadAnemometer(source)),
+                          ('proceso', lambda: ProcessAnemometer(source=source))):
+        for loaded in (False, True):
+            anemometer = factory()
+            stop = threading.Event()
+            loaders = [threading.Thread(target=_load, args=(stop,), daemon=True)
+                       for _ in range(n_load if loaded else 0)]
+            for loader in loaders:
+                loader.start()
+            try:
+                time.sleep(1.5)  # llenar la ventana
+                speeds = np.array(_measure(anemometer, seconds))
+            finally:
+                stop.set()
+                for loader in loaders:
+                    loader.join()
+                anemometer.cleanup()
+            error = np.abs(speeds - kmh)
+            print(f"{name:<8} {'con carga' if loaded else 'sin carga':<10} "
+                  f"media {speeds.mean():6.2f} km/h, error medio {error.mean():5.2f}, "
+                  f"máximo {error.max():5.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,12 @@ from datetime import datetime
 import signal
 import sys
 import math
+import logging
+
+import station_log
+import calibration
+
+log = logging.getLogger(__name__)
 
 class Anemometer:
     def __init__(self, pin):
@@ -12,9 +18,10 @@ class Anemometer:
         Inicializa el anemómetro para Raspberry Pi 5
         :param pin: Pin GPIO al que está conectado el anemómetro
         """
-        # Configuración física del anemómetro
-        self.RADIO_METROS = 0.09  # 12 cm en metros
-        self.CAMBIOS_POR_VUELTA = 6  # 2 cambios × 3 copas
+        # Configuración física del anemómetro (perfil de calibración activo)
+        profile = calibration.active()
+        self.RADIO_METROS = profile.radius_m
+        self.CAMBIOS_POR_VUELTA = profile.edges_per_rev  # 2 cambios × 3 copas
         
         # Variables de estado
         self.pin = pin
@@ -81,13 +88,9 @@ class Anemometer:
             # Convertir a km/h
             self.wind_speed = velocidad_ms * 3.6
             
-            # Debug info
-            print(f"\nDatos de medición:")
-            print(f"Cambios detectados: {self.wind_count}")
-            print(f"Vueltas completas: {vueltas:.2f}")
-            print(f"Tiempo: {time_diff:.2f} s")
-            print(f"Velocidad angular: {omega:.2f} rad/s")
-            print(f"Velocidad: {velocidad_ms:.2f} m/s = {self.wind_speed:.2f} km/h")
+            # Debug info (una línea, formateada solo si el debug está activo)
+            log.debug("Cambios: %d | Vueltas: %.2f | Tiempo: %.2f s | ω: %.2f rad/s | %.2f m/s = %.2f km/h",
+                      self.wind_count, vueltas, time_diff, omega, velocidad_ms, self.wind_speed)
         
         self.wind_count = 0
         self.last_time = current_time
@@ -126,6 +129,8 @@ class Anemometer:
             pass
 
 def main():
+    # Aquí sí interesa ver el detalle de cada cálculo
+    station_log.setup(debug=True)
     anemometer = None
     try:
         anemometer = Anemometer(pin=17)